@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import datetime
+import statistics
+import subprocess
+from pathlib import Path
+
+from ETL import get_conn, STAGING, COMPRESSED_EXTS, BINARY_EXT
+
+
+# Базовая директория проекта (папка, где лежит этот скрипт)
+BASE_DIR = Path(__file__).resolve().parent
+
+# Масштабы данных (scale factor) через запятую: SF1 — объёмы генератора по умолчанию, SF10 — в 10 раз больше
+SCALES = [float(x) for x in os.getenv("BENCH_SCALES", "1,10,50").split(",") if x.strip()]
+
+# Папка бенчмарка: данные каждого масштаба (sf1/, sf10/, ...) и результаты (results.jsonl, results.md)
+BENCH_DIR = Path(os.getenv("BENCH_DIR", BASE_DIR / "bench"))
+
+# BENCH_REGEN=1 — генерировать данные заново, даже если папка масштаба уже есть
+# (иначе время генерации берётся из предыдущего запуска)
+REGEN = os.getenv("BENCH_REGEN", "0") == "1"
+
+# Сколько раз выполнять каждый BI-запрос (в результат идёт медиана, первый прогон прогревает кэш)
+REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+
+# BI-запросы: три представления из Bi_views.sql, основной отчёт ARPU из README и тот же срез из куба mart_revenue_cube
+# (в кубе неизвестный тариф — 'UNKNOWN', а не NULL, и arpu округлён до 4 знаков, как в v_kpi_monthly)
+QUERIES = {
+    "v_kpi_monthly": "SELECT * FROM v_kpi_monthly;",
+    "v_churn_monthly": "SELECT * FROM v_churn_monthly;",
+    "v_network_daily": "SELECT * FROM v_network_daily;",
+    "arpu_report": """
+      SELECT
+          d.year,
+          d.month,
+          t.tariff_name,
+          s.segment,
+          SUM(u.revenue_amount)                         AS revenue_total,
+          COUNT(DISTINCT u.subscriber_key)              AS active_subscribers,
+          ROUND(SUM(u.revenue_amount) / NULLIF(COUNT(DISTINCT u.subscriber_key), 0), 2) AS arpu
+      FROM fact_usage u
+      JOIN dim_date d        ON d.date_key = u.date_key
+      JOIN dim_subscriber s  ON s.subscriber_key = u.subscriber_key
+      LEFT JOIN dim_tariff t ON t.tariff_key = u.tariff_key
+      WHERE (d.year BETWEEN 2024 AND 2026)
+      GROUP BY d.year, d.month, t.tariff_name, s.segment
+      ORDER BY d.year, d.month, t.tariff_name, s.segment;
+    """,
+    "arpu_cube": """
+      SELECT year, month, tariff_name, segment, total_revenue, active_subscribers, arpu
+      FROM mart_revenue_cube
+      WHERE grouping_id = 3 AND year BETWEEN 2024 AND 2026
+      ORDER BY year, month, tariff_name, segment;
+    """,
+}
+
+
+def scale_name(scale: float) -> str:
+    # SF1, SF10, SF0.1 ...
+    return f"SF{scale:g}"
+
+
+def run_script(script: str, env: dict, log_path: Path) -> float:
+    # Запускаем скрипт проекта отдельным процессом (чистое состояние random/памяти), вывод — в лог.
+    # Возвращаем время выполнения в секундах
+    t0 = time.monotonic()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run(
+            [sys.executable, str(BASE_DIR / script)],
+            env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT, cwd=BASE_DIR,
+        )
+    elapsed = time.monotonic() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"{script} завершился с кодом {proc.returncode}, см. {log_path}")
+    return elapsed
+
+
+def input_files(data_dir: Path) -> list[Path]:
+    # Входные файлы ETL в папке масштаба — по тем же правилам, что и ETL.source_files: usage.csv, шарды
+    # usage_000.csv, формат PGCOPY, сжатые файлы (.gz/.zst/.bz2) и помесячные файлы usage/2025-04.csv
+    # (GEN_PARTITION=month). profiles.csv генератора, rejects/ и отчёты ETL не считаются
+    stems = {Path(filename).stem for _, filename, _ in STAGING}
+    files = []
+    for path in data_dir.rglob("*"):
+        name = path.name
+        for ext in COMPRESSED_EXTS:
+            name = name.removesuffix(ext)
+        if not path.is_file() or not name.endswith((".csv", BINARY_EXT)):
+            continue
+        stem = name.rsplit(".", 1)[0]
+        if path.parent == data_dir:
+            if stem in stems or any(stem.startswith(s + "_") for s in stems):
+                files.append(path)
+        elif path.parent.parent == data_dir and path.parent.name in stems:
+            files.append(path)
+    return files
+
+
+def generate(scale: float, data_dir: Path) -> dict:
+    # Генерируем CSV для масштаба; уже сгенерированные данные переиспользуются (кроме BENCH_REGEN=1)
+    info_path = data_dir / "generate.json"
+    if info_path.exists() and not REGEN:
+        return json.loads(info_path.read_text(encoding="utf-8"))
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    gen_sec = run_script(
+        "Generate_test_data.py",
+        {"GEN_SCALE": str(scale), "GEN_OUT_DIR": str(data_dir)},
+        data_dir / "generate.log",
+    )
+    info = {
+        "generate_sec": round(gen_sec, 3),
+        # Размер входных файлов ETL: CSV или PGCOPY (GEN_FORMAT=binary), в том числе сжатых и помесячных
+        "data_mb": round(sum(p.stat().st_size for p in input_files(data_dir)) / 1024 / 1024, 1),
+    }
+    info_path.write_text(json.dumps(info), encoding="utf-8")
+    return info
+
+
+def stage_key(stage: dict) -> str:
+    # Имя этапа для таблицы результатов: "copy tmp_usage", "fact fact_usage", "load_dims" ...
+    # Куски одного файла и месяцы одного факта суммируются под одним именем
+    return f"{stage['stage']} {stage['table']}" if "table" in stage else stage["stage"]
+
+
+def run_etl(data_dir: Path) -> dict:
+    # Полная загрузка данных масштаба в PostgreSQL; время этапов берём из отчёта ETL о запуске.
+    # Остальные настройки ETL (ETL_WORKERS, ETL_BULK, ...) наследуются из окружения
+    report_path = data_dir / "etl_report.jsonl"
+    report_path.unlink(missing_ok=True)
+    etl_sec = run_script(
+        "ETL.py",
+        {"ETL_CSV_DIR": str(data_dir), "ETL_MODE": "full", "ETL_REPORT": str(report_path)},
+        data_dir / "etl.log",
+    )
+    with open(report_path, encoding="utf-8") as f:
+        report = json.loads(f.readlines()[-1])
+
+    stages, fact_rows = {}, {}
+    for stage in report["stages"]:
+        key = stage_key(stage)
+        stages[key] = stages.get(key, 0) + stage["wall_sec"]
+        if stage["stage"] == "fact":
+            fact_rows[stage["table"]] = fact_rows.get(stage["table"], 0) + stage["rows"]
+    return {
+        "etl_sec": round(etl_sec, 3),
+        "fact_rows": fact_rows,
+        "settings": {k: report[k] for k in ("workers", "usage_path", "bulk")},
+        "stages": {k: round(v, 3) for k, v in stages.items()},
+    }
+
+
+def time_queries() -> dict:
+    # Время BI-запросов: медиана по REPEATS прогонам (с передачей всех строк клиенту)
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            results = {}
+            for name, query in QUERIES.items():
+                timings = []
+                for _ in range(REPEATS):
+                    t0 = time.monotonic()
+                    cur.execute(query)
+                    rows = len(cur.fetchall())
+                    timings.append(time.monotonic() - t0)
+                results[name] = {"median_sec": round(statistics.median(timings), 4),
+                                 "min_sec": round(min(timings), 4), "rows": rows}
+            conn.rollback()
+            return results
+    finally:
+        conn.close()
+
+
+def write_table(runs: list[dict], path: Path):
+    # Сводная таблица Markdown: строки — метрики, колонки — масштабы (секунды)
+    names = [r["scale_name"] for r in runs]
+    metrics = [("generate", lambda r: r["generate_sec"]), ("etl total", lambda r: r["etl_sec"])]
+    stage_names = list(dict.fromkeys(k for r in runs for k in r["stages"]))
+    metrics += [(f"etl: {k}", lambda r, k=k: r["stages"].get(k)) for k in stage_names]
+    metrics += [(f"bi: {k}", lambda r, k=k: r["queries"][k]["median_sec"]) for k in QUERIES]
+
+    lines = [
+        "| метрика, с | " + " | ".join(names) + " |",
+        "|---|" + "---:|" * len(names),
+        "| объём данных, МБ | " + " | ".join(str(r["data_mb"]) for r in runs) + " |",
+        "| строк fact_usage | " + " | ".join(str(r["fact_rows"].get("fact_usage")) for r in runs) + " |",
+    ]
+    for title, get in metrics:
+        lines.append(f"| {title} | " + " | ".join("" if get(r) is None else f"{get(r):g}" for r in runs) + " |")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    print("\n".join(lines))
+
+
+def main():
+    # Для каждого масштаба: генерация -> полная загрузка ETL -> замеры BI-запросов
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    started_at = datetime.datetime.now().isoformat(timespec="seconds")
+    runs = []
+    for scale in SCALES:
+        name = scale_name(scale)
+        data_dir = BENCH_DIR / name.lower()
+        print(f"{name}: генерация данных...")
+        run = {"started_at": started_at, "scale": scale, "scale_name": name, **generate(scale, data_dir)}
+        print(f"{name}: загрузка ETL...")
+        run.update(run_etl(data_dir))
+        print(f"{name}: BI-запросы...")
+        run["queries"] = time_queries()
+        runs.append(run)
+
+        # Каждый масштаб сохраняем сразу: большие масштабы идут долго
+        with open(BENCH_DIR / "results.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(run, ensure_ascii=False) + "\n")
+
+    write_table(runs, BENCH_DIR / "results.md")
+    print(f"\nРезультаты: {BENCH_DIR / 'results.md'} (все запуски — {BENCH_DIR / 'results.jsonl'})")
+
+
+if __name__ == "__main__":
+    # Точка входа при запуске скрипта напрямую
+    main()
@@ -0,0 +1,62 @@
+CREATE TABLE IF NOT EXISTS mart_kpi_monthly (
+  year SMALLINT NOT NULL,
+  month SMALLINT NOT NULL,
+  tariff_name VARCHAR(200) NOT NULL,
+  segment VARCHAR(50) NOT NULL,
+  active_subscribers BIGINT NOT NULL,
+  total_revenue NUMERIC NOT NULL,
+  arpu NUMERIC NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS mart_churn_monthly (
+  year INTEGER NOT NULL,
+  month INTEGER NOT NULL,
+  base_subscribers BIGINT NOT NULL,
+  churned_subscribers BIGINT NOT NULL,
+  churn_rate_pct NUMERIC NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS mart_network_daily (
+  date DATE NOT NULL,
+  technology VARCHAR(10),
+  region VARCHAR(100),
+  traffic_mb NUMERIC,
+  avg_success_ratio NUMERIC,
+  avg_drop_ratio NUMERIC
+);
+
+-- Активность абонента за месяц: выручка и число событий по (абонент, тариф, услуга).
+-- Основа для точных COUNT(DISTINCT subscriber_key) на любом срезе куба без скана fact_usage
+CREATE TABLE IF NOT EXISTS mart_subscriber_month (
+  month_start DATE NOT NULL,
+  subscriber_key INTEGER NOT NULL,
+  tariff_key INTEGER,
+  service_key INTEGER NOT NULL,
+  events BIGINT NOT NULL,
+  revenue NUMERIC NOT NULL
+);
+
+-- Куб выручки/ARPU: GROUPING SETS по (год | год+месяц) x (всё | тариф+сегмент | тариф | сегмент | регион | услуга).
+-- NULL в колонке среза — "по всем значениям" (неизвестные значения — 'UNKNOWN', как в v_kpi_monthly),
+-- grouping_id — битовая маска GROUPING(month, tariff_name, segment, region, service_name)
+CREATE TABLE IF NOT EXISTS mart_revenue_cube (
+  grouping_id INTEGER NOT NULL,
+  year SMALLINT NOT NULL,
+  month SMALLINT,
+  tariff_name VARCHAR(200),
+  segment VARCHAR(50),
+  region VARCHAR(100),
+  service_name VARCHAR(200),
+  active_subscribers BIGINT NOT NULL,
+  total_revenue NUMERIC NOT NULL,
+  arpu NUMERIC NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mart_kpi_monthly ON mart_kpi_monthly (year, month, tariff_name, segment);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mart_churn_monthly ON mart_churn_monthly (year, month);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mart_network_daily ON mart_network_daily (date, COALESCE(technology, ''), COALESCE(region, ''));
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mart_subscriber_month
+  ON mart_subscriber_month (month_start, subscriber_key, COALESCE(tariff_key, 0), service_key);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mart_revenue_cube
+  ON mart_revenue_cube (grouping_id, year, COALESCE(month, 0), COALESCE(tariff_name, ''), COALESCE(segment, ''),
+                        COALESCE(region, ''), COALESCE(service_name, ''));
@@ -0,0 +1,222 @@
+import os
+import time
+import threading
+from collections import Counter, OrderedDict
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+
+from ETL import conn_params
+
+
+# Размер пула соединений с PostgreSQL. Соединения открываются сразу и держатся всё время работы сервиса:
+# подготовленные запросы (PREPARE) живут в сессии соединения
+POOL_SIZE = int(os.getenv("BI_POOL_SIZE", "4"))
+
+# Ограничение кэша результатов: суммарное число строк во всех закэшированных ответах.
+# При превышении вытесняются давно не запрашивавшиеся ответы (LRU); ответ больше лимита не кэшируется
+CACHE_MAX_ROWS = int(os.getenv("BI_CACHE_MAX_ROWS", "200000"))
+
+# Как часто (в секундах) сверять версию загрузки etl_load_version с базой. Между проверками
+# повторный запрос отдаётся из памяти без обращения к PostgreSQL
+VERSION_CHECK_SEC = float(os.getenv("BI_VERSION_CHECK_SEC", "1"))
+
+# Фильтры запросов и их типы в PostgreSQL (значение None — фильтр не применяется)
+FILTER_TYPES = {"year_from": "int", "year_to": "int", "tariff": "text", "segment": "text", "region": "text"}
+
+# Запросы дашбордов: допустимые фильтры (в порядке параметров $1, $2, ...) и текст запроса.
+# KPI, churn и сеть читаются из материализованных копий представлений Bi_views.sql (mart_*),
+# основной отчёт ARPU из README — из mart_subscriber_month (те же числа, что по fact_usage, без скана фактов)
+QUERIES = {
+    "kpi_monthly": (("year_from", "year_to", "tariff", "segment"), """
+      SELECT year, month, tariff_name, segment, active_subscribers, total_revenue, arpu
+      FROM mart_kpi_monthly
+      WHERE year >= COALESCE($1, year) AND year <= COALESCE($2, year)
+        AND ($3 IS NULL OR tariff_name = $3)
+        AND ($4 IS NULL OR segment = $4)
+      ORDER BY year, month, tariff_name, segment
+    """),
+    "churn_monthly": (("year_from", "year_to"), """
+      SELECT year, month, base_subscribers, churned_subscribers, churn_rate_pct
+      FROM mart_churn_monthly
+      WHERE year >= COALESCE($1, year) AND year <= COALESCE($2, year)
+      ORDER BY year, month
+    """),
+    "network_daily": (("year_from", "year_to", "region"), """
+      SELECT date, technology, region, traffic_mb, avg_success_ratio, avg_drop_ratio
+      FROM mart_network_daily
+      WHERE date >= make_date(COALESCE($1, 1), 1, 1) AND date < make_date(COALESCE($2, 9998) + 1, 1, 1)
+        AND ($3 IS NULL OR region = $3)
+      ORDER BY date, technology, region
+    """),
+    "arpu_report": (("year_from", "year_to", "tariff", "segment", "region"), """
+      SELECT
+          EXTRACT(YEAR FROM x.month_start)::int  AS year,
+          EXTRACT(MONTH FROM x.month_start)::int AS month,
+          x.tariff_name,
+          x.segment,
+          SUM(x.revenue) AS revenue_total,
+          COUNT(*)       AS active_subscribers,
+          ROUND(SUM(x.revenue) / NULLIF(COUNT(*), 0), 2) AS arpu
+      FROM (
+        -- Сначала выручка абонента в группе: COUNT(*) снаружи = COUNT(DISTINCT subscriber_key) отчёта,
+        -- но считается хэш-агрегацией без сортировки всех строк активности
+        SELECT a.month_start, t.tariff_name, s.segment, a.subscriber_key, SUM(a.revenue) AS revenue
+        FROM mart_subscriber_month a
+        JOIN dim_subscriber s  ON s.subscriber_key = a.subscriber_key
+        LEFT JOIN dim_tariff t ON t.tariff_key = a.tariff_key
+        LEFT JOIN dim_geo g    ON g.geo_key = s.geo_key
+        WHERE a.month_start >= make_date(COALESCE($1, 1), 1, 1)
+          AND a.month_start < make_date(COALESCE($2, 9998) + 1, 1, 1)
+          AND ($3 IS NULL OR t.tariff_name = $3)
+          AND ($4 IS NULL OR s.segment = $4)
+          AND ($5 IS NULL OR g.region = $5)
+        GROUP BY a.month_start, t.tariff_name, s.segment, a.subscriber_key
+      ) x
+      GROUP BY x.month_start, x.tariff_name, x.segment
+      ORDER BY 1, 2, x.tariff_name, x.segment
+    """),
+}
+
+
+class BiService:
+    # Сервис BI-запросов для дашбордов: пул соединений, подготовленные запросы и LRU-кэш результатов.
+    # Ключ кэша — (запрос, значения фильтров); кэш целиком сбрасывается, когда ETL увеличивает версию загрузки.
+    # Методы можно вызывать из нескольких потоков
+    def __init__(self, pool_size: int = POOL_SIZE, cache_max_rows: int = CACHE_MAX_ROWS,
+                 version_check_sec: float = VERSION_CHECK_SEC):
+        self.pool = ThreadedConnectionPool(pool_size, pool_size, **conn_params())
+        # ThreadedConnectionPool не ждёт свободного соединения, а падает: лишние потоки ждут на семафоре
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.prepared = set()  # id соединений, в которых уже выполнены PREPARE
+        self.cache_max_rows = cache_max_rows
+        self.version_check_sec = version_check_sec
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # (запрос, фильтры) -> (колонки, строки); в конце — недавно запрошенные
+        self.cache_rows = 0
+        self.version = None
+        self.version_checked = None  # time.monotonic() последней сверки версии
+        self.stats = Counter()
+
+    def close(self):
+        self.pool.closeall()
+
+    def run(self, job):
+        # Выполняем job(cur) на соединении из пула. Новое соединение переводим в autocommit (только чтение,
+        # без висящих транзакций) и готовим в нём все запросы. Разорванное соединение пул закрывает.
+        # plan_cache_mode = force_custom_plan: после пяти выполнений PostgreSQL может перейти на общий план,
+        # а с необязательными фильтрами ($n IS NULL OR ...) он не знает, какие фильтры заданы, и ошибается
+        # на порядки (на SF1 отчёт ARPU — 94 с вместо 0,7 с). Разбор запроса по-прежнему делается один раз
+        with self.slots:
+            conn = self.pool.getconn()
+            broken = False
+            try:
+                with conn.cursor() as cur:
+                    if id(conn) not in self.prepared:
+                        conn.autocommit = True
+                        cur.execute("SET plan_cache_mode = force_custom_plan;")
+                        for name, (filters, query) in QUERIES.items():
+                            cur.execute(sql.SQL("PREPARE {} ({}) AS {}").format(
+                                sql.Identifier(name),
+                                sql.SQL(", ").join(sql.SQL(FILTER_TYPES[f]) for f in filters),
+                                sql.SQL(query),
+                            ))
+                        self.prepared.add(id(conn))
+                    return job(cur)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                self.prepared.discard(id(conn))
+                raise
+            finally:
+                self.pool.putconn(conn, close=broken)
+
+    def load_version(self) -> int:
+        # Текущая версия загрузки из etl_load_version (0 — ETL ещё ни разу не завершался)
+        def read(cur):
+            cur.execute("SELECT version FROM etl_load_version WHERE id = 1;")
+            row = cur.fetchone()
+            return row[0] if row else 0
+        return self.run(read)
+
+    def check_version(self):
+        # Не чаще раза в version_check_sec сверяем версию загрузки; если ETL загрузил новые данные —
+        # очищаем кэш. Сверку выполняет один поток, остальные в это время работают с текущим кэшем
+        now = time.monotonic()
+        with self.lock:
+            if self.version_checked is not None and now - self.version_checked < self.version_check_sec:
+                return
+            self.version_checked = now
+        version = self.load_version()
+        with self.lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.stats["invalidations"] += 1
+                self.cache.clear()
+                self.cache_rows = 0
+                self.version = version
+
+    def query(self, name: str, **filters) -> tuple[tuple, tuple]:
+        # Результат запроса name с фильтрами (year_from, year_to, tariff, segment, region — см. QUERIES):
+        # (названия колонок, строки). Повторный запрос с теми же фильтрами отдаётся из кэша
+        if name not in QUERIES:
+            raise ValueError(f"Неизвестный запрос {name!r} (ожидается один из: {', '.join(QUERIES)})")
+        allowed = QUERIES[name][0]
+        unknown = set(filters) - set(allowed)
+        if unknown:
+            raise ValueError(f"Запрос {name} не поддерживает фильтры {sorted(unknown)} (допустимы: {', '.join(allowed)})")
+        params = tuple(filters.get(f) for f in allowed)
+        key = (name, params)
+
+        self.check_version()
+        with self.lock:
+            result = self.cache.get(key)
+            if result is not None:
+                self.cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return result
+            self.stats["misses"] += 1
+            version = self.version
+
+        def execute(cur):
+            cur.execute(sql.SQL("EXECUTE {} ({})").format(
+                sql.Identifier(name), sql.SQL(", ").join(sql.Placeholder() * len(params))
+            ), params)
+            return tuple(col.name for col in cur.description), tuple(cur.fetchall())
+        result = self.run(execute)
+        self.store(key, result, version)
+        return result
+
+    def store(self, key, result, version):
+        # Кладём результат в кэш и вытесняем давно не запрашивавшиеся ответы сверх лимита строк.
+        # Результат, посчитанный до смены версии загрузки, не кэшируем
+        rows = len(result[1])
+        with self.lock:
+            if version != self.version or rows > self.cache_max_rows or key in self.cache:
+                return
+            self.cache[key] = result
+            self.cache_rows += rows
+            while self.cache_rows > self.cache_max_rows:
+                _, (_, evicted) = self.cache.popitem(last=False)
+                self.cache_rows -= len(evicted)
+                self.stats["evictions"] += 1
+
+
+def main():
+    # Проверка сервиса: каждый запрос выполняется дважды — первый раз из PostgreSQL, второй — из кэша
+    service = BiService()
+    try:
+        print(f"Версия загрузки: {service.load_version()}")
+        for name in QUERIES:
+            for source in ("база", "кэш"):
+                t0 = time.perf_counter()
+                _, rows = service.query(name, year_from=2024, year_to=2026)
+                print(f"{name} ({source}): {len(rows)} строк, {(time.perf_counter() - t0) * 1000:.3f} мс")
+        print(" ".join(f"{k}: {v}" for k, v in sorted(service.stats.items())))
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    # Точка входа при запуске скрипта напрямую
+    main()
@@ -16,30 +16,61 @@ LEFT JOIN dim_tariff t ON t.tariff_key = fu.tariff_key
 GROUP BY dd.year, dd.month, COALESCE(t.tariff_name, 'UNKNOWN'), COALESCE(s.segment, 'UNKNOWN');
 
 CREATE OR REPLACE VIEW v_churn_monthly AS
+-- База на начало месяца — накопленная сумма событий: +1 в первом месяце, на начало которого абонент уже
+-- активирован, -1 в первом месяце после отключения. Абоненты сначала сворачиваются по датам активации
+-- и отключения (два прохода по dim_subscriber), месяцы событий считаются уже по тысячам дат —
+-- вместо соединения каждого месяца со всеми абонентами по диапазону дат
 WITH months AS (
   SELECT DISTINCT make_date(year, month, 1) AS month_start
   FROM dim_date
 ),
+activations AS (
+  SELECT activation_date, COUNT(*) AS subscribers
+  FROM dim_subscriber
+  WHERE activation_date IS NOT NULL
+    AND (deactivation_date IS NULL OR deactivation_date >= activation_date)
+  GROUP BY activation_date
+),
+deactivations AS (
+  -- churned — все отключения дня; ended — отключения после активации (уменьшают базу)
+  SELECT deactivation_date,
+         COUNT(*) AS churned,
+         COUNT(*) FILTER (WHERE deactivation_date >= activation_date) AS ended
+  FROM dim_subscriber
+  WHERE deactivation_date IS NOT NULL
+  GROUP BY deactivation_date
+),
+events AS (
+  SELECT (date_trunc('month', activation_date - 1) + interval '1 month')::date AS month_start, subscribers AS delta
+  FROM activations
+  UNION ALL
+  SELECT (date_trunc('month', deactivation_date) + interval '1 month')::date AS month_start, -ended AS delta
+  FROM deactivations
+  UNION ALL
+  SELECT month_start, 0 AS delta
+  FROM months
+),
 base AS (
-  SELECT m.month_start, COUNT(*) AS base_subscribers
-  FROM months m
-  JOIN dim_subscriber s
-    ON s.activation_date <= m.month_start
-   AND (s.deactivation_date IS NULL OR s.deactivation_date >= m.month_start)
-  GROUP BY m.month_start
+  SELECT r.month_start, r.base_subscribers::bigint AS base_subscribers
+  FROM (
+    SELECT month_start, SUM(SUM(delta)) OVER (ORDER BY month_start) AS base_subscribers
+    FROM events
+    GROUP BY month_start
+  ) r
+  JOIN months m ON m.month_start = r.month_start
+  WHERE r.base_subscribers > 0
 ),
 churned AS (
   SELECT date_trunc('month', deactivation_date)::date AS month_start,
-         COUNT(*) AS churned_subscribers
-  FROM dim_subscriber
-  WHERE deactivation_date IS NOT NULL
+         SUM(churned) AS churned_subscribers
+  FROM deactivations
   GROUP BY date_trunc('month', deactivation_date)::date
 )
 SELECT
   EXTRACT(YEAR FROM b.month_start)::int  AS year,
   EXTRACT(MONTH FROM b.month_start)::int AS month,
   b.base_subscribers,
-  COALESCE(c.churned_subscribers, 0) AS churned_subscribers,
+  COALESCE(c.churned_subscribers, 0)::bigint AS churned_subscribers,
   CASE WHEN b.base_subscribers > 0
        THEN ROUND(100.0 * COALESCE(c.churned_subscribers,0) / b.base_subscribers, 4)
        ELSE 0 END AS churn_rate_pct
@@ -71,7 +71,8 @@ CREATE TABLE IF NOT EXISTS dim_channel (
 );
 
 CREATE TABLE IF NOT EXISTS fact_usage (
-  usage_key BIGSERIAL PRIMARY KEY,
+  usage_key BIGSERIAL,
+  event_id VARCHAR(64),
   date_key INTEGER NOT NULL,
   time_key INTEGER NOT NULL,
   tariff_key INTEGER,
@@ -81,31 +82,37 @@ CREATE TABLE IF NOT EXISTS fact_usage (
   call_duration_sec INTEGER DEFAULT 0,
   traffic_mb NUMERIC(18,4) DEFAULT 0,
   units NUMERIC(18,4) DEFAULT 0,
-  revenue_amount NUMERIC(18,4) DEFAULT 0
-);
+  revenue_amount NUMERIC(18,4) DEFAULT 0,
+  PRIMARY KEY (usage_key, date_key)
+) PARTITION BY RANGE (date_key);
 
 CREATE TABLE IF NOT EXISTS fact_billing (
-  billing_key BIGSERIAL PRIMARY KEY,
+  billing_key BIGSERIAL,
+  billing_id VARCHAR(64),
   tariff_key INTEGER,
   date_key INTEGER NOT NULL,
   subscriber_key INTEGER NOT NULL,
   amount NUMERIC(18,4) NOT NULL,
   charge_type VARCHAR(50),
-  description VARCHAR(500)
-);
+  description VARCHAR(500),
+  PRIMARY KEY (billing_key, date_key)
+) PARTITION BY RANGE (date_key);
 
 CREATE TABLE IF NOT EXISTS fact_payment (
-  payment_key BIGSERIAL PRIMARY KEY,
+  payment_key BIGSERIAL,
+  payment_id VARCHAR(64),
   subscriber_key INTEGER NOT NULL,
   date_key INTEGER NOT NULL,
   channel_key INTEGER,
   amount NUMERIC(18,4) NOT NULL,
   payment_method VARCHAR(50),
-  status VARCHAR(30)
-);
+  status VARCHAR(30),
+  PRIMARY KEY (payment_key, date_key)
+) PARTITION BY RANGE (date_key);
 
 CREATE TABLE IF NOT EXISTS fact_network_kpi (
-  kpi_key BIGSERIAL PRIMARY KEY,
+  kpi_key BIGSERIAL,
+  kpi_id VARCHAR(64),
   date_key INTEGER NOT NULL,
   time_key INTEGER NOT NULL,
   cell_key INTEGER NOT NULL,
@@ -114,7 +121,24 @@ CREATE TABLE IF NOT EXISTS fact_network_kpi (
   call_successes BIGINT DEFAULT 0,
   call_drops BIGINT DEFAULT 0,
   success_ratio NUMERIC(5,2),
-  drop_ratio NUMERIC(5,2)
+  drop_ratio NUMERIC(5,2),
+  PRIMARY KEY (kpi_key, date_key)
+) PARTITION BY RANGE (date_key);
+
+CREATE TABLE IF NOT EXISTS etl_watermark (
+  fact_table VARCHAR(100) PRIMARY KEY,
+  ts_column VARCHAR(100) NOT NULL,
+  last_ts TIMESTAMP,
+  updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- Версия загрузки: одна строка, version увеличивается в конце каждого успешного запуска ETL.
+-- По ней кэш BI-сервиса (Bi_service.py) понимает, что данные витрин изменились
+CREATE TABLE IF NOT EXISTS etl_load_version (
+  id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  version BIGINT NOT NULL,
+  mode VARCHAR(20) NOT NULL,
+  loaded_at TIMESTAMP NOT NULL DEFAULT now()
 );
 
 CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_subscriber_subscriber_id ON dim_subscriber (subscriber_id);
@@ -123,10 +147,34 @@ CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_service_code ON dim_service (service_co
 CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_cell_cell_id ON dim_cell_site (cell_id);
 CREATE UNIQUE INDEX IF NOT EXISTS ux_dim_channel_code ON dim_channel (channel_code);
 
-CREATE INDEX IF NOT EXISTS ix_fact_usage_date_subscriber ON fact_usage (date_key, subscriber_key);
-CREATE INDEX IF NOT EXISTS ix_fact_billing_date_subscriber ON fact_billing (date_key, subscriber_key);
-CREATE INDEX IF NOT EXISTS ix_fact_payment_date_subscriber ON fact_payment (date_key, subscriber_key);
-CREATE INDEX IF NOT EXISTS ix_fact_network_kpi_date_cell ON fact_network_kpi (date_key, cell_key);
+ALTER TABLE fact_usage ADD COLUMN IF NOT EXISTS event_id VARCHAR(64);
+ALTER TABLE fact_billing ADD COLUMN IF NOT EXISTS billing_id VARCHAR(64);
+ALTER TABLE fact_payment ADD COLUMN IF NOT EXISTS payment_id VARCHAR(64);
+ALTER TABLE fact_network_kpi ADD COLUMN IF NOT EXISTS kpi_id VARCHAR(64);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_usage_event_id ON fact_usage (event_id, date_key);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_billing_billing_id ON fact_billing (billing_id, date_key);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_payment_payment_id ON fact_payment (payment_id, date_key);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_network_kpi_kpi_id ON fact_network_kpi (kpi_id, date_key);
+
+-- Факты лежат в порядке date_key (ETL вставляет строки отсортированными), поэтому диапазон дат
+-- ищется по BRIN: индекс в несколько страниц на секцию вместо B-tree по каждой строке
+CREATE INDEX IF NOT EXISTS ix_fact_usage_date_brin ON fact_usage USING brin (date_key) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS ix_fact_billing_date_brin ON fact_billing USING brin (date_key) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS ix_fact_payment_date_brin ON fact_payment USING brin (date_key) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS ix_fact_network_kpi_date_brin ON fact_network_kpi USING brin (date_key) WITH (pages_per_range = 32);
+
+-- Покрывающий индекс под v_network_daily/mart_network_daily: диапазон дней читается index-only scan без строк факта.
+-- Для fact_usage такого индекса нет: v_kpi_monthly и отчёт ARPU агрегируют всю историю (index-only scan не быстрее
+-- последовательного чтения секций), а срезы по месяцам отдаёт куб mart_revenue_cube
+CREATE INDEX IF NOT EXISTS ix_fact_network_kpi_daily ON fact_network_kpi (date_key, cell_key)
+  INCLUDE (traffic_mb, success_ratio, drop_ratio);
+
+-- Прежние B-tree по (date_key, ключ) заменены индексами выше
+DROP INDEX IF EXISTS ix_fact_usage_date_subscriber;
+DROP INDEX IF EXISTS ix_fact_billing_date_subscriber;
+DROP INDEX IF EXISTS ix_fact_payment_date_subscriber;
+DROP INDEX IF EXISTS ix_fact_network_kpi_date_cell;
 
 
 DO $$
@@ -1,20 +1,129 @@
 import os
+import io
+import csv
+import bz2
+import gzip
+import json
+import time
 import datetime
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 
 
 # Базовая директория проекта (папка, где лежит этот скрипт)
 BASE_DIR = Path(__file__).resolve().parent
 
 # Папка с CSV-файлами, которые сгенерированы генератором тестовых данных
-CSV_DIR = BASE_DIR / "data_out"
+CSV_DIR = Path(os.getenv("ETL_CSV_DIR", BASE_DIR / "data_out"))
 
+# Режим загрузки:
+#   full        — полная перезагрузка (TRUNCATE всех таблиц DWH и загрузка с нуля);
+#   incremental — дозагрузка: в staging попадают только строки новее watermark, измерения обновляются (upsert);
+#   months      — перезагрузка месяцев из ETL_MONTHS подменой месячных секций фактов;
+#   drop_months — удаление месяцев из ETL_MONTHS (отсоединение и удаление секций).
+LOAD_MODE = os.getenv("ETL_MODE", "full")
 
-def get_conn():
-    # Создаём подключение к PostgreSQL.
-    return psycopg2.connect(
+# Месяцы для режимов months/drop_months: "2025-04,2025-05"
+RELOAD_MONTHS = os.getenv("ETL_MONTHS", "")
+
+# Источник staging:
+#   csv     — CSV-файлы из CSV_DIR загружаются в tmp_* через COPY (по умолчанию);
+#   staging — общие UNLOGGED-таблицы tmp_* уже заполнены генератором (GEN_TARGET=postgres), CSV не читаются.
+#             Фильтры режимов incremental/months применяются к staging через DELETE.
+SOURCE = os.getenv("ETL_SOURCE", "csv")
+
+# Манифест помесячных файлов фактов (manifest.json генератора с GEN_PARTITION=month). Если задан, факты
+# грузятся из перечисленных в нём файлов (пути — относительно манифеста), справочники — как обычно из CSV_DIR.
+# Берутся только нужные режиму месяцы: months — месяцы из ETL_MONTHS, incremental — файлы новее watermark.
+# Чтобы загрузить часть данных, достаточно оставить в манифесте только нужные файлы
+MANIFEST = os.getenv("ETL_MANIFEST", "")
+
+# Параллельная загрузка staging: число соединений/потоков COPY (1 — последовательная загрузка в TEMP-таблицы)
+WORKERS = int(os.getenv("ETL_WORKERS", "1"))
+
+# Файлы больше этого размера при параллельной загрузке режутся на куски по байтовым диапазонам
+CHUNK_MIN_BYTES = int(os.getenv("ETL_CHUNK_MB", "64")) * 1024 * 1024
+
+# Потоковое чтение входных файлов: размер буфера, который COPY запрашивает за один раз
+COPY_BUFFER_SIZE = int(os.getenv("ETL_COPY_BUFFER_KB", "256")) * 1024
+
+# Как часто (в секундах) печатать прогресс COPY и ограничение скорости чтения (МБ/с на поток, 0 — без ограничения)
+PROGRESS_SEC = float(os.getenv("ETL_PROGRESS_SEC", "5"))
+MAX_MB_PER_SEC = float(os.getenv("ETL_MAX_MBPS", "0"))
+
+# Сжатые входные файлы читаются на лету, без распаковки на диск
+COMPRESSED_EXTS = (".gz", ".zst", ".bz2")
+
+# Вместо CSV можно положить файлы в двоичном формате COPY (GEN_FORMAT=binary генератора): usage.pgcopy,
+# usage_000.pgcopy, usage.pgcopy.gz и т.п. Они грузятся через COPY ... WITH (FORMAT binary)
+BINARY_EXT = ".pgcopy"
+
+# Путь загрузки fact_usage:
+#   staging — CSV -> tmp_usage -> INSERT ... SELECT с соединениями с dim_* (по умолчанию);
+#   cache   — после загрузки измерений ключи держатся в памяти (бизнес-ключ -> суррогатный ключ),
+#             usage.csv переводится построчно и вставляется в fact_usage без staging и соединений.
+#             Строки с неизвестными ключами пишутся в rejects/usage_rejects.csv. Только для full/incremental.
+USAGE_PATH = os.getenv("ETL_USAGE_PATH", "staging")
+
+# Режим bulk-загрузки фактов (только для ETL_MODE=full): перед загрузкой индексы ix_fact_* и внешние ключи фактов
+# снимаются, после — FK возвращаются (NOT VALID + VALIDATE), индексы строятся заново, факты проходят VACUUM ANALYZE
+BULK_LOAD = os.getenv("ETL_BULK", "0") == "1"
+
+# Память и число параллельных процессов PostgreSQL для построения индексов в bulk-режиме
+MAINTENANCE_WORK_MEM = os.getenv("ETL_MAINTENANCE_WORK_MEM", "1GB")
+MAINTENANCE_WORKERS = int(os.getenv("ETL_MAINTENANCE_WORKERS", "4"))
+
+# Staging: таблица tmp_*, исходный CSV и колонки в порядке CSV.
+# Вместо одного файла можно положить шарды: usage_000.csv, usage_001.csv, ... (маска usage_*.csv);
+# и файл, и шарды могут быть сжаты: usage.csv.gz, usage_000.csv.zst и т.п., или быть в формате PGCOPY (BINARY_EXT)
+STAGING = [
+    ("tmp_tariffs", "tariffs.csv", ["tariff_code","tariff_name","tariff_type","is_active","valid_from","valid_to"]),
+    ("tmp_services", "services.csv", ["service_code","service_name","service_group","is_recurring"]),
+    ("tmp_channels", "channels.csv", ["channel_code","channel_name","channel_type"]),
+    ("tmp_cell_sites", "cell_sites.csv", ["cell_id","country","region","city","technology","site_name"]),
+    ("tmp_subscribers", "subscribers.csv", ["subscriber_id","msisdn","customer_type","segment","status","activation_date","deactivation_date","country","region","city"]),
+    ("tmp_usage", "usage.csv", ["event_id","event_ts","subscriber_id","tariff_code","service_code","cell_id","call_duration_sec","traffic_mb","units","revenue_amount"]),
+    ("tmp_billing", "billing.csv", ["billing_id","op_ts","subscriber_id","tariff_code","amount","charge_type","description"]),
+    ("tmp_payments", "payments.csv", ["payment_id","payment_ts","subscriber_id","channel_code","amount","payment_method","status"]),
+    ("tmp_network_kpi", "network_kpi.csv", ["kpi_id","kpi_ts","cell_id","traffic_mb","call_attempts","call_successes","call_drops"]),
+]
+
+# Факты: staging-таблица и колонка времени события, по которой ведётся watermark
+FACTS = {
+    "fact_usage": ("tmp_usage", "event_ts"),
+    "fact_billing": ("tmp_billing", "op_ts"),
+    "fact_payment": ("tmp_payments", "payment_ts"),
+    "fact_network_kpi": ("tmp_network_kpi", "kpi_ts"),
+}
+
+# Исходные ID событий в фактах: вместе с date_key образуют уникальный ключ, по которому загрузка идемпотентна
+FACT_IDS = {
+    "fact_usage": "event_id",
+    "fact_billing": "billing_id",
+    "fact_payment": "payment_id",
+    "fact_network_kpi": "kpi_id",
+}
+
+# Инкрементальный режим: насколько часов назад от watermark перечитывать события (для опоздавших строк).
+# Уже загруженные строки из этого окна отсекаются по уникальному ID и повторно не вставляются.
+WATERMARK_LAG_HOURS = float(os.getenv("ETL_WATERMARK_LAG_HOURS", "0"))
+
+# Отчёт о запуске: по строке JSON на запуск (время, строки и байты каждого этапа) дописывается в этот файл
+REPORT_PATH = Path(os.getenv("ETL_REPORT", BASE_DIR / "etl_reports" / "etl_runs.jsonl"))
+
+# ETL_EXPLAIN=1 — INSERT фактов выполняются через EXPLAIN (ANALYZE, BUFFERS), план сохраняется в отчёт
+EXPLAIN = os.getenv("ETL_EXPLAIN", "0") == "1"
+
+
+def conn_params():
+    # Параметры подключения к PostgreSQL (общие для одиночного соединения и пула)
+    return dict(
         host=os.getenv("PGHOST", "localhost"),
         port=int(os.getenv("PGPORT", "5432")),
         dbname=os.getenv("PGDATABASE", "KR"),
@@ -23,31 +132,403 @@ def get_conn():
     )
 
 
+def get_conn():
+    # Создаём подключение к PostgreSQL.
+    return psycopg2.connect(**conn_params())
+
+
 def exec_file(cur, path: Path):
     # Выполняем SQL-скрипт из файла
     with open(path, "r", encoding="utf-8") as f:
         cur.execute(f.read())
 
 
-def copy_csv(cur, table: str, csv_path: Path, columns: list[str]):
+class RangeReader:
+    # Файловый объект для COPY, который отдаёт только байты [start, end) исходного файла
+    def __init__(self, f, start: int, end: int):
+        self.f = f
+        self.f.seek(start)
+        self.left = end - start
+
+    def read(self, size=-1):
+        if self.left <= 0:
+            return b""
+        if size is None or size < 0 or size > self.left:
+            size = self.left
+        chunk = self.f.read(size)
+        self.left -= len(chunk)
+        return chunk
+
+
+class CopyStream:
+    # Потоковая обёртка над входным файлом для COPY:
+    # считает байты и строки, периодически печатает скорость и при необходимости ограничивает её.
+    # COPY читает данные кусками фиксированного размера, поэтому память не зависит от размера файла.
+    # text=False — двоичный поток (PGCOPY): строки по переводам строк не считаются
+    def __init__(self, f, label: str, max_mb_per_sec: float = 0, progress_sec: float = 0, text: bool = True):
+        self.f = f
+        self.text = text
+        self.label = label
+        self.max_bytes_per_sec = max_mb_per_sec * 1024 * 1024
+        self.progress_sec = progress_sec
+        self.bytes = 0
+        self.rows = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def read(self, size=-1):
+        chunk = self.f.read(size)
+        self.bytes += len(chunk)
+        if self.text:
+            self.rows += chunk.count(b"\n")
+
+        now = time.monotonic()
+        if self.max_bytes_per_sec > 0:
+            # Ждём, пока средняя скорость не опустится до лимита
+            ahead = self.bytes / self.max_bytes_per_sec - (now - self.started)
+            if ahead > 0:
+                time.sleep(ahead)
+                now = time.monotonic()
+        if self.progress_sec > 0 and now - self.last_report >= self.progress_sec:
+            self.last_report = now
+            self.report()
+        return chunk
+
+    def report(self, final: bool = False):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rows = f"{self.rows} строк, {self.rows / elapsed:.0f} строк/с, " if self.text else ""
+        print(
+            f"{'COPY завершён' if final else 'COPY'} {self.label}: {rows}"
+            f"{self.bytes / elapsed / 1024 / 1024:.1f} МБ/с"
+        )
+
+
+class LineStream:
+    # Файловый объект для COPY поверх итератора строк (bytes): данные формируются на лету,
+    # в памяти держится не больше одного запрошенного куска
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buf = b""
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data, self.buf = self.buf + b"".join(self.lines), b""
+            return data
+        parts = [self.buf]
+        n = len(self.buf)
+        while n < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            n += len(line)
+        data = b"".join(parts)
+        self.buf = data[size:]
+        return data[:size]
+
+
+class RunReport:
+    # Отчёт о запуске ETL: список этапов с временем выполнения, числом строк и байт.
+    # Этап — блок with report.stage(...) as st; в st можно дописать rows/bytes/plan и любые поля.
+    def __init__(self, **info):
+        self.info = info
+        self.started_at = datetime.datetime.now()
+        self.started = time.monotonic()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str, **attrs):
+        entry = {"stage": name, **attrs}
+        t0 = time.monotonic()
+        try:
+            yield entry
+        finally:
+            entry["wall_sec"] = round(time.monotonic() - t0, 4)
+            # list.append потокобезопасен — этапы COPY из параллельных потоков пишутся сюда же
+            self.stages.append(entry)
+
+    def write(self, path: Path, status: str, error: str | None = None):
+        # Дописываем отчёт одной строкой JSON (JSON Lines): удобно сравнивать запуски между собой
+        record = {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            **self.info,
+            "status": status,
+            "error": error,
+            "total_sec": round(time.monotonic() - self.started, 4),
+            "stages": self.stages,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def open_source(path: Path):
+    # Открываем входной файл в бинарном режиме; сжатые файлы распаковываются потоково
+    name = path.name
+    if name.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if name.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if name.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError(f"Для чтения {path} нужен пакет zstandard: pip install zstandard") from None
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.BufferedReader(reader, COPY_BUFFER_SIZE)
+    return open(path, "rb")
+
+
+def is_compressed(path: Path) -> bool:
+    return path.name.endswith(COMPRESSED_EXTS)
+
+
+def is_binary(path: Path) -> bool:
+    # Файл в двоичном формате COPY (в том числе сжатый: usage.pgcopy.gz)
+    name = path.name
+    for ext in COMPRESSED_EXTS:
+        name = name.removesuffix(ext)
+    return name.endswith(BINARY_EXT)
+
+
+def copy_query(table: str, columns: list[str], where=None, binary: bool = False):
+    # COPY ... FROM STDIN в формате CSV (пустая строка — NULL) или двоичном (binary=True)
+    # с необязательным фильтром строк
+    options = sql.SQL("FORMAT binary" if binary else "FORMAT CSV, NULL ''")
+    query = sql.SQL("COPY {} ({}) FROM STDIN WITH ({})").format(
+        sql.Identifier(*table.split(".")),
+        sql.SQL(",").join(map(sql.Identifier, columns)),
+        options,
+    )
+    if where is not None:
+        query = sql.SQL("{} WHERE {}").format(query, where)
+    return query
+
+
+def copy_lines(cur, table: str, columns: list[str], lines, label: str, binary: bool = False):
+    # COPY из итератора кусков CSV (bytes) без промежуточного файла — например, прямо из генератора данных.
+    # binary=True — куски образуют поток в двоичном формате COPY (с заголовком PGCOPY)
+    # Возвращаем (загружено строк, передано байт)
+    stream = CopyStream(LineStream(lines), f"{table} <- {label}", MAX_MB_PER_SEC, PROGRESS_SEC, text=not binary)
+    cur.copy_expert(copy_query(table, columns, binary=binary), stream, size=COPY_BUFFER_SIZE)
+    if PROGRESS_SEC > 0:
+        stream.report(final=True)
+    return cur.rowcount, stream.bytes
+
+
+def copy_csv(cur, table: str, csv_path: Path, columns: list[str], where=None, byte_range=None):
     # Загружаем CSV в таблицу через команду COPY
     # columns — список колонок, в которые идёт загрузка
-    with open(csv_path, "r", encoding="utf-8") as f:
-        next(f)  # пропускаем заголовок CSV
-        cur.copy_expert(
-            sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT CSV, NULL '')").format(
-                sql.Identifier(*table.split(".")),
-                sql.SQL(",").join(map(sql.Identifier, columns))
-            ),
-            f
+    # where — необязательный фильтр строк (COPY ... WHERE), отбрасывает строки ещё на стороне сервера
+    # byte_range — (start, end): загрузить только кусок файла (границы выровнены по концу строки)
+    # Файл PGCOPY (is_binary) передаётся в COPY целиком, вместе со своим заголовком
+    # Возвращаем (загружено строк, прочитано байт из файла после распаковки)
+    binary = is_binary(csv_path)
+    query = copy_query(table, columns, where, binary=binary)
+    with open_source(csv_path) as f:
+        if byte_range is not None:
+            src = RangeReader(f, *byte_range)
+        elif binary:
+            src = f
+        else:
+            f.readline()  # пропускаем заголовок CSV
+            src = f
+        stream = CopyStream(src, f"{table} <- {csv_path.name}", MAX_MB_PER_SEC, PROGRESS_SEC, text=not binary)
+        cur.copy_expert(query, stream, size=COPY_BUFFER_SIZE)
+    if PROGRESS_SEC > 0:
+        stream.report(final=True)
+    return cur.rowcount, stream.bytes
+
+
+def copy_staged(cur, report, table: str, csv_path: Path, columns: list[str], where=None, byte_range=None):
+    # COPY в staging как отдельный этап отчёта
+    with report.stage("copy", table=table, file=csv_path.name,
+                      byte_range=list(byte_range) if byte_range else None) as st:
+        st["rows"], st["bytes"] = copy_csv(cur, table, csv_path, columns, where=where, byte_range=byte_range)
+
+
+def source_files(filename: str, partitions=None) -> list[Path]:
+    # Находим исходные файлы для staging-таблицы: сам файл (usage.csv), его сжатую версию (usage.csv.gz),
+    # то же в формате PGCOPY (usage.pgcopy, usage.pgcopy.gz) или шарды (usage_*.csv, usage_*.pgcopy.gz, ...).
+    # partitions — выбранные по манифесту файлы {"usage": [...], ...}: для фактов из манифеста берутся они
+    path = CSV_DIR / filename
+    if partitions is not None and path.stem in partitions:
+        return partitions[path.stem]
+    suffixes = (path.suffix, BINARY_EXT)
+    for suffix in suffixes:
+        for ext in ("",) + COMPRESSED_EXTS:
+            candidate = path.with_name(path.stem + suffix + ext)
+            if candidate.exists():
+                return [candidate]
+    shards = sorted(
+        p for suffix in suffixes for ext in ("",) + COMPRESSED_EXTS
+        for p in CSV_DIR.glob(f"{path.stem}_*{suffix}{ext}")
+    )
+    if not shards:
+        raise FileNotFoundError(f"CSV файл не найден: {path}")
+    return shards
+
+
+def split_ranges(path: Path, n_chunks: int) -> list[tuple[int, int]]:
+    # Режем CSV на n_chunks байтовых диапазонов без заголовка.
+    # Каждая граница сдвигается на начало следующей строки, поэтому строки не разрываются
+    # (CSV генератора не содержит переводов строк внутри значений).
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        f.readline()  # заголовок
+        bounds = [f.tell()]
+        for i in range(1, n_chunks):
+            f.seek(max(bounds[-1], size * i // n_chunks))
+            f.readline()
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def stage_parallel(staging, filters: dict, report, workers: int = WORKERS, partitions=None):
+    # Параллельная загрузка staging: пул соединений, каждое делает свой COPY в общие (UNLOGGED) tmp_*.
+    # Большие файлы режутся на байтовые диапазоны, шарды и помесячные файлы грузятся как отдельные задачи.
+    tasks = []
+    for table, filename, cols in staging:
+        where = filters.get(table)
+        for path in source_files(filename, partitions):
+            size = path.stat().st_size
+            # Сжатые и двоичные файлы нельзя резать по байтам — они грузятся целиком одной задачей
+            if size >= CHUNK_MIN_BYTES and workers > 1 and not is_compressed(path) and not is_binary(path):
+                for byte_range in split_ranges(path, workers):
+                    tasks.append((byte_range[1] - byte_range[0], table, path, cols, where, byte_range))
+            else:
+                tasks.append((size, table, path, cols, where, None))
+
+    # Сначала самые большие куски — так потоки заканчивают примерно одновременно
+    tasks.sort(key=lambda t: t[0], reverse=True)
+    run_parallel(
+        [partial(copy_staged, report=report, table=table, csv_path=path, columns=cols, where=where, byte_range=byte_range)
+         for _, table, path, cols, where, byte_range in tasks],
+        workers,
+    )
+
+
+def run_parallel(jobs, workers: int = WORKERS):
+    # Выполняем задачи на пуле соединений: каждая задача — функция от курсора, в своей транзакции.
+    # Возвращаем результаты задач в исходном порядке
+    pool = ThreadedConnectionPool(1, workers, **conn_params())
+
+    def run(job):
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as c:
+                result = job(c)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            # list(...) пробрасывает первое исключение из потоков
+            return list(ex.map(run, jobs))
+    finally:
+        pool.closeall()
+
+
+def read_manifest(path: Path) -> list[dict]:
+    # Помесячные файлы из манифеста генератора; пути переводим в абсолютные (относительно манифеста)
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    stems = {Path(filename).stem for _, filename, _ in STAGING}
+    partitions = []
+    for part in manifest["partitions"]:
+        if part["table"] not in stems:
+            raise ValueError(f"Неизвестная таблица {part['table']!r} в манифесте {path}")
+        partitions.append({**part, "path": path.parent / part["path"]})
+    return partitions
+
+
+def select_partitions(partitions: list[dict], months=None, watermarks=None):
+    # Выбираем файлы манифеста для загрузки: {"usage": [пути], ...}.
+    # months — только эти месяцы; watermarks — только файлы, где есть строки новее watermark (с учётом окна
+    # опоздавших строк). Строки внутри выбранных файлов дополнительно фильтруются в COPY ... WHERE
+    stg_by_stem = {Path(filename).stem: table for table, filename, _ in STAGING}
+    wanted = {f"{m:%Y-%m}" for m in months} if months else None
+    selected = {part["table"]: [] for part in partitions}
+    for part in partitions:
+        if wanted is not None and part["month"] not in wanted:
+            continue
+        if watermarks:
+            cutoff = watermark_cutoff(watermarks.get(stg_by_stem[part["table"]], (None, None))[1])
+            if cutoff is not None and datetime.datetime.fromisoformat(part["max_ts"]) < cutoff:
+                continue
+        selected[part["table"]].append(part["path"])
+    return selected
+
+
+def get_watermarks(cur):
+    # Читаем watermark по каждому факту: {staging-таблица: (колонка времени, последний загруженный ts)}
+    cur.execute("SELECT fact_table, last_ts FROM etl_watermark;")
+    last = dict(cur.fetchall())
+    return {stg: (ts_col, last.get(fact)) for fact, (stg, ts_col) in FACTS.items()}
+
+
+def watermark_filter(ts_col: str, last_ts):
+    # Условие для COPY ... WHERE: берём строки начиная с watermark (минус окно опоздавших строк).
+    # Граница включается: событие с тем же временем, что и последнее загруженное, может прийти позже,
+    # а уже загруженные строки на границе отсекаются по уникальному ID (ON CONFLICT DO NOTHING)
+    if last_ts is None:
+        return None
+    return sql.SQL("{} >= {}").format(sql.Identifier(ts_col), sql.Literal(watermark_cutoff(last_ts)))
+
+
+def watermark_cutoff(last_ts):
+    # Граница отсечения по watermark с учётом окна опоздавших строк
+    if last_ts is None:
+        return None
+    return last_ts - datetime.timedelta(hours=WATERMARK_LAG_HOURS)
+
+
+def update_watermarks(cur, extra=None):
+    # Сдвигаем watermark на максимальный ts из загруженного staging.
+    # GREATEST игнорирует NULL, поэтому пустой staging не откатывает watermark назад.
+    # Максимум берётся по всему staging, включая строки, которые не прошли соединения с измерениями
+    # (неизвестный абонент, услуга, сота): такие строки старше watermark следующими инкрементальными
+    # запусками не перечитываются — их дозагружают через ETL_WATERMARK_LAG_HOURS или ETL_MODE=months.
+    # extra — {факт: максимальный ts} для фактов, загруженных в обход staging
+    for fact, (stg, ts_col) in FACTS.items():
+        cur.execute(
+            sql.SQL("""
+              INSERT INTO etl_watermark(fact_table, ts_column, last_ts, updated_at)
+              SELECT {fact}, {ts_name}, MAX({ts_col}), now() FROM {stg}
+              ON CONFLICT (fact_table) DO UPDATE
+              SET last_ts = GREATEST(etl_watermark.last_ts, EXCLUDED.last_ts),
+                  updated_at = EXCLUDED.updated_at;
+            """).format(
+                fact=sql.Literal(fact),
+                ts_name=sql.Literal(ts_col),
+                ts_col=sql.Identifier(ts_col),
+                stg=sql.Identifier(stg),
+            )
         )
+    for fact, max_ts in (extra or {}).items():
+        cur.execute("""
+          INSERT INTO etl_watermark(fact_table, ts_column, last_ts, updated_at)
+          VALUES (%s, %s, %s, now())
+          ON CONFLICT (fact_table) DO UPDATE
+          SET last_ts = GREATEST(etl_watermark.last_ts, EXCLUDED.last_ts),
+              updated_at = EXCLUDED.updated_at;
+        """, (fact, FACTS[fact][1], max_ts))
 
 
-def create_temp_tables(cur):
+def create_temp_tables(cur, shared: bool = False):
     # Создаём временные staging-таблицы (tmp_*) в рамках текущей сессии.
     # Они используются как "буфер" для загрузки CSV перед трансформациями и загрузкой в DWH-таблицы.
-    cur.execute("""
-    CREATE TEMP TABLE tmp_subscribers(
+    # shared=True — вместо TEMP создаём обычные UNLOGGED-таблицы, видимые всем соединениям
+    # (нужно для параллельного COPY из пула); перед загрузкой они очищаются.
+    kind = "UNLOGGED TABLE IF NOT EXISTS" if shared else "TEMP TABLE"
+    cur.execute(sql.SQL("""
+    CREATE {kind} tmp_subscribers(
       subscriber_id VARCHAR(50),
       msisdn VARCHAR(20),
       customer_type VARCHAR(30),
@@ -60,7 +541,7 @@ def create_temp_tables(cur):
       city VARCHAR(100)
     );
 
-    CREATE TEMP TABLE tmp_tariffs(
+    CREATE {kind} tmp_tariffs(
       tariff_code VARCHAR(50),
       tariff_name VARCHAR(200),
       tariff_type VARCHAR(50),
@@ -69,20 +550,20 @@ def create_temp_tables(cur):
       valid_to DATE
     );
 
-    CREATE TEMP TABLE tmp_services(
+    CREATE {kind} tmp_services(
       service_code VARCHAR(50),
       service_name VARCHAR(200),
       service_group VARCHAR(100),
       is_recurring BOOLEAN
     );
 
-    CREATE TEMP TABLE tmp_channels(
+    CREATE {kind} tmp_channels(
       channel_code VARCHAR(50),
       channel_name VARCHAR(200),
       channel_type VARCHAR(50)
     );
 
-    CREATE TEMP TABLE tmp_cell_sites(
+    CREATE {kind} tmp_cell_sites(
       cell_id VARCHAR(50),
       country VARCHAR(100),
       region VARCHAR(100),
@@ -91,7 +572,7 @@ def create_temp_tables(cur):
       site_name VARCHAR(200)
     );
 
-    CREATE TEMP TABLE tmp_usage(
+    CREATE {kind} tmp_usage(
       event_id VARCHAR(64),
       event_ts TIMESTAMP,
       subscriber_id VARCHAR(50),
@@ -104,7 +585,7 @@ def create_temp_tables(cur):
       revenue_amount NUMERIC(18,4)
     );
 
-    CREATE TEMP TABLE tmp_billing(
+    CREATE {kind} tmp_billing(
       billing_id VARCHAR(64),
       op_ts TIMESTAMP,
       subscriber_id VARCHAR(50),
@@ -114,7 +595,7 @@ def create_temp_tables(cur):
       description VARCHAR(500)
     );
 
-    CREATE TEMP TABLE tmp_payments(
+    CREATE {kind} tmp_payments(
       payment_id VARCHAR(64),
       payment_ts TIMESTAMP,
       subscriber_id VARCHAR(50),
@@ -124,7 +605,7 @@ def create_temp_tables(cur):
       status VARCHAR(30)
     );
 
-    CREATE TEMP TABLE tmp_network_kpi(
+    CREATE {kind} tmp_network_kpi(
       kpi_id VARCHAR(64),
       kpi_ts TIMESTAMP,
       cell_id VARCHAR(50),
@@ -133,24 +614,62 @@ def create_temp_tables(cur):
       call_successes BIGINT,
       call_drops BIGINT
     );
-    """)
+    """).format(kind=sql.SQL(kind)))
+    if shared:
+        cur.execute(sql.SQL("TRUNCATE TABLE {};").format(
+            sql.SQL(", ").join(sql.Identifier(table) for table, _, _ in STAGING)
+        ))
+
+
+def filter_staging(cur, filters: dict):
+    # ETL_SOURCE=staging: staging заполнен целиком, поэтому фильтры режима (watermark, месяцы),
+    # которые при загрузке CSV работают в COPY ... WHERE, применяем удалением лишних строк
+    deleted = {}
+    for table, where in filters.items():
+        if where is not None:
+            cur.execute(sql.SQL("DELETE FROM {} WHERE NOT ({});").format(sql.Identifier(table), where))
+            deleted[table] = cur.rowcount
+    return deleted
 
 
 def truncate_core(cur):
     # Очищаем основные таблицы DWH перед новой загрузкой.
     # CASCADE нужен, чтобы не возникало ошибки внешних ключей (сначала очищаются факты и зависимые таблицы).
     # RESTART IDENTITY сбрасывает автонумерацию суррогатных ключей.
+    # dim_time не очищается: это постоянный справочник всех минут суток (см. seed_dim_time).
     cur.execute(
         "TRUNCATE TABLE "
         "fact_network_kpi, fact_payment, fact_billing, fact_usage, "
-        "dim_channel, dim_cell_site, dim_service, dim_tariff, dim_subscriber, dim_geo, dim_time, dim_date "
+        "dim_channel, dim_cell_site, dim_service, dim_tariff, dim_subscriber, dim_geo, dim_date, "
+        "etl_watermark "
         "RESTART IDENTITY CASCADE;"
     )
 
 
+def seed_dim_time(cur) -> int:
+    # Заполняем dim_time всеми минутами суток (1440 строк) один раз: time_key фактов (HHMM00) вычисляется
+    # из времени события, а не выбирается из staging. Возвращаем число добавленных строк
+    cur.execute("SELECT COUNT(*) FROM dim_time;")
+    if cur.fetchone()[0] >= 1440:
+        return 0
+    cur.execute("""
+      INSERT INTO dim_time(time_key, full_time, hour, minute, second)
+      SELECT
+        (EXTRACT(HOUR FROM t)::int*10000 + EXTRACT(MINUTE FROM t)::int*100) AS time_key,
+        t AS full_time,
+        EXTRACT(HOUR FROM t)::int AS hour,
+        EXTRACT(MINUTE FROM t)::int AS minute,
+        0 AS second
+      FROM (SELECT (TIME '00:00' + m * INTERVAL '1 minute')::time AS t FROM generate_series(0, 1439) m) x
+      ON CONFLICT (time_key) DO NOTHING;
+    """)
+    return cur.rowcount
+
+
 def fill_dim_date_time(cur):
     # Определяем диапазон дат (min_date..max_date) по всем staging-таблицам.
-    # Это нужно для корректного заполнения dim_date и dim_time.
+    # Это нужно для корректного заполнения dim_date; dim_time — постоянный справочник минут суток.
+    # Возвращаем число добавленных строк по каждому измерению.
     cur.execute("""
       SELECT MIN(min_d)::date, MAX(max_d)::date
       FROM (
@@ -189,32 +708,21 @@ def fill_dim_date_time(cur):
         (DATE_TRUNC('month', full_date)::date = full_date) AS is_month_start,
         ((DATE_TRUNC('month', full_date) + INTERVAL '1 month - 1 day')::date = full_date) AS is_month_end,
         (EXTRACT(ISODOW FROM full_date)::int IN (6,7)) AS is_weekend
-      FROM d;
+      FROM d
+      ON CONFLICT (date_key) DO NOTHING;
     """, (min_date, max_date))
+    added = {"dim_date": cur.rowcount}
 
-    # Заполняем dim_time на основе времён, которые реально встречаются в событиях.
-    # Для usage/billing/payments берём минуты (date_trunc('minute')),
-    # для network_kpi — часы (date_trunc('hour')).
-    # time_key формируется как HHMMSS.
-    cur.execute("""
-      INSERT INTO dim_time(time_key, full_time, hour, minute, second)
-      SELECT DISTINCT
-        (EXTRACT(HOUR FROM t)::int*10000 + EXTRACT(MINUTE FROM t)::int*100 + EXTRACT(SECOND FROM t)::int) AS time_key,
-        t AS full_time,
-        EXTRACT(HOUR FROM t)::int AS hour,
-        EXTRACT(MINUTE FROM t)::int AS minute,
-        EXTRACT(SECOND FROM t)::int AS second
-      FROM (
-        SELECT date_trunc('minute', event_ts)::time AS t FROM tmp_usage
-        UNION ALL SELECT date_trunc('minute', op_ts)::time FROM tmp_billing
-        UNION ALL SELECT date_trunc('minute', payment_ts)::time FROM tmp_payments
-        UNION ALL SELECT date_trunc('hour', kpi_ts)::time FROM tmp_network_kpi
-      ) x;
-    """)
+    added["dim_time"] = seed_dim_time(cur)
+    return added
 
 
 def load_dims(cur):
     # Загружаем измерения (dim_*) из staging-таблиц (tmp_*)
+    # Все измерения грузятся как upsert: новые ключи добавляются, изменившиеся строки обновляются,
+    # а неизменившиеся не переписываются (WHERE ... IS DISTINCT FROM) — это важно для инкрементального режима.
+    # Возвращаем число добавленных/обновлённых строк по каждому измерению.
+    changed = {}
 
     # 1) География: собираем уникальные (country, region, city) из абонентов
     cur.execute("""
@@ -233,6 +741,7 @@ def load_dims(cur):
             AND COALESCE(g.city,'') = COALESCE(x.city,'')
         );
     """)
+    changed["dim_geo"] = cur.rowcount
 
     # 2) Абоненты: маппим geo_key по географии; при совпадении subscriber_id обновляем атрибуты
     cur.execute("""
@@ -253,8 +762,14 @@ def load_dims(cur):
           status = EXCLUDED.status,
           activation_date = EXCLUDED.activation_date,
           deactivation_date = EXCLUDED.deactivation_date,
-          geo_key = EXCLUDED.geo_key;
+          geo_key = EXCLUDED.geo_key
+      WHERE (dim_subscriber.msisdn, dim_subscriber.customer_type, dim_subscriber.segment, dim_subscriber.status,
+             dim_subscriber.activation_date, dim_subscriber.deactivation_date, dim_subscriber.geo_key)
+            IS DISTINCT FROM
+            (EXCLUDED.msisdn, EXCLUDED.customer_type, EXCLUDED.segment, EXCLUDED.status,
+             EXCLUDED.activation_date, EXCLUDED.deactivation_date, EXCLUDED.geo_key);
     """)
+    changed["dim_subscriber"] = cur.rowcount
 
     # 3) Тарифы: обновляем справочник по бизнес-ключу tariff_code
     cur.execute("""
@@ -267,8 +782,12 @@ def load_dims(cur):
           tariff_type = EXCLUDED.tariff_type,
           is_active = EXCLUDED.is_active,
           valid_from = EXCLUDED.valid_from,
-          valid_to = EXCLUDED.valid_to;
+          valid_to = EXCLUDED.valid_to
+      WHERE (dim_tariff.tariff_name, dim_tariff.tariff_type, dim_tariff.is_active, dim_tariff.valid_from, dim_tariff.valid_to)
+            IS DISTINCT FROM
+            (EXCLUDED.tariff_name, EXCLUDED.tariff_type, EXCLUDED.is_active, EXCLUDED.valid_from, EXCLUDED.valid_to);
     """)
+    changed["dim_tariff"] = cur.rowcount
 
     # 4) Услуги: обновляем справочник по service_code
     cur.execute("""
@@ -279,8 +798,11 @@ def load_dims(cur):
       ON CONFLICT (service_code) DO UPDATE
       SET service_name = EXCLUDED.service_name,
           service_group = EXCLUDED.service_group,
-          is_recurring = EXCLUDED.is_recurring;
+          is_recurring = EXCLUDED.is_recurring
+      WHERE (dim_service.service_name, dim_service.service_group, dim_service.is_recurring)
+            IS DISTINCT FROM (EXCLUDED.service_name, EXCLUDED.service_group, EXCLUDED.is_recurring);
     """)
+    changed["dim_service"] = cur.rowcount
 
     # 5) Каналы оплаты: обновляем справочник по channel_code
     cur.execute("""
@@ -290,8 +812,11 @@ def load_dims(cur):
       WHERE channel_code IS NOT NULL AND channel_code <> ''
       ON CONFLICT (channel_code) DO UPDATE
       SET channel_name = EXCLUDED.channel_name,
-          channel_type = EXCLUDED.channel_type;
+          channel_type = EXCLUDED.channel_type
+      WHERE (dim_channel.channel_name, dim_channel.channel_type)
+            IS DISTINCT FROM (EXCLUDED.channel_name, EXCLUDED.channel_type);
     """)
+    changed["dim_channel"] = cur.rowcount
 
     # 6) Соты/сайты: маппим geo_key и обновляем по cell_id
     cur.execute("""
@@ -310,20 +835,33 @@ def load_dims(cur):
       ON CONFLICT (cell_id) DO UPDATE
       SET geo_key = EXCLUDED.geo_key,
           technology = EXCLUDED.technology,
-          site_name = EXCLUDED.site_name;
+          site_name = EXCLUDED.site_name
+      WHERE (dim_cell_site.geo_key, dim_cell_site.technology, dim_cell_site.site_name)
+            IS DISTINCT FROM (EXCLUDED.geo_key, EXCLUDED.technology, EXCLUDED.site_name);
     """)
+    changed["dim_cell_site"] = cur.rowcount
+    return changed
 
 
-def load_facts(cur):
-    # Загружаем фактовые таблицы (fact_*) с подстановкой суррогатных ключей из измерений
-
-    # 1) fact_usage: события потребления услуг (CDR/usage)
-    cur.execute("""
-      INSERT INTO fact_usage(date_key, time_key, tariff_key, subscriber_key, service_key, cell_key,
-                             call_duration_sec, traffic_mb, units, revenue_amount)
+# INSERT ... SELECT для каждого факта с подстановкой суррогатных ключей из измерений.
+# date_key (YYYYMMDD) и time_key (HHMM00) вычисляются из времени события арифметикой (LATERAL k), без соединений
+# с dim_date/dim_time: dim_time содержит все минуты суток, а попадание даты в календарь проверяется
+# сравнением времени события с границами dim_date. Фильтр и сортировка идут по самому времени события,
+# чтобы выражение ключа вычислялось один раз на строку (порядок по времени совпадает с порядком date_key, time_key).
+# {target} — таблица назначения (сам факт или отдельная таблица месяца при подмене секции),
+# {where} — необязательный фильтр по k.date_key (загрузка одного месяца).
+# Исходный ID события хранится в факте; уникальный индекс (ID, date_key) + ON CONFLICT DO NOTHING
+# делают загрузку идемпотентной: повторно пришедшие строки просто пропускаются.
+# Строки вставляются в порядке даты: физический порядок совпадает с датой, на этом работают BRIN-индексы.
+FACT_SQL = {
+    # fact_usage: события потребления услуг (CDR/usage)
+    "fact_usage": """
+      INSERT INTO {target}(event_id, date_key, time_key, tariff_key, subscriber_key, service_key, cell_key,
+                           call_duration_sec, traffic_mb, units, revenue_amount)
       SELECT
-        dd.date_key,
-        dt.time_key,
+        u.event_id,
+        k.date_key,
+        k.time_key,
         t.tariff_key,
         s.subscriber_key,
         sv.service_key,
@@ -333,52 +871,82 @@ def load_facts(cur):
         COALESCE(u.units,0),
         COALESCE(u.revenue_amount,0)
       FROM tmp_usage u
-      JOIN dim_date dd ON dd.full_date = u.event_ts::date
-      JOIN dim_time dt ON dt.full_time = date_trunc('minute', u.event_ts)::time
+      CROSS JOIN LATERAL (
+        SELECT date_part('year', u.event_ts)::int * 10000
+               + date_part('month', u.event_ts)::int * 100
+               + date_part('day', u.event_ts)::int AS date_key,
+               date_part('hour', u.event_ts)::int * 10000 + date_part('minute', u.event_ts)::int * 100 AS time_key
+      ) k
       JOIN dim_subscriber s ON s.subscriber_id = u.subscriber_id
       LEFT JOIN dim_tariff t ON t.tariff_code = u.tariff_code
       JOIN dim_service sv ON sv.service_code = u.service_code
-      LEFT JOIN dim_cell_site cs ON cs.cell_id = u.cell_id;
-    """)
+      LEFT JOIN dim_cell_site cs ON cs.cell_id = u.cell_id
+      WHERE u.event_ts >= (SELECT MIN(full_date) FROM dim_date)
+        AND u.event_ts < (SELECT MAX(full_date) FROM dim_date) + 1
+      {where}
+      ORDER BY u.event_ts
+      ON CONFLICT (event_id, date_key) DO NOTHING;
+    """,
 
-    # 2) fact_billing: начисления/скидки/корректировки
-    cur.execute("""
-      INSERT INTO fact_billing(tariff_key, date_key, subscriber_key, amount, charge_type, description)
+    # fact_billing: начисления/скидки/корректировки
+    "fact_billing": """
+      INSERT INTO {target}(billing_id, tariff_key, date_key, subscriber_key, amount, charge_type, description)
       SELECT
+        b.billing_id,
         t.tariff_key,
-        dd.date_key,
+        k.date_key,
         s.subscriber_key,
         b.amount,
         b.charge_type,
         b.description
       FROM tmp_billing b
-      JOIN dim_date dd ON dd.full_date = b.op_ts::date
+      CROSS JOIN LATERAL (
+        SELECT date_part('year', b.op_ts)::int * 10000
+               + date_part('month', b.op_ts)::int * 100
+               + date_part('day', b.op_ts)::int AS date_key
+      ) k
       JOIN dim_subscriber s ON s.subscriber_id = b.subscriber_id
-      LEFT JOIN dim_tariff t ON t.tariff_code = b.tariff_code;
-    """)
+      LEFT JOIN dim_tariff t ON t.tariff_code = b.tariff_code
+      WHERE b.op_ts >= (SELECT MIN(full_date) FROM dim_date)
+        AND b.op_ts < (SELECT MAX(full_date) FROM dim_date) + 1
+      {where}
+      ORDER BY b.op_ts
+      ON CONFLICT (billing_id, date_key) DO NOTHING;
+    """,
 
-    # 3) fact_payment: платежи абонентов
-    cur.execute("""
-      INSERT INTO fact_payment(subscriber_key, date_key, channel_key, amount, payment_method, status)
+    # fact_payment: платежи абонентов
+    "fact_payment": """
+      INSERT INTO {target}(payment_id, subscriber_key, date_key, channel_key, amount, payment_method, status)
       SELECT
+        p.payment_id,
         s.subscriber_key,
-        dd.date_key,
+        k.date_key,
         ch.channel_key,
         p.amount,
         p.payment_method,
         p.status
       FROM tmp_payments p
-      JOIN dim_date dd ON dd.full_date = p.payment_ts::date
+      CROSS JOIN LATERAL (
+        SELECT date_part('year', p.payment_ts)::int * 10000
+               + date_part('month', p.payment_ts)::int * 100
+               + date_part('day', p.payment_ts)::int AS date_key
+      ) k
       JOIN dim_subscriber s ON s.subscriber_id = p.subscriber_id
-      LEFT JOIN dim_channel ch ON ch.channel_code = p.channel_code;
-    """)
+      LEFT JOIN dim_channel ch ON ch.channel_code = p.channel_code
+      WHERE p.payment_ts >= (SELECT MIN(full_date) FROM dim_date)
+        AND p.payment_ts < (SELECT MAX(full_date) FROM dim_date) + 1
+      {where}
+      ORDER BY p.payment_ts
+      ON CONFLICT (payment_id, date_key) DO NOTHING;
+    """,
 
-    # 4) fact_network_kpi: сетевые KPI по сотам/времени + вычисление процентных показателей
-    cur.execute("""
-      INSERT INTO fact_network_kpi(date_key, time_key, cell_key, traffic_mb, call_attempts, call_successes, call_drops, success_ratio, drop_ratio)
+    # fact_network_kpi: сетевые KPI по сотам/времени + вычисление процентных показателей
+    "fact_network_kpi": """
+      INSERT INTO {target}(kpi_id, date_key, time_key, cell_key, traffic_mb, call_attempts, call_successes, call_drops, success_ratio, drop_ratio)
       SELECT
-        dd.date_key,
-        dt.time_key,
+        nk.kpi_id,
+        k.date_key,
+        k.time_key,
         cs.cell_key,
         COALESCE(nk.traffic_mb,0),
         COALESCE(nk.call_attempts,0),
@@ -387,77 +955,786 @@ def load_facts(cur):
         CASE WHEN COALESCE(nk.call_attempts,0) > 0 THEN ROUND(100.0 * nk.call_successes / nk.call_attempts, 2) ELSE NULL END,
         CASE WHEN COALESCE(nk.call_attempts,0) > 0 THEN ROUND(100.0 * nk.call_drops / nk.call_attempts, 2) ELSE NULL END
       FROM tmp_network_kpi nk
-      JOIN dim_date dd ON dd.full_date = nk.kpi_ts::date
-      JOIN dim_time dt ON dt.full_time = date_trunc('hour', nk.kpi_ts)::time
-      JOIN dim_cell_site cs ON cs.cell_id = nk.cell_id;
+      CROSS JOIN LATERAL (
+        SELECT date_part('year', nk.kpi_ts)::int * 10000
+               + date_part('month', nk.kpi_ts)::int * 100
+               + date_part('day', nk.kpi_ts)::int AS date_key,
+               date_part('hour', nk.kpi_ts)::int * 10000 AS time_key
+      ) k
+      JOIN dim_cell_site cs ON cs.cell_id = nk.cell_id
+      WHERE nk.kpi_ts >= (SELECT MIN(full_date) FROM dim_date)
+        AND nk.kpi_ts < (SELECT MAX(full_date) FROM dim_date) + 1
+      {where}
+      ORDER BY nk.kpi_ts
+      ON CONFLICT (kpi_id, date_key) DO NOTHING;
+    """,
+}
+
+
+def fact_insert(fact: str, target: str | None = None, month=None):
+    # Собираем INSERT для факта из шаблона FACT_SQL
+    where = sql.SQL("")
+    if month is not None:
+        lo, hi = month_bounds(month)
+        where = sql.SQL("AND k.date_key >= {} AND k.date_key < {}").format(sql.Literal(lo), sql.Literal(hi))
+    return sql.SQL(FACT_SQL[fact]).format(target=sql.Identifier(target or fact), where=where)
+
+
+def run_insert(cur, query, entry=None) -> int:
+    # Выполняем INSERT факта и возвращаем число вставленных строк.
+    # При ETL_EXPLAIN=1 запрос выполняется через EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON): строки вставляются
+    # так же, а план с фактическим временем узлов и чтениями буферов сохраняется в этап отчёта entry.
+    if not EXPLAIN or entry is None:
+        cur.execute(query)
+        return cur.rowcount
+    cur.execute(sql.SQL("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {}").format(query))
+    plan = cur.fetchone()[0][0]
+    entry["plan"] = plan
+    # Узел ModifyTable с ON CONFLICT показывает вставленные строки отдельно от конфликтующих
+    node = plan["Plan"]
+    return node.get("Tuples Inserted", node["Plans"][0]["Actual Rows"] if node.get("Plans") else 0)
+
+
+def load_facts(cur, report, skip=()):
+    # Загружаем фактовые таблицы (fact_*) с подстановкой суррогатных ключей из измерений
+    # Возвращаем количество вставленных строк по каждому факту; skip — факты, загружаемые другим путём
+    loaded = {}
+    for fact in FACTS:
+        if fact not in skip:
+            with report.stage("fact", table=fact) as st:
+                loaded[fact] = st["rows"] = run_insert(cur, fact_insert(fact), st)
+    return loaded
+
+
+def load_dim_keys(cur):
+    # Компактные словари бизнес-ключ -> суррогатный ключ и множества допустимых date_key/time_key
+    keys = {}
+    for name, query in [
+        ("subscriber", "SELECT subscriber_id, subscriber_key FROM dim_subscriber;"),
+        ("tariff", "SELECT tariff_code, tariff_key FROM dim_tariff;"),
+        ("service", "SELECT service_code, service_key FROM dim_service;"),
+        ("cell", "SELECT cell_id, cell_key FROM dim_cell_site;"),
+    ]:
+        cur.execute(query)
+        keys[name] = dict(cur.fetchall())
+    cur.execute("SELECT date_key FROM dim_date;")
+    keys["date"] = {r[0] for r in cur.fetchall()}
+    cur.execute("SELECT time_key FROM dim_time;")
+    keys["time"] = {r[0] for r in cur.fetchall()}
+    return keys
+
+
+def load_usage_cached(cur, keys, last_ts=None, partitions=None):
+    # fact_usage без staging: читаем usage.csv (или шарды/сжатые файлы), подставляем суррогатные ключи
+    # из словарей в памяти и сразу отдаём строки в COPY.
+    # Семантика совпадает с FACT_SQL["fact_usage"]: абонент, услуга, дата и время обязательны (иначе строка
+    # уходит в reject-файл), тариф и сота — необязательны (NULL). last_ts — watermark инкрементального режима.
+    # Переведённые строки копируются во временный буфер (ключи уже подставлены, соединений нет) и вставляются
+    # в факт одним INSERT в порядке date_key — как и путь через staging, чтобы BRIN по дате оставался узким.
+    # Как и в FACT_SQL, вставка идёт с ON CONFLICT DO NOTHING во всех режимах: повторно пришедшие события
+    # (пересекающиеся шарды, повторно доставленный файл) пропускаются. partitions — файлы, выбранные по манифесту.
+    last_ts = watermark_cutoff(last_ts)
+    subs, tariffs, services, cells = keys["subscriber"], keys["tariff"], keys["service"], keys["cell"]
+    dates, times = keys["date"], keys["time"]
+    stats = {"rows": 0, "bytes": 0, "rejected": Counter(), "min_ts": None, "max_ts": None}
+
+    reject_path = CSV_DIR / "rejects" / "usage_rejects.csv"
+    reject_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def translate(reader, rejects):
+        for row in reader:
+            event_id, event_ts, sub_id, tariff, service, cell, duration, traffic, units, revenue = row
+            ts = datetime.datetime.fromisoformat(event_ts)
+            if last_ts is not None and ts < last_ts:
+                continue
+            date_key = ts.year * 10000 + ts.month * 100 + ts.day
+            time_key = ts.hour * 10000 + ts.minute * 100
+            sub_key = subs.get(sub_id)
+            service_key = services.get(service)
+            if sub_key is None:
+                reason = "subscriber"
+            elif service_key is None:
+                reason = "service"
+            elif date_key not in dates:
+                reason = "date"
+            elif time_key not in times:
+                reason = "time"
+            else:
+                reason = None
+            if reason:
+                stats["rejected"][reason] += 1
+                rejects.writerow(row + [reason])
+                continue
+
+            stats["rows"] += 1
+            if stats["min_ts"] is None or ts < stats["min_ts"]:
+                stats["min_ts"] = ts
+            if stats["max_ts"] is None or ts > stats["max_ts"]:
+                stats["max_ts"] = ts
+            yield (
+                f"{event_id},{date_key},{time_key},{tariffs.get(tariff, '')},{sub_key},{service_key},{cells.get(cell, '')},"
+                f"{duration or 0},{traffic or 0},{units or 0},{revenue or 0}\n"
+            ).encode()
+
+    fact_cols = sql.SQL(",").join(map(sql.Identifier, [
+        "event_id", "date_key", "time_key", "tariff_key", "subscriber_key", "service_key", "cell_key",
+        "call_duration_sec", "traffic_mb", "units", "revenue_amount",
+    ]))
+    cur.execute(sql.SQL("CREATE TEMP TABLE tmp_usage_keyed AS SELECT {} FROM fact_usage WITH NO DATA;").format(fact_cols))
+    query = sql.SQL("COPY tmp_usage_keyed ({}) FROM STDIN WITH (FORMAT CSV, NULL '')").format(fact_cols)
+    with open(reject_path, "w", newline="", encoding="utf-8") as rf:
+        rejects = csv.writer(rf)
+        usage_cols = next(cols for table, _, cols in STAGING if table == "tmp_usage")
+        rejects.writerow(usage_cols + ["reject_reason"])
+        for path in source_files("usage.csv", partitions):
+            if is_binary(path):
+                raise RuntimeError(f"ETL_USAGE_PATH=cache читает только CSV, а не {path.name}")
+            with open_source(path) as f:
+                reader = csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline=""))
+                next(reader)  # пропускаем заголовок CSV
+                stream = CopyStream(LineStream(translate(reader, rejects)), f"fact_usage <- {path.name}",
+                                    MAX_MB_PER_SEC, PROGRESS_SEC)
+                cur.copy_expert(query, stream, size=COPY_BUFFER_SIZE)
+            stats["bytes"] += stream.bytes
+            if PROGRESS_SEC > 0:
+                stream.report(final=True)
+
+    cur.execute(sql.SQL(
+        "INSERT INTO fact_usage ({cols}) SELECT {cols} FROM tmp_usage_keyed ORDER BY date_key, time_key "
+        "ON CONFLICT (event_id, date_key) DO NOTHING;"
+    ).format(cols=fact_cols))
+    stats["duplicates"] = stats["rows"] - cur.rowcount
+    stats["rows"] = cur.rowcount
+    cur.execute("DROP TABLE tmp_usage_keyed;")
+
+    if stats["rejected"]:
+        print(
+            f"fact_usage: отклонено {sum(stats['rejected'].values())} строк "
+            f"({', '.join(f'{k}: {v}' for k, v in stats['rejected'].items())}), см. {reject_path}"
+        )
+    return stats
+
+
+def parse_months(value: str) -> list[datetime.date]:
+    # "2025-04,2025-05" -> [date(2025, 4, 1), date(2025, 5, 1)]
+    months = []
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            year, month = item.split("-")
+            months.append(datetime.date(int(year), int(month), 1))
+    if not months:
+        raise ValueError("Не заданы месяцы: укажите ETL_MONTHS, например ETL_MONTHS=2025-04,2025-05")
+    return months
+
+
+def next_month(month: datetime.date) -> datetime.date:
+    if month.month == 12:
+        return datetime.date(month.year + 1, 1, 1)
+    return datetime.date(month.year, month.month + 1, 1)
+
+
+def month_bounds(month: datetime.date) -> tuple[int, int]:
+    # Границы секции месяца в терминах date_key (YYYYMMDD): [первое число месяца, первое число следующего)
+    nxt = next_month(month)
+    return (month.year * 10000 + month.month * 100 + 1, nxt.year * 10000 + nxt.month * 100 + 1)
+
+
+def month_filter(ts_col: str, months: list[datetime.date]):
+    # Условие для COPY ... WHERE: только строки, попадающие в перечисленные месяцы
+    return sql.SQL(" OR ").join(
+        sql.SQL("({col} >= {lo} AND {col} < {hi})").format(
+            col=sql.Identifier(ts_col), lo=sql.Literal(m), hi=sql.Literal(next_month(m))
+        )
+        for m in months
+    )
+
+
+def partition_name(fact: str, month: datetime.date) -> str:
+    # Секция факта за месяц: fact_usage_2025_04
+    return f"{fact}_{month:%Y_%m}"
+
+
+def is_partitioned(cur, table: str) -> bool:
+    # Проверяем, что таблица объявлена как секционированная (старые установки могли остаться обычными таблицами)
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def staged_months(cur, stg: str, ts_col: str) -> list[datetime.date]:
+    # Месяцы, которые встречаются в staging-таблице
+    cur.execute(sql.SQL(
+        "SELECT DISTINCT date_trunc('month', {col})::date FROM {stg} WHERE {col} IS NOT NULL ORDER BY 1;"
+    ).format(col=sql.Identifier(ts_col), stg=sql.Identifier(stg)))
+    return [r[0] for r in cur.fetchall()]
+
+
+def ensure_partitions(cur, fact: str, months: list[datetime.date]):
+    # Создаём недостающие месячные секции факта
+    for m in months:
+        lo, hi = month_bounds(m)
+        cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({});").format(
+            sql.Identifier(partition_name(fact, m)), sql.Identifier(fact), sql.Literal(lo), sql.Literal(hi)
+        ))
+
+
+def prepare_partitions(cur):
+    # Перед загрузкой через родительскую таблицу создаём секции под все месяцы из staging
+    for fact, (stg, ts_col) in FACTS.items():
+        if is_partitioned(cur, fact):
+            ensure_partitions(cur, fact, staged_months(cur, stg, ts_col))
+
+
+def to_regclass(cur, name: str) -> bool:
+    # Существует ли таблица с таким именем
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+    return cur.fetchone()[0]
+
+
+def drop_month(cur, fact: str, month: datetime.date):
+    # Удаление месяца — операция над метаданными: отсоединяем секцию и удаляем её целиком
+    part = partition_name(fact, month)
+    if to_regclass(cur, part):
+        cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(sql.Identifier(fact), sql.Identifier(part)))
+        cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(part)))
+
+
+def swap_month(cur, fact: str, month: datetime.date, entry=None) -> int:
+    # Перезагрузка месяца через подмену секции:
+    # 1) строим данные месяца в отдельной таблице (без индексов и FK — вставка идёт быстро);
+    # 2) CHECK с границами месяца позволяет ATTACH не сканировать таблицу для проверки границ;
+    # 3) старую секцию (если была) отсоединяем и удаляем, новую присоединяем на её место.
+    part = partition_name(fact, month)
+    stage = part + "_load"
+    lo, hi = month_bounds(month)
+
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(stage)))
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS);").format(sql.Identifier(stage), sql.Identifier(fact)))
+    # Уникальный индекс по исходному ID нужен уже при вставке (ON CONFLICT); при ATTACH он станет
+    # секцией уникального индекса родителя без повторного построения
+    cur.execute(sql.SQL("CREATE UNIQUE INDEX ON {} ({}, date_key);").format(
+        sql.Identifier(stage), sql.Identifier(FACT_IDS[fact])
+    ))
+    rows = run_insert(cur, fact_insert(fact, target=stage, month=month), entry)
+    cur.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} CHECK (date_key >= {} AND date_key < {});").format(
+        sql.Identifier(stage), sql.Identifier(stage + "_range"), sql.Literal(lo), sql.Literal(hi)
+    ))
+
+    drop_month(cur, fact, month)
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(sql.Identifier(stage), sql.Identifier(part)))
+    cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({});").format(
+        sql.Identifier(fact), sql.Identifier(part), sql.Literal(lo), sql.Literal(hi)
+    ))
+    cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(sql.Identifier(part), sql.Identifier(stage + "_range")))
+    return rows
+
+
+def reload_months(cur, months: list[datetime.date], report):
+    # Перезагружаем перечисленные месяцы всех фактов подменой секций
+    loaded = {}
+    for fact in FACTS:
+        if not is_partitioned(cur, fact):
+            raise RuntimeError(f"{fact} не секционирована — пересоздайте таблицы по Core_tables.sql")
+        loaded[fact] = 0
+        for m in months:
+            with report.stage("fact", table=fact, month=f"{m:%Y-%m}") as st:
+                st["rows"] = swap_month(cur, fact, m, st)
+            loaded[fact] += st["rows"]
+    return loaded
+
+
+def analyze_staging(cur):
+    # Статистика по staging: TEMP/UNLOGGED-таблицы только что заполнены, без ANALYZE
+    # планировщик не знает их размер и может выбрать плохие соединения с измерениями.
+    # Измерения тоже: после TRUNCATE в той же транзакции у них остаётся статистика прошлой загрузки
+    # (или пустой таблицы), и соединение фактов с ними может уйти во вложенные циклы
+    for table, _, _ in STAGING:
+        cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table)))
+    for table in ("dim_subscriber", "dim_tariff", "dim_service", "dim_cell_site", "dim_channel"):
+        cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table)))
+
+
+def drop_fact_indexes(cur):
+    # Снимаем вторичные индексы фактов (ix_fact_*) и возвращаем их определения для восстановления.
+    # Первичные ключи и уникальные индексы (ux_*) не трогаем — на них держится целостность.
+    cur.execute("""
+      SELECT indexname, indexdef
+      FROM pg_indexes
+      WHERE schemaname = current_schema()
+        AND tablename = ANY(%s)
+        AND indexname LIKE 'ix\\_fact\\_%%';
+    """, (list(FACTS),))
+    # Для секционированного факта pg_indexes отдаёт "CREATE INDEX ... ON ONLY fact": такой индекс создаётся
+    # только на родителе (невалидным, без индексов секций), поэтому восстанавливаем его без ONLY
+    indexes = [(name, indexdef.replace(" ON ONLY ", " ON ", 1)) for name, indexdef in cur.fetchall()]
+    for name, _ in indexes:
+        cur.execute(sql.SQL("DROP INDEX {};").format(sql.Identifier(name)))
+    return indexes
+
+
+def drop_fact_fks(cur):
+    # Снимаем внешние ключи фактов, чтобы вставка не проверяла каждую строку триггерами
+    cur.execute("""
+      SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+      FROM pg_constraint
+      WHERE contype = 'f' AND conrelid = ANY(%s::regclass[]);
+    """, (list(FACTS),))
+    fks = cur.fetchall()
+    for table, name, _ in fks:
+        cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(sql.Identifier(table), sql.Identifier(name)))
+    return fks
+
+
+def restore_fact_fks(cur, fks):
+    # Возвращаем внешние ключи: NOT VALID добавляется мгновенно, а VALIDATE проверяет все строки
+    # одним запросом вместо построчных триггеров. Для секционированных таблиц PostgreSQL не поддерживает
+    # NOT VALID — там ключ добавляется сразу с проверкой (тоже одним запросом по каждой секции).
+    for table, name, definition in fks:
+        not_valid = not is_partitioned(cur, table)
+        cur.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}{};").format(
+            sql.Identifier(table), sql.Identifier(name), sql.SQL(definition), sql.SQL(" NOT VALID" if not_valid else "")
+        ))
+        if not_valid:
+            cur.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {};").format(sql.Identifier(table), sql.Identifier(name)))
+
+
+def build_index(cur, indexdef: str):
+    # Строим индекс с увеличенной maintenance_work_mem и параллельными процессами построения
+    cur.execute("SELECT set_config('maintenance_work_mem', %s, true);", (MAINTENANCE_WORK_MEM,))
+    cur.execute("SELECT set_config('max_parallel_maintenance_workers', %s, true);", (str(MAINTENANCE_WORKERS),))
+    cur.execute(indexdef)
+
+
+def drop_invalid_fact_indexes(cur) -> list[str]:
+    # Удаляем невалидные индексы фактов ix_fact_* (например, оставшиеся от прерванной или старой bulk-загрузки,
+    # восстанавливавшей индексы "ON ONLY"): CREATE INDEX IF NOT EXISTS в Core_tables.sql их не пересоздаёт
+    cur.execute("""
+      SELECT c.relname
+      FROM pg_index i
+      JOIN pg_class c ON c.oid = i.indexrelid
+      WHERE c.relname LIKE 'ix\\_fact\\_%' AND c.relnamespace = current_schema()::regnamespace AND NOT i.indisvalid;
+    """)
+    names = [r[0] for r in cur.fetchall()]
+    for name in names:
+        cur.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(name)))
+    return names
+
+
+def check_indexes_valid(cur, names):
+    # Проверяем, что восстановленные индексы валидны: индекс секционированного факта, созданный "ON ONLY",
+    # остаётся невалидным на родителе без индексов секций — планировщик его не использует
+    cur.execute("""
+      SELECT c.relname
+      FROM pg_index i
+      JOIN pg_class c ON c.oid = i.indexrelid
+      WHERE c.relname = ANY(%s) AND c.relnamespace = current_schema()::regnamespace AND NOT i.indisvalid;
+    """, (names,))
+    invalid = [r[0] for r in cur.fetchall()]
+    if invalid:
+        raise RuntimeError(f"После bulk-загрузки индексы невалидны: {', '.join(invalid)}")
+
+
+def finish_bulk_load(conn, indexes, fks, report):
+    # Завершение bulk-загрузки (факты уже закоммичены):
+    # 1) индексы строятся заново — при ETL_WORKERS > 1 параллельно на нескольких соединениях;
+    # 2) возвращаются внешние ключи;
+    # 3) VACUUM ANALYZE фактов — свежая статистика и карта видимости для index-only scan.
+    with report.stage("bulk_build_indexes", indexes=len(indexes)):
+        if WORKERS > 1 and len(indexes) > 1:
+            run_parallel([partial(build_index, indexdef=indexdef) for _, indexdef in indexes], WORKERS)
+        else:
+            with conn.cursor() as cur:
+                for _, indexdef in indexes:
+                    build_index(cur, indexdef)
+            conn.commit()
+        with conn.cursor() as cur:
+            check_indexes_valid(cur, [name for name, _ in indexes])
+
+    with report.stage("bulk_restore_fks", fks=len(fks)):
+        with conn.cursor() as cur:
+            restore_fact_fks(cur, fks)
+        conn.commit()
+
+    # VACUUM нельзя выполнять внутри транзакции
+    with report.stage("bulk_vacuum_analyze"):
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("VACUUM (ANALYZE) {};").format(sql.SQL(", ").join(map(sql.Identifier, FACTS))))
+        finally:
+            conn.autocommit = False
+
+
+def fact_index_sizes(cur) -> dict:
+    # Размер индексов фактов (сумма по секциям), байт: {"fact_usage": {"ix_fact_usage_date_brin": ..., ...}, ...}
+    cur.execute("""
+      SELECT i.tablename, i.indexname, SUM(pg_relation_size(t.relid))
+      FROM pg_indexes i
+      CROSS JOIN LATERAL pg_partition_tree(to_regclass(i.indexname)) t
+      WHERE i.schemaname = current_schema() AND i.tablename = ANY(%s)
+      GROUP BY i.tablename, i.indexname
+      ORDER BY i.tablename, i.indexname;
+    """, (list(FACTS),))
+    sizes = {}
+    for table, index, size in cur.fetchall():
+        sizes.setdefault(table, {})[index] = int(size)
+    return sizes
+
+
+def staged_date_range(cur):
+    # Диапазон дат событий в staging фактов — какие дни/месяцы затронуты текущей загрузкой
+    cur.execute(sql.SQL("SELECT MIN(d_min), MAX(d_max) FROM ({}) t;").format(
+        sql.SQL(" UNION ALL ").join(
+            sql.SQL("SELECT MIN({col})::date AS d_min, MAX({col})::date AS d_max FROM {stg}").format(
+                col=sql.Identifier(ts_col), stg=sql.Identifier(stg)
+            )
+            for stg, ts_col in FACTS.values()
+        )
+    ))
+    return cur.fetchone()
+
+
+def bump_load_version(cur, mode: str) -> int:
+    # Увеличиваем версию загрузки (etl_load_version) и возвращаем новое значение.
+    # Версия не сбрасывается при полной перезагрузке: для кэша BI важно только, что она изменилась
+    cur.execute("""
+      INSERT INTO etl_load_version(id, version, mode, loaded_at)
+      VALUES (1, 1, %s, now())
+      ON CONFLICT (id) DO UPDATE
+      SET version = etl_load_version.version + 1,
+          mode = EXCLUDED.mode,
+          loaded_at = EXCLUDED.loaded_at
+      RETURNING version;
+    """, (mode,))
+    return cur.fetchone()[0]
+
+
+def refresh_marts(cur, date_range, full: bool = False):
+    # Обновляем материализованные витрины mart_* (таблицы-копии v_kpi_monthly, v_churn_monthly, v_network_daily,
+    # активность абонентов по месяцам mart_subscriber_month и куб выручки mart_revenue_cube).
+    # date_range = (date_from, date_to) — пересчитываются только затронутые месяцы (mart_subscriber_month,
+    # mart_kpi_monthly), годы (mart_revenue_cube) и дни (mart_network_daily);
+    # фильтр по date_key отсекает лишние секции фактов.
+    # full=True — витрины предварительно очищаются (после полной перезагрузки фактов).
+    # Изменение атрибутов измерений (сегмент, название тарифа) задним числом требует полного пересчёта.
+    if full:
+        cur.execute("TRUNCATE TABLE mart_subscriber_month, mart_kpi_monthly, mart_revenue_cube, mart_network_daily;")
+    day_lo, day_hi = date_range
+    # Пустой staging (day_lo is None) — факты не менялись, месячные и дневные витрины не трогаем
+    if day_lo is not None:
+        month_lo = month_bounds(day_lo.replace(day=1))[0]
+        month_hi = month_bounds(day_hi.replace(day=1))[1] - 1
+        params = {
+            "month_lo": month_lo, "month_hi": month_hi,
+            "month_start_lo": day_lo.replace(day=1), "month_start_hi": day_hi.replace(day=1),
+            "year_lo": day_lo.year, "year_hi": day_hi.year,
+            "day_lo": day_lo, "day_hi": day_hi,
+            "day_key_lo": day_lo.year * 10000 + day_lo.month * 100 + day_lo.day,
+            "day_key_hi": day_hi.year * 10000 + day_hi.month * 100 + day_hi.day,
+        }
+
+        # 1) Активность абонентов по месяцам: пересчитываем целые месяцы (COUNT DISTINCT не складывается по дням).
+        # Это единственный скан fact_usage — KPI по месяцам и куб ниже считаются уже по этой таблице
+        cur.execute("""
+          DELETE FROM mart_subscriber_month WHERE month_start BETWEEN %(month_start_lo)s AND %(month_start_hi)s;
+
+          INSERT INTO mart_subscriber_month(month_start, subscriber_key, tariff_key, service_key, events, revenue)
+          SELECT
+            make_date(fu.date_key / 10000, fu.date_key / 100 %% 100, 1) AS month_start,
+            fu.subscriber_key,
+            fu.tariff_key,
+            fu.service_key,
+            COUNT(*)               AS events,
+            SUM(fu.revenue_amount) AS revenue
+          FROM fact_usage fu
+          WHERE fu.date_key BETWEEN %(month_lo)s AND %(month_hi)s
+          GROUP BY 1, fu.subscriber_key, fu.tariff_key, fu.service_key;
+        """, params)
+
+        # 2) Коммерческие KPI по месяцам (копия v_kpi_monthly) — по активности абонентов затронутых месяцев
+        cur.execute("""
+          DELETE FROM mart_kpi_monthly
+          WHERE year * 10000 + month * 100 + 1 BETWEEN %(month_lo)s AND %(month_hi)s;
+
+          INSERT INTO mart_kpi_monthly(year, month, tariff_name, segment, active_subscribers, total_revenue, arpu)
+          SELECT
+            EXTRACT(YEAR FROM a.month_start)::int  AS year,
+            EXTRACT(MONTH FROM a.month_start)::int AS month,
+            COALESCE(t.tariff_name, 'UNKNOWN') AS tariff_name,
+            COALESCE(s.segment, 'UNKNOWN')     AS segment,
+            COUNT(DISTINCT a.subscriber_key)   AS active_subscribers,
+            SUM(a.revenue)                     AS total_revenue,
+            CASE WHEN COUNT(DISTINCT a.subscriber_key) > 0
+                 THEN ROUND(SUM(a.revenue) / COUNT(DISTINCT a.subscriber_key), 4)
+                 ELSE 0 END                    AS arpu
+          FROM mart_subscriber_month a
+          JOIN dim_subscriber s ON s.subscriber_key = a.subscriber_key
+          LEFT JOIN dim_tariff t ON t.tariff_key = a.tariff_key
+          WHERE a.month_start BETWEEN %(month_start_lo)s AND %(month_start_hi)s
+          GROUP BY 1, 2, COALESCE(t.tariff_name, 'UNKNOWN'), COALESCE(s.segment, 'UNKNOWN');
+        """, params)
+
+        # 3) Куб выручки/ARPU: строки уровня года зависят от всех его месяцев, поэтому пересчитываются
+        # целые затронутые годы (по mart_subscriber_month — это тысячи строк, а не скан фактов)
+        cur.execute("""
+          DELETE FROM mart_revenue_cube WHERE year BETWEEN %(year_lo)s AND %(year_hi)s;
+
+          INSERT INTO mart_revenue_cube(grouping_id, year, month, tariff_name, segment, region, service_name,
+                                        active_subscribers, total_revenue, arpu)
+          WITH activity AS (
+            SELECT
+              EXTRACT(YEAR FROM a.month_start)::smallint  AS year,
+              EXTRACT(MONTH FROM a.month_start)::smallint AS month,
+              COALESCE(t.tariff_name, 'UNKNOWN')   AS tariff_name,
+              COALESCE(s.segment, 'UNKNOWN')       AS segment,
+              COALESCE(g.region, 'UNKNOWN')        AS region,
+              COALESCE(sv.service_name, 'UNKNOWN') AS service_name,
+              a.subscriber_key,
+              a.revenue
+            FROM mart_subscriber_month a
+            JOIN dim_subscriber s ON s.subscriber_key = a.subscriber_key
+            LEFT JOIN dim_geo g ON g.geo_key = s.geo_key
+            LEFT JOIN dim_tariff t ON t.tariff_key = a.tariff_key
+            LEFT JOIN dim_service sv ON sv.service_key = a.service_key
+            WHERE a.month_start >= make_date(%(year_lo)s, 1, 1) AND a.month_start < make_date(%(year_hi)s + 1, 1, 1)
+          )
+          SELECT
+            GROUPING(month, tariff_name, segment, region, service_name) AS grouping_id,
+            year, month, tariff_name, segment, region, service_name,
+            COUNT(DISTINCT subscriber_key) AS active_subscribers,
+            SUM(revenue)                   AS total_revenue,
+            CASE WHEN COUNT(DISTINCT subscriber_key) > 0
+                 THEN ROUND(SUM(revenue) / COUNT(DISTINCT subscriber_key), 4)
+                 ELSE 0 END                AS arpu
+          FROM activity
+          GROUP BY GROUPING SETS (
+            (year, month), (year, month, tariff_name, segment), (year, month, tariff_name), (year, month, segment),
+            (year, month, region), (year, month, service_name),
+            (year), (year, tariff_name, segment), (year, tariff_name), (year, segment),
+            (year, region), (year, service_name)
+          );
+        """, params)
+
+        # 4) Сеть по дням: пересчитываем только затронутые дни
+        cur.execute("""
+          DELETE FROM mart_network_daily WHERE date BETWEEN %(day_lo)s AND %(day_hi)s;
+
+          INSERT INTO mart_network_daily(date, technology, region, traffic_mb, avg_success_ratio, avg_drop_ratio)
+          SELECT
+            dd.full_date AS date,
+            cs.technology,
+            g.region,
+            SUM(nk.traffic_mb) AS traffic_mb,
+            ROUND(AVG(nk.success_ratio), 4) AS avg_success_ratio,
+            ROUND(AVG(nk.drop_ratio), 4)    AS avg_drop_ratio
+          FROM fact_network_kpi nk
+          JOIN dim_date dd ON dd.date_key = nk.date_key
+          JOIN dim_cell_site cs ON cs.cell_key = nk.cell_key
+          LEFT JOIN dim_geo g ON g.geo_key = cs.geo_key
+          WHERE nk.date_key BETWEEN %(day_key_lo)s AND %(day_key_hi)s
+          GROUP BY dd.full_date, cs.technology, g.region;
+        """, params)
+
+    # 5) Churn зависит только от dim_subscriber (активации/отключения могут меняться в любом месяце),
+    # поэтому пересчитывается целиком — это небольшая таблица по месяцам, а v_churn_monthly считает базу
+    # накопленной суммой событий по датам (два прохода по dim_subscriber, секунды и на 10 млн абонентов)
+    cur.execute("""
+      DELETE FROM mart_churn_monthly;
+      INSERT INTO mart_churn_monthly(year, month, base_subscribers, churned_subscribers, churn_rate_pct)
+      SELECT year, month, base_subscribers, churned_subscribers, churn_rate_pct FROM v_churn_monthly;
     """)
 
 
+def build_marts(cur, date_range, full: bool = False):
+    # Создаём представления и таблицы витрин, затем обновляем витрины
+    exec_file(cur, BASE_DIR / "Bi_views.sql")
+    exec_file(cur, BASE_DIR / "Bi_marts.sql")
+    refresh_marts(cur, date_range, full)
+
+
 def main():
     # Основной сценарий ETL
     conn = get_conn()
     conn.autocommit = False  # управляем транзакциями
     cur = conn.cursor()
+    # Отчёт о запуске: параметры запуска и этапы с временем/строками/байтами (см. REPORT_PATH)
+    report = RunReport(
+        mode=LOAD_MODE, months=RELOAD_MONTHS or None, csv_dir=str(CSV_DIR), workers=WORKERS,
+        source=SOURCE, usage_path=USAGE_PATH, bulk=BULK_LOAD, explain=EXPLAIN, manifest=MANIFEST or None,
+    )
+    status, error = "error", None
     try:
         # 1) Создаём таблицы DWH (если они ещё не созданы)
-        exec_file(cur, BASE_DIR / "Core_tables.sql")
-        conn.commit()
+        with report.stage("core_tables") as st:
+            st["dropped_invalid_indexes"] = drop_invalid_fact_indexes(cur)
+            exec_file(cur, BASE_DIR / "Core_tables.sql")
+            conn.commit()
 
-        # 2) Очищаем DWH-таблицы перед новой загрузкой
-        truncate_core(cur)
-        conn.commit()
+        # 2) Очищаем DWH-таблицы перед новой загрузкой (только в полном режиме).
+        # В остальных режимах готовим фильтры staging: по watermark или по перезагружаемым месяцам.
+        watermarks = {}
+        months = None
+        if LOAD_MODE == "full":
+            with report.stage("truncate"):
+                truncate_core(cur)
+                conn.commit()
+            filters = {}
+        elif LOAD_MODE == "incremental":
+            watermarks = get_watermarks(cur)
+            filters = {stg: watermark_filter(ts_col, last_ts) for stg, (ts_col, last_ts) in watermarks.items()}
+        elif LOAD_MODE in ("months", "drop_months"):
+            months = parse_months(RELOAD_MONTHS)
+            filters = {stg: month_filter(ts_col, months) for stg, ts_col in FACTS.values()}
+        else:
+            raise ValueError(
+                f"Неизвестный режим загрузки ETL_MODE={LOAD_MODE!r} (ожидается full, incremental, months или drop_months)"
+            )
 
-        # 3) Создаём staging (временные) таблицы
-        create_temp_tables(cur)
-
-        # Вспомогательная функция загрузки одного CSV в одну таблицу tmp_*
-        def load(table, filename, cols):
-            path = CSV_DIR / filename
-            if not path.exists():
-                raise FileNotFoundError(f"CSV файл не найден: {path}")
-            copy_csv(cur, table, path, cols)
-
-        # 4) Загружаем CSV в staging-таблицы (tmp_*)
-        load("tmp_tariffs", "tariffs.csv", ["tariff_code","tariff_name","tariff_type","is_active","valid_from","valid_to"])
-        load("tmp_services", "services.csv", ["service_code","service_name","service_group","is_recurring"])
-        load("tmp_channels", "channels.csv", ["channel_code","channel_name","channel_type"])
-        load("tmp_cell_sites", "cell_sites.csv", ["cell_id","country","region","city","technology","site_name"])
-        load("tmp_subscribers", "subscribers.csv", ["subscriber_id","msisdn","customer_type","segment","status","activation_date","deactivation_date","country","region","city"])
-        load("tmp_usage", "usage.csv", ["event_id","event_ts","subscriber_id","tariff_code","service_code","cell_id","call_duration_sec","traffic_mb","units","revenue_amount"])
-        load("tmp_billing", "billing.csv", ["billing_id","op_ts","subscriber_id","tariff_code","amount","charge_type","description"])
-        load("tmp_payments", "payments.csv", ["payment_id","payment_ts","subscriber_id","channel_code","amount","payment_method","status"])
-        load("tmp_network_kpi", "network_kpi.csv", ["kpi_id","kpi_ts","cell_id","traffic_mb","call_attempts","call_successes","call_drops"])
-        conn.commit()
+        use_cache = USAGE_PATH == "cache"
+        if USAGE_PATH not in ("staging", "cache"):
+            raise ValueError(f"Неизвестный путь загрузки ETL_USAGE_PATH={USAGE_PATH!r} (ожидается staging или cache)")
+        if use_cache and LOAD_MODE not in ("full", "incremental"):
+            raise ValueError("ETL_USAGE_PATH=cache поддерживается только для ETL_MODE=full и incremental")
+        if SOURCE not in ("csv", "staging"):
+            raise ValueError(f"Неизвестный источник ETL_SOURCE={SOURCE!r} (ожидается csv или staging)")
+        if use_cache and SOURCE == "staging":
+            raise ValueError("ETL_USAGE_PATH=cache читает usage.csv и не сочетается с ETL_SOURCE=staging")
+        if MANIFEST and SOURCE == "staging":
+            raise ValueError("ETL_MANIFEST задаёт файлы для загрузки и не сочетается с ETL_SOURCE=staging")
+
+        if LOAD_MODE == "drop_months":
+            with report.stage("drop_months"):
+                for fact in FACTS:
+                    for m in months:
+                        drop_month(cur, fact, m)
+            with report.stage("marts"):
+                build_marts(cur, (min(months), next_month(max(months)) - datetime.timedelta(days=1)))
+                conn.commit()
+            with report.stage("load_version") as st:
+                st["version"] = bump_load_version(cur, LOAD_MODE)
+                conn.commit()
+            print("Удалены месяцы:", ", ".join(f"{m:%Y-%m}" for m in months))
+            status = "ok"
+            return
+
+        partitions = None
+        if SOURCE == "staging":
+            # 3-4) Staging уже заполнен генератором: оставляем в нём только строки, нужные режиму загрузки
+            with report.stage("filter_staging") as st:
+                st["deleted"] = filter_staging(cur, filters)
+                conn.commit()
+        else:
+            # Помесячные файлы фактов по манифесту: читаем только месяцы, нужные режиму загрузки
+            if MANIFEST:
+                with report.stage("select_partitions") as st:
+                    listed = read_manifest(Path(MANIFEST))
+                    partitions = select_partitions(listed, months, watermarks)
+                    st["listed"] = len(listed)
+                    st["selected"] = {stem: len(paths) for stem, paths in partitions.items()}
+
+            # 3) Создаём staging-таблицы: TEMP для последовательной загрузки, общие UNLOGGED — для параллельной
+            with report.stage("create_staging"):
+                create_temp_tables(cur, shared=WORKERS > 1)
+                conn.commit()
+
+            # 4) Загружаем CSV в staging-таблицы (tmp_*); при ETL_USAGE_PATH=cache usage.csv в staging не грузится.
+            # Каждый COPY (файл, шард или кусок файла) — отдельный этап отчёта, staging — их общее время.
+            staging = [entry for entry in STAGING if not (use_cache and entry[0] == "tmp_usage")]
+            with report.stage("staging", workers=WORKERS):
+                if WORKERS > 1:
+                    stage_parallel(staging, filters, report, WORKERS, partitions)
+                else:
+                    for table, filename, cols in staging:
+                        for path in source_files(filename, partitions):
+                            copy_staged(cur, report, table, path, cols, where=filters.get(table))
+                conn.commit()
 
         # 5) Заполняем календарь и время на основе диапазона дат в staging
-        fill_dim_date_time(cur)
+        with report.stage("fill_dim_date_time") as st:
+            st["rows"] = fill_dim_date_time(cur)
 
         # 6) Загружаем измерения (dim_*)
-        load_dims(cur)
+        with report.stage("load_dims") as st:
+            st["rows"] = load_dims(cur)
 
-        # 7) Загружаем факты (fact_*)
-        load_facts(cur)
-        conn.commit()
+        # 7) Загружаем факты (fact_*) и сдвигаем watermark в той же транзакции.
+        # В режиме months каждый месяц собирается в отдельной таблице и подменяет секцию;
+        # в остальных режимах строки идут через родительскую таблицу в заранее созданные секции.
+        # В bulk-режиме на время полной загрузки снимаются вторичные индексы и внешние ключи фактов.
+        bulk = BULK_LOAD and LOAD_MODE == "full"
+        if bulk:
+            with report.stage("bulk_drop_indexes_fks"):
+                indexes = drop_fact_indexes(cur)
+                fks = drop_fact_fks(cur)
+        with report.stage("analyze_staging"):
+            analyze_staging(cur)
+        usage_stats = None
+        if LOAD_MODE == "months":
+            loaded = reload_months(cur, months, report)
+        else:
+            prepare_partitions(cur)
+            loaded = load_facts(cur, report, skip=("fact_usage",) if use_cache else ())
+        if use_cache:
+            # Для usage staging пуст: секции создаём под весь календарь (dim_time уже содержит все минуты суток)
+            with report.stage("fact", table="fact_usage", path="cache") as st:
+                cur.execute("SELECT DISTINCT date_trunc('month', full_date)::date FROM dim_date;")
+                ensure_partitions(cur, "fact_usage", [r[0] for r in cur.fetchall()])
+                usage_stats = load_usage_cached(
+                    cur, load_dim_keys(cur), watermarks.get("tmp_usage", (None, None))[1], partitions=partitions,
+                )
+                st.update(rows=usage_stats["rows"], bytes=usage_stats["bytes"], rejected=dict(usage_stats["rejected"]))
+            loaded["fact_usage"] = usage_stats["rows"]
+        with report.stage("watermarks_commit"):
+            update_watermarks(cur, {"fact_usage": usage_stats["max_ts"]} if usage_stats else None)
+            conn.commit()
+        if bulk:
+            finish_bulk_load(conn, indexes, fks, report)
 
-        # 8) Создаём представления (витрины) для BI
-        exec_file(cur, BASE_DIR / "Bi_views.sql")
-        conn.commit()
+        # 8) Создаём представления (витрины) для BI и обновляем материализованные витрины mart_*:
+        # после полной загрузки — целиком, иначе — только затронутые месяцы/дни
+        with report.stage("marts") as st:
+            date_range = staged_date_range(cur)
+            if usage_stats and usage_stats["min_ts"] is not None:
+                date_range = (
+                    min(d for d in (date_range[0], usage_stats["min_ts"].date()) if d is not None),
+                    max(d for d in (date_range[1], usage_stats["max_ts"].date()) if d is not None),
+                )
+            if LOAD_MODE == "months":
+                # Секции месяцев подменены целиком: пересчитываем витрины по полным границам месяцев,
+                # а не по датам в staging — иначе дни/месяцы, где данных стало меньше (или файл пуст),
+                # сохранили бы строки от прежних данных (как и в ветке drop_months)
+                date_range = (min(months), next_month(max(months)) - datetime.timedelta(days=1))
+            st["date_range"] = date_range
+            build_marts(cur, date_range, full=LOAD_MODE == "full")
+            conn.commit()
+
+        # Размер индексов фактов (BRIN, покрывающие, уникальные по ID) — в отчёт и в консоль
+        with report.stage("index_sizes") as st:
+            st["indexes"] = fact_index_sizes(cur)
+            conn.rollback()
+        print("Индексы фактов, МБ: " + ", ".join(
+            f"{table} {sum(sizes.values()) / 1024 / 1024:.1f}" for table, sizes in st["indexes"].items()
+        ))
 
-        # 9) Контрольный вывод: считаем строки в фактах
-        cur.execute("SELECT COUNT(*) FROM fact_usage;")
-        fu = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM fact_billing;")
-        fb = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM fact_payment;")
-        fp = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM fact_network_kpi;")
-        fn = cur.fetchone()[0]
+        # Новая версия загрузки: BI-сервис сбрасывает кэш результатов, посчитанных по прежним данным
+        with report.stage("load_version") as st:
+            st["version"] = bump_load_version(cur, LOAD_MODE)
+            conn.commit()
 
-        print("ETL успешно завершён.")
-        print("fact_usage:", fu, "fact_billing:", fb, "fact_payment:", fp, "fact_network_kpi:", fn)
+        # 9) Контрольный вывод: сколько строк загружено в факты за этот запуск.
+        # COUNT(*) по фактам не делаем — в инкрементальном режиме он стоил бы как полный скан истории.
+        print(f"ETL успешно завершён (режим {LOAD_MODE}, версия загрузки {st['version']}).")
+        print(" ".join(f"{fact}: {loaded[fact]}" for fact in FACTS))
+        status = "ok"
 
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
     finally:
-        # Закрываем курсор и соединение
+        # Сохраняем отчёт (и при ошибке — с этапами, выполненными до неё), закрываем курсор и соединение
+        report.write(REPORT_PATH, status, error)
+        print(f"Отчёт о запуске: {REPORT_PATH}")
         cur.close()
         conn.close()
 
@@ -1,9 +1,23 @@
+import io
+import os
+import sys
 import csv
+import json
+import time
 import random
+import socket
 import string
+import struct
+import bisect
+import shutil
+import hashlib
 import datetime
+import itertools
+import contextlib
 from pathlib import Path
+from decimal import Decimal
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 
 
@@ -15,17 +29,86 @@ random.seed(RANDOM_SEED)
 DATA_START = datetime.date(2024, 1, 1)
 DATA_END = datetime.date(2026, 12, 31)
 
+# Масштаб объёма данных (scale factor): GEN_SCALE=10 — в 10 раз больше абонентов и событий.
+# Число сот не масштабируется: сеть остаётся той же, растёт нагрузка на неё.
+GEN_SCALE = float(os.getenv("GEN_SCALE", "1"))
+
 # Объёмы данных
 N_CELLS = 500
-N_SUBSCRIBERS = 8000
-N_USAGE_EVENTS = 550_000
-N_PAYMENTS = 120_000
-N_NETWORK_KPI = 180_000
+N_SUBSCRIBERS = round(8000 * GEN_SCALE)
+N_USAGE_EVENTS = round(550_000 * GEN_SCALE)
+N_PAYMENTS = round(120_000 * GEN_SCALE)
+N_NETWORK_KPI = round(180_000 * GEN_SCALE)
 
 # Папка, куда будут записаны CSV-файлы
-OUT_DIR = Path(__file__).resolve().parent / "data_out"
+OUT_DIR = Path(os.getenv("GEN_OUT_DIR", Path(__file__).resolve().parent / "data_out"))
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Движок генерации фактов usage/payments/network_kpi:
+#   python — построчно на модуле random (по умолчанию, воспроизводит исходный датасет);
+#   numpy  — векторизованно, пакетами по GEN_BATCH строк (нужен пакет numpy). Распределения те же,
+#            но случайные числа другие, поэтому строки не совпадают с режимом python.
+GEN_ENGINE = os.getenv("GEN_ENGINE", "python")
+GEN_BATCH = int(os.getenv("GEN_BATCH", "1000000"))
+
+# Параллельная генерация фактов: GEN_SHARDS > 1 — каждый факт делится на столько шардов (usage_000.csv, ...),
+# шарды генерируются на пуле из GEN_WORKERS процессов. Seed шарда выводится из RANDOM_SEED и номера шарда,
+# поэтому при тех же seed и числе шардов файлы получаются одинаковыми. Справочники и абоненты — как обычно.
+GEN_SHARDS = int(os.getenv("GEN_SHARDS", "1"))
+GEN_WORKERS = int(os.getenv("GEN_WORKERS", str(os.cpu_count() or 1)))
+
+# Куда писать данные:
+#   csv      — CSV-файлы в OUT_DIR (по умолчанию);
+#   postgres — сразу в общие staging-таблицы ETL (tmp_*) через COPY ... FROM STDIN, без файлов на диске
+#              (подключение — как в ETL.py). Затем: ETL_SOURCE=staging python ETL.py
+GEN_TARGET = os.getenv("GEN_TARGET", "csv")
+
+# Сетка сетевых KPI (network_kpi):
+#   sample — N_NETWORK_KPI замеров в случайные пары (сота, час) (по умолчанию, как в исходном датасете);
+#   dense  — полный почасовой ряд: каждая сота в каждый час периода KPI_START..KPI_END
+#            (500 сот x 26 304 часа = ~13 млн строк), N_NETWORK_KPI не используется
+GEN_KPI_GRID = os.getenv("GEN_KPI_GRID", "sample")
+
+# Формат данных:
+#   csv    — текстовый CSV (по умолчанию);
+#   binary — двоичный формат COPY PostgreSQL (PGCOPY): файлы <имя>.pgcopy с колонками в типах staging-таблиц tmp_*,
+#            ETL грузит их через COPY ... WITH (FORMAT binary) без разбора текста на сервере.
+#            С GEN_TARGET=postgres в двоичном формате идёт и прямой COPY в staging
+GEN_FORMAT = os.getenv("GEN_FORMAT", "csv")
+
+# GEN_PARTITION=month — факты (usage, billing, payments, network_kpi) раскладываются по месяцам времени события:
+# usage/2025-04.csv (шарды — usage/2025-04_000.csv), а в OUT_DIR/manifest.json пишется список файлов
+# с числом строк и min/max времени события. ETL грузит их по манифесту (ETL_MANIFEST), в том числе выборочно.
+# Пусто (по умолчанию) — один файл на факт
+GEN_PARTITION = os.getenv("GEN_PARTITION", "")
+
+# Режим работы:
+#   batch  — генерация набора файлов (по умолчанию);
+#   stream — непрерывный поток событий usage и network_kpi в порядке времени события, с заданной скоростью.
+#            Справочники пишутся как обычно (те же, что у batch при тех же seed и GEN_SCALE), факты в файлы не пишутся;
+#   delta  — дневные дельты поверх уже сгенерированного набора в OUT_DIR: OUT_DIR/delta/<ГГГГ-ММ-ДД>/
+#            с новыми и отключёнными абонентами и фактами этого дня (для ETL_MODE=incremental)
+GEN_MODE = os.getenv("GEN_MODE", "batch")
+
+# Дельты: сколько дней сгенерировать за запуск и с какого дня начать (ГГГГ-ММ-ДД). По умолчанию — следующий день
+# после последней дельты в OUT_DIR/delta (или после конца набора DATA_END)
+GEN_DELTA_DAYS = int(os.getenv("GEN_DELTA_DAYS", "1"))
+GEN_DELTA_DAY = os.getenv("GEN_DELTA_DAY", "")
+
+# Потоковый режим:
+#   GEN_STREAM_TO     — куда писать: "-" (stdout), путь к именованному каналу (FIFO, создаётся при отсутствии),
+#                       tcp:host:port или unix:/path/to.sock (подключение к слушающему сокету);
+#   GEN_STREAM_RATE   — событий usage в секунду (> 0: от скорости зависит и шаг времени событий);
+#                       KPI сот идут блоком в начале каждого часа времени событий;
+#   GEN_STREAM_EVENTS — сколько событий usage выдать (0 — пока поток не закроют);
+#   GEN_STREAM_SPEED  — ускорение времени событий (60 — секунда реального времени = минута времени событий);
+#   GEN_STREAM_START  — время первого события (ISO), по умолчанию — текущее
+GEN_STREAM_TO = os.getenv("GEN_STREAM_TO", "-")
+GEN_STREAM_RATE = float(os.getenv("GEN_STREAM_RATE", "1000"))
+GEN_STREAM_EVENTS = int(os.getenv("GEN_STREAM_EVENTS", "0"))
+GEN_STREAM_SPEED = float(os.getenv("GEN_STREAM_SPEED", "1"))
+GEN_STREAM_START = os.getenv("GEN_STREAM_START", "")
+
 
 def rand_id(prefix: str, n: int = 10) -> str:
     # Генерирует случайный идентификатор: PREFIX + (n символов A-Z0-9)
@@ -37,17 +120,35 @@ def rand_msisdn() -> str:
     return "79" + "".join(random.choices(string.digits, k=9))
 
 
-def choice_weighted(items):
-    # Выбор элемента с учётом весов
+class WeightedSampler:
+    # Выбор элемента с учётом весов за O(log n):
+    # накопленные веса считаются один раз при создании, выбор — двоичный поиск (bisect) случайной точки.
     # items = [(value, weight), ...]
-    total = sum(w for _, w in items)
-    r = random.uniform(0, total)
-    upto = 0
-    for v, w in items:
-        if upto + w >= r:
-            return v
-        upto += w
-    return items[-1][0]
+    # Последовательность случайных чисел та же, что у линейного перебора, поэтому при том же seed
+    # выбираются те же элементы.
+    def __init__(self, items):
+        self.values = [v for v, _ in items]
+        self.cum_weights = list(itertools.accumulate(w for _, w in items))
+        self.total = sum(w for _, w in items)
+
+    def draw(self):
+        i = bisect.bisect_left(self.cum_weights, random.uniform(0, self.total))
+        return self.values[i] if i < len(self.values) else self.values[-1]
+
+    def draw_many(self, k: int) -> list:
+        # Пакетный выбор k элементов
+        return [self.draw() for _ in range(k)]
+
+    def share(self, value) -> float:
+        # Доля веса элемента value в общем весе
+        i = self.values.index(value)
+        return (self.cum_weights[i] - (self.cum_weights[i - 1] if i else 0)) / self.total
+
+    def draw_index_array(self, rng, k: int):
+        # Пакетный выбор k индексов элементов на генераторе NumPy (векторизованный режим)
+        np = import_numpy()
+        idx = np.searchsorted(self.cum_weights, rng.random(k) * self.total, side="left")
+        return np.minimum(idx, len(self.values) - 1)
 
 
 def parse_date(x):
@@ -62,16 +163,341 @@ def parse_date(x):
     return datetime.date.fromisoformat(x)
 
 
+def out_path(name):
+    # Путь выходного файла в OUT_DIR для GEN_FORMAT (usage.csv или usage.pgcopy).
+    # Файл того же набора в другом формате удаляем, чтобы ETL не взял данные прошлого запуска
+    csv_path = OUT_DIR / name
+    binary_path = csv_path.with_suffix(".pgcopy")
+    path, other = (binary_path, csv_path) if GEN_FORMAT == "binary" else (csv_path, binary_path)
+    other.unlink(missing_ok=True)
+    return path
+
+
 def write_csv(name, header, rows):
     # Записывает CSV в OUT_DIR с заданным заголовком и строками
     # header — список названий колонок
-    # rows — список списков (строки данных)
-    path = OUT_DIR / name
+    # rows — строки данных: список или генератор (тогда строки пишутся по мере поступления и не копятся в памяти)
+    if is_partitioned(name):
+        write_partitioned(name, header, rows)
+        return
+    if GEN_FORMAT == "binary":
+        write_pgcopy(name, header, rows)
+        return
+    if GEN_TARGET == "postgres":
+        copy_to_staging(name, header, csv_chunks(rows))
+        return
+    path = out_path(name)
+    counter = itertools.count()
     with open(path, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
         w.writerow(header)
-        w.writerows(rows)
-    print(f"Wrote {path} ({len(rows)} rows)")
+        # zip берёт строку, затем очередное число счётчика — после записи счётчик равен числу строк
+        w.writerows(row for row, _ in zip(rows, counter))
+    print(f"Wrote {path} ({next(counter)} rows)")
+
+
+def write_csv_batches(name, header, batches):
+    # Записывает CSV в OUT_DIR пакетами: batches — итератор пакетов, пакет — список колонок
+    # (в памяти держится только текущий пакет).
+    # Значения — коды, ID, даты и числа без запятых и кавычек, поэтому строки собираются join'ом
+    # без csv.writer: так вдвое быстрее.
+    if is_partitioned(name):
+        write_partitioned(name, header, (row for columns in batches for row in zip(*columns)))
+        return
+    if GEN_FORMAT == "binary":
+        write_pgcopy(name, header, (row for columns in batches for row in zip(*columns)))
+        return
+    if GEN_TARGET == "postgres":
+        copy_to_staging(name, header, (batch_text(columns).encode() for columns in batches))
+        return
+    path = out_path(name)
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        f.write(",".join(header) + "\n")
+        for columns in batches:
+            text = batch_text(columns)
+            f.write(text)
+            n += text.count("\n")
+    print(f"Wrote {path} ({n} rows)")
+
+
+def batch_text(columns) -> str:
+    # Пакет колонок -> строки CSV одним текстом
+    columns = [col if col and isinstance(col[0], str) else list(map(str, col)) for col in columns]
+    lines = list(map(",".join, zip(*columns)))
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def csv_chunks(rows, chunk_rows: int = 10_000):
+    # Строки -> куски CSV (bytes) по chunk_rows строк: для COPY без промежуточного файла
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            return
+        w.writerows(chunk)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+
+
+# ---------------------------------------------------------------------------
+# Двоичный формат COPY (GEN_FORMAT=binary): заголовок PGCOPY, строки "число полей + (длина, значение)...", -1 в конце.
+# Значения кодируются в двоичном представлении типов PostgreSQL, поэтому сервер не разбирает текст.
+
+# Типы колонок staging-таблиц tmp_* (в порядке колонок файла)
+PGCOPY_TYPES = {
+    "tariffs": ["text", "text", "text", "bool", "date", "date"],
+    "services": ["text", "text", "text", "bool"],
+    "channels": ["text", "text", "text"],
+    "cell_sites": ["text", "text", "text", "text", "text", "text"],
+    "subscribers": ["text", "text", "text", "text", "text", "date", "date", "text", "text", "text"],
+    "usage": ["text", "timestamp", "text", "text", "text", "text", "int4", "numeric", "numeric", "numeric"],
+    "billing": ["text", "timestamp", "text", "text", "numeric", "text", "text"],
+    "payments": ["text", "timestamp", "text", "text", "numeric", "text", "text"],
+    "network_kpi": ["text", "timestamp", "text", "numeric", "int8", "int8", "int8"],
+}
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+PGCOPY_NULL = struct.pack(">i", -1)
+
+# Даты и время в PGCOPY отсчитываются от 2000-01-01
+PG_EPOCH_ORDINAL = datetime.date(2000, 1, 1).toordinal()
+
+
+def pg_timestamp(v) -> bytes:
+    # timestamp: микросекунды от 2000-01-01 (int64)
+    ts = datetime.datetime.fromisoformat(v) if isinstance(v, str) else v
+    seconds = (ts.toordinal() - PG_EPOCH_ORDINAL) * 86400 + ts.hour * 3600 + ts.minute * 60 + ts.second
+    return struct.pack(">q", seconds * 1_000_000 + ts.microsecond)
+
+
+def pg_date(v) -> bytes:
+    # date: дни от 2000-01-01 (int32)
+    return struct.pack(">i", parse_date(v).toordinal() - PG_EPOCH_ORDINAL)
+
+
+def pg_numeric(v) -> bytes:
+    # numeric: число цифр по основанию 10000, вес первой цифры, знак, число знаков после запятой, цифры.
+    # Берём десятичную запись числа (как в CSV), сервер округляет её до NUMERIC(18,4) так же, как текст
+    sign, digits, exp = Decimal(str(v)).as_tuple()
+    dscale = max(0, -exp)
+    # Выравниваем десятичные цифры по группам из 4 относительно запятой
+    shift = exp % 4
+    text = "".join(map(str, digits)) + "0" * shift
+    exp -= shift
+    text = text.zfill(-(-len(text) // 4) * 4)
+    groups = [int(text[i:i + 4]) for i in range(0, len(text), 4)]
+    weight = len(groups) - 1 + exp // 4
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        sign, weight = 0, 0
+    return struct.pack(f">hhHH{len(groups)}H", len(groups), weight, 0x4000 if sign else 0, dscale, *groups)
+
+
+def pg_bool(v) -> bytes:
+    if isinstance(v, str):
+        v = v.lower() in ("true", "t", "1")
+    return b"\x01" if v else b"\x00"
+
+
+PGCOPY_ENCODERS = {
+    "text": lambda v: str(v).encode(),
+    "bool": pg_bool,
+    "date": pg_date,
+    "timestamp": pg_timestamp,
+    "int4": lambda v: struct.pack(">i", int(v)),
+    "int8": lambda v: struct.pack(">q", int(v)),
+    "numeric": pg_numeric,
+}
+
+
+def pgcopy_types(name: str) -> list[str]:
+    # Типы колонок файла: usage.csv и шард usage_003.csv -> PGCOPY_TYPES["usage"]
+    stem = Path(name).stem
+    return PGCOPY_TYPES.get(stem) or PGCOPY_TYPES[stem.rsplit("_", 1)[0]]
+
+
+def pgcopy_encoder(name):
+    # Функция "строка -> запись PGCOPY (bytes)" для файла name.
+    # Пустая строка, как и в CSV (NULL ''), означает NULL
+    encoders = [PGCOPY_ENCODERS[t] for t in pgcopy_types(name)]
+    field_count = struct.pack(">h", len(encoders))
+
+    def encode(row):
+        parts = [field_count]
+        for enc, v in zip(encoders, row):
+            if v is None or v == "":
+                parts.append(PGCOPY_NULL)
+            else:
+                data = enc(v)
+                parts.append(struct.pack(">i", len(data)))
+                parts.append(data)
+        return b"".join(parts)
+
+    return encode
+
+
+def pgcopy_chunks(name, rows, chunk_rows: int = 10_000):
+    # Строки -> куски файла PGCOPY (bytes) по chunk_rows строк, с заголовком и завершающим маркером
+    encode = pgcopy_encoder(name)
+    yield PGCOPY_HEADER
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            break
+        yield b"".join(map(encode, chunk))
+    yield PGCOPY_TRAILER
+
+
+def write_pgcopy(name, header, rows):
+    # GEN_FORMAT=binary: файл <имя>.pgcopy в OUT_DIR или (GEN_TARGET=postgres) COPY ... FORMAT binary в staging.
+    # Заголовка с именами колонок в PGCOPY нет — колонки идут в порядке header
+    counter = itertools.count()
+    chunks = pgcopy_chunks(name, (row for row, _ in zip(rows, counter)))
+    if GEN_TARGET == "postgres":
+        copy_to_staging(name, header, chunks, binary=True)
+        return
+    path = out_path(name)
+    with open(path, "wb") as f:
+        f.writelines(chunks)
+    print(f"Wrote {path} ({next(counter)} rows)")
+
+
+# ---------------------------------------------------------------------------
+# Помесячные файлы фактов (GEN_PARTITION=month) и манифест
+
+# Описания записанных помесячных файлов: {"table", "month", "path", "rows", "min_ts", "max_ts"}.
+# Шарды возвращают свои описания из процессов пула, итог пишет write_manifest
+PARTITIONS = []
+
+
+def is_partitioned(name: str) -> bool:
+    # Факт (или шард факта) при GEN_PARTITION=month раскладывается по месяцам
+    if GEN_PARTITION != "month":
+        return False
+    stem = Path(name).stem
+    return stem in FACT_FILES or stem.rsplit("_", 1)[0] in FACT_FILES
+
+
+def write_partitioned(name, header, rows):
+    # Раскладываем строки факта по файлам месяцев: <факт>/<ГГГГ-ММ>.csv, у шарда — <факт>/<ГГГГ-ММ>_<NNN>.csv.
+    # Месяц берётся из времени события (вторая колонка у всех фактов). Строки идут вперемешку по времени,
+    # поэтому файлы всех месяцев открыты одновременно (36 файлов на 2024–2026)
+    stem = Path(name).stem
+    table, shard = (stem, "") if stem in FACT_FILES else (stem.rsplit("_", 1)[0], "_" + stem.rsplit("_", 1)[1])
+    binary = GEN_FORMAT == "binary"
+    part_dir = OUT_DIR / table
+    part_dir.mkdir(exist_ok=True)
+    encode = pgcopy_encoder(name) if binary else None
+
+    parts = {}
+    try:
+        for row in rows:
+            ts = str(row[1])
+            month = ts[:7]
+            part = parts.get(month)
+            if part is None:
+                path = part_dir / f"{month}{shard}{'.pgcopy' if binary else '.csv'}"
+                f = open(path, "wb") if binary else open(path, "w", newline="", encoding="utf-8")
+                part = parts[month] = {"path": path, "f": f, "rows": 0, "min_ts": ts, "max_ts": ts}
+                if binary:
+                    f.write(PGCOPY_HEADER)
+                else:
+                    part["writer"] = csv.writer(f)
+                    part["writer"].writerow(header)
+            if binary:
+                part["f"].write(encode(row))
+            else:
+                part["writer"].writerow(row)
+            part["rows"] += 1
+            part["min_ts"] = min(part["min_ts"], ts)
+            part["max_ts"] = max(part["max_ts"], ts)
+    finally:
+        for part in parts.values():
+            if binary:
+                part["f"].write(PGCOPY_TRAILER)
+            part["f"].close()
+
+    for month, part in sorted(parts.items()):
+        PARTITIONS.append({
+            "table": table, "month": month, "path": part["path"].relative_to(OUT_DIR).as_posix(),
+            "rows": part["rows"], "min_ts": part["min_ts"], "max_ts": part["max_ts"],
+        })
+    print(f"Wrote {part_dir}/ ({len(parts)} months, {sum(p['rows'] for p in parts.values())} rows)")
+
+
+def write_manifest():
+    # manifest.json: формат и параметры генерации, список помесячных файлов (пути — относительно OUT_DIR)
+    path = OUT_DIR / "manifest.json"
+    manifest = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "format": GEN_FORMAT,
+        "seed": RANDOM_SEED,
+        "scale": GEN_SCALE,
+        "shards": GEN_SHARDS,
+        "partitions": sorted(PARTITIONS, key=lambda p: (p["table"], p["month"], p["path"])),
+    }
+    path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Wrote {path} ({len(PARTITIONS)} partitions)")
+
+
+def import_etl():
+    # ETL.py (и psycopg2) нужен только для GEN_TARGET=postgres
+    import ETL
+    return ETL
+
+
+def staging_table(etl, name: str) -> str:
+    # Staging-таблица ETL для файла: usage.csv и шард usage_003.csv -> tmp_usage
+    tables = {Path(filename).stem: table for table, filename, _ in etl.STAGING}
+    stem = Path(name).stem
+    return tables.get(stem) or tables[stem.rsplit("_", 1)[0]]
+
+
+def prepare_staging():
+    # GEN_TARGET=postgres: создаём (или очищаем) общие UNLOGGED staging-таблицы ETL
+    etl = import_etl()
+    conn = etl.get_conn()
+    try:
+        with conn.cursor() as cur:
+            etl.create_temp_tables(cur, shared=True)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def copy_to_staging(name, header, chunks, binary=False):
+    # GEN_TARGET=postgres: данные идут сразу в COPY ... FROM STDIN staging-таблицы ETL.
+    # COPY читает куски по мере генерации, поэтому генерация и загрузка идут одновременно;
+    # шарды (GEN_SHARDS) копируются параллельно из своих процессов, каждый на своём соединении.
+    etl = import_etl()
+    table = staging_table(etl, name)
+    conn = etl.get_conn()
+    try:
+        with conn.cursor() as cur:
+            rows, _ = etl.copy_lines(cur, table, header, chunks, name, binary=binary)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Copied {name} -> {table} ({rows} rows)")
+
+
+def import_numpy():
+    # numpy нужен только для GEN_ENGINE=numpy
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Для GEN_ENGINE=numpy нужен пакет numpy: pip install numpy") from None
+    return numpy
 
 
 def month_iter(start_month: datetime.date, end_month: datetime.date):
@@ -96,9 +522,12 @@ HOUR_WEIGHTS = [
 ]
 
 
+HOUR_SAMPLER = WeightedSampler(HOUR_WEIGHTS)
+
+
 def weighted_hour():
     # Возвращает час суток с учётом весов (пиковая активность вечером)
-    return choice_weighted([(h, w) for h, w in HOUR_WEIGHTS])
+    return HOUR_SAMPLER.draw()
 
 
 # Сезонность по месяцам (пример: декабрь выше из-за праздников, лето выше и т.д.)
@@ -110,10 +539,19 @@ MONTH_WEIGHTS = {
 # Тренд по годам: 2024 ниже, 2025 база, 2026 выше (рост бизнеса/трафика)
 YEAR_TREND = {2024: 0.85, 2025: 1.00, 2026: 1.20}
 
+# Распределение событий по годам и месяцам (для pick_weighted_date)
+YEAR_SAMPLER = WeightedSampler([(2024, 25), (2025, 33), (2026, 42)])
+MONTH_SAMPLER = WeightedSampler([(m, int(MONTH_WEIGHTS[m] * 100)) for m in range(1, 13)])
+
+
+def trend(year: int) -> float:
+    # Тренд года; после последнего года набора (дельты GEN_MODE=delta) остаётся на его уровне
+    return YEAR_TREND.get(year, YEAR_TREND[max(YEAR_TREND)])
+
 
 def time_factor(ts: datetime.datetime) -> float:
     # Мультипликатор времени: сезонность (месяц) * тренд (год)
-    return MONTH_WEIGHTS.get(ts.month, 1.0) * YEAR_TREND.get(ts.year, 1.0)
+    return MONTH_WEIGHTS.get(ts.month, 1.0) * trend(ts.year)
 
 
 # География
@@ -182,6 +620,9 @@ SEGMENT_SERVICE_MIX = {
 # Интенсивность потребления по сегментам (для объёма событий/трафика/выручки)
 SEGMENT_INTENSITY = {"Mass": 1.0, "Youth": 1.2, "Premium": 1.7, "Business": 2.0}
 
+# Вероятность оттока абонента по сегментам (у Youth выше, у Business ниже)
+SEGMENT_CHURN = {"Mass": 0.18, "Youth": 0.24, "Premium": 0.12, "Business": 0.08}
+
 # Вероятностное распределение тарифов по сегментам
 SEGMENT_TARIFFS = {
     "Youth":    [("T07", 55), ("T01", 25), ("T04", 15), ("T08", 5)],
@@ -225,6 +666,11 @@ def gen_channels():
     )
 
 
+# Заголовки справочников, которые пишут и пакетная генерация, и дневные дельты
+CELL_HEADER = ["cell_id","country","region","city","technology","site_name"]
+SUBSCRIBER_HEADER = ["subscriber_id","msisdn","customer_type","segment","status","activation_date","deactivation_date","country","region","city"]
+
+
 def gen_cells(n_cells=N_CELLS):
     # Генерирует cell_sites.csv (справочник сот/базовых станций)
     # Используем разные доли 3G/4G/5G в разных регионах
@@ -236,21 +682,27 @@ def gen_cells(n_cells=N_CELLS):
         "Krasnodar Krai": [("5G", 6), ("4G", 74), ("3G", 20)],
     }
 
+    tech_samplers = {region: WeightedSampler(items) for region, items in tech_by_region.items()}
+
     rows = []
     for i in range(1, n_cells + 1):
         region, cities = random.choice(REGIONS)
         city = random.choice(cities)
-        tech = choice_weighted(tech_by_region[region])
+        tech = tech_samplers[region].draw()
         cell_id = f"CELL_{i:05d}"
         site_name = f"Site {region[:3].upper()}-{i:05d}"
         rows.append([cell_id, COUNTRY, region, city, tech, site_name])
 
     write_csv(
         "cell_sites.csv",
-        ["cell_id","country","region","city","technology","site_name"],
+        CELL_HEADER,
         rows
     )
 
+    return index_cells(rows)
+
+
+def index_cells(rows):
     # region_cells: список сот по каждому региону (для реалистичной привязки событий usage)
     # cell_tech: технология по каждой соте (для генерации сетевых KPI)
     region_cells = defaultdict(list)
@@ -276,25 +728,31 @@ def gen_subscribers(n=N_SUBSCRIBERS):
     end = DATA_END
     total_days = (end - start).days
 
+    segments = WeightedSampler(SEGMENTS)
+    cust_types = WeightedSampler(CUST_TYPES)
+    business_types = WeightedSampler([("B2B", 85), ("B2C_postpaid", 15)])
+    statuses = WeightedSampler(SUB_STATUS)
+    segment_tariffs = {seg: WeightedSampler(items) for seg, items in SEGMENT_TARIFFS.items()}
+
     for i in range(1, n + 1):
         subscriber_id = f"SUB_{i:07d}"
         msisdn = rand_msisdn()
 
-        segment = choice_weighted(SEGMENTS)
+        segment = segments.draw()
 
         # Для бизнес-сегмента выше шанс B2B
         if segment == "Business":
-            customer_type = choice_weighted([("B2B", 85), ("B2C_postpaid", 15)])
+            customer_type = business_types.draw()
         else:
-            customer_type = choice_weighted(CUST_TYPES)
+            customer_type = cust_types.draw()
 
-        status = choice_weighted(SUB_STATUS)
+        status = statuses.draw()
 
         # Случайная дата активации
         act = start + datetime.timedelta(days=random.randint(0, total_days))
 
         # Вероятность churn зависит от сегмента (у Youth выше, у Business ниже)
-        churn_prob = {"Mass": 0.18, "Youth": 0.24, "Premium": 0.12, "Business": 0.08}[segment]
+        churn_prob = SEGMENT_CHURN[segment]
         deact = ""
         deact_dt = None
         if random.random() < churn_prob:
@@ -308,7 +766,7 @@ def gen_subscribers(n=N_SUBSCRIBERS):
         city = random.choice(cities)
 
         # Тариф выбираем с учётом сегмента
-        tariff = choice_weighted(SEGMENT_TARIFFS[segment])
+        tariff = segment_tariffs[segment].draw()
 
         rows.append([
             subscriber_id, msisdn, customer_type, segment, status,
@@ -319,6 +777,7 @@ def gen_subscribers(n=N_SUBSCRIBERS):
         # Сохраняем профиль для генерации фактов (usage/billing/payments)
         sub_ids.append(subscriber_id)
         profiles[subscriber_id] = {
+            "msisdn": msisdn,
             "segment": segment,
             "customer_type": customer_type,
             "status": status,
@@ -331,7 +790,7 @@ def gen_subscribers(n=N_SUBSCRIBERS):
 
     write_csv(
         "subscribers.csv",
-        ["subscriber_id","msisdn","customer_type","segment","status","activation_date","deactivation_date","country","region","city"],
+        SUBSCRIBER_HEADER,
         rows
     )
     return sub_ids, profiles
@@ -350,18 +809,18 @@ def is_active(profile, ts: datetime.datetime) -> bool:
 def pick_weighted_date():
     # Выбор даты с учётом распределения по годам и сезонности по месяцам.
     # День ограничен 1..28, чтобы избежать проблем с разным числом дней в месяце.
-    year = choice_weighted([(2024, 25), (2025, 33), (2026, 42)])
-    month = choice_weighted([(m, int(MONTH_WEIGHTS[m] * 100)) for m in range(1, 13)])
+    year = YEAR_SAMPLER.draw()
+    month = MONTH_SAMPLER.draw()
     day = random.randint(1, 28)
     return datetime.date(year, month, day)
 
 
-def gen_usage(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS):
-    # Генерирует usage.csv (события потребления: VOICE/SMS/DATA)
-    rows = []
+def usage_rows(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS):
+    # Строки usage.csv по одной (генератор)
 
     # Взвешиваем абонентов по интенсивности сегмента (Business/Premium дадут больше событий)
-    weighted_subs = [(sid, SEGMENT_INTENSITY[profiles[sid]["segment"]]) for sid in sub_ids]
+    weighted_subs = WeightedSampler([(sid, SEGMENT_INTENSITY[profiles[sid]["segment"]]) for sid in sub_ids])
+    service_mix = {seg: WeightedSampler(items) for seg, items in SEGMENT_SERVICE_MIX.items()}
 
     for _ in range(n_events):
         event_id = rand_id("U_", 14)
@@ -373,104 +832,116 @@ def gen_usage(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS):
         ts = datetime.datetime(d.year, d.month, d.day, h, minute, 0)
 
         # Выбираем абонента с учётом интенсивности
-        sub = choice_weighted(weighted_subs)
-        prof = profiles[sub]
-
-        # Если событие выпадает на неактивного абонента
-        if not is_active(prof, ts):
-            if random.random() < 0.75:
-                continue
-
-        segment = prof["segment"]
-        tariff = prof["tariff"]
-        service = choice_weighted(SEGMENT_SERVICE_MIX[segment])
-
-        # Привязка к соте
-        if random.random() < 0.8 and region_cells[prof["region"]]:
-            cell = random.choice(region_cells[prof["region"]])
-        else:
-            any_region = random.choice(list(region_cells.keys()))
-            cell = random.choice(region_cells[any_region])
-
-        # Мультипликатор интенсивности: сегмент * сезонность * тренд
-        intensity = SEGMENT_INTENSITY[segment] * time_factor(ts)
-
-        # Тарифные ставки
-        pricing = TARIFF_PRICING[tariff]
-
-        # Генерация показателей и выручки зависит от типа услуги
-        if service == "VOICE":
-            base = random.randint(20, 600)
-            if segment in ("Business", "Premium"):
-                base = int(base * random.uniform(1.2, 1.9))
-            duration = min(base, 1800)
-            traffic_mb = 0
-            units = 1
-            voice_rate = random.uniform(*pricing["voice_min"])
-            revenue = round((duration / 60) * voice_rate * intensity, 4)
-
-        elif service == "SMS":
-            duration = 0
-            traffic_mb = 0
-            units = random.choice([1, 1, 2, 2, 3, 5 if segment == "Business" else 2])
-            sms_rate = random.uniform(*pricing["sms"])
-            revenue = round(units * sms_rate * (0.9 + 0.25 * random.random()), 4)
-
-        else:
-            duration = 0
-
-            # База трафика
-            base_mb = random.expovariate(1/80) + random.uniform(0, 12)
-
-            # Усиливаем трафик для некоторых сегментов
-            if segment == "Youth":
-                base_mb *= random.uniform(1.3, 1.9)
-            elif segment == "Premium":
-                base_mb *= random.uniform(1.4, 2.2)
-            elif segment == "Business":
-                base_mb *= random.uniform(1.2, 2.0)
-
-            # Пики нагрузки вечером и спад ночью
-            if 18 <= h <= 23:
-                base_mb *= random.uniform(1.15, 1.6)
-            if 0 <= h <= 5:
-                base_mb *= random.uniform(0.6, 0.85)
-
-            traffic_mb = round(base_mb * intensity, 4)
-            units = traffic_mb
-            data_rate = random.uniform(*pricing["data_mb"])
-
-            # Пример промо-эффекта: в апреле 2025 цена ниже (или скидка)
-            promo = 0.85 if (ts.year == 2025 and ts.month == 4) else 1.0
-            revenue = round(traffic_mb * data_rate * promo, 4)
-
-        rows.append([
-            event_id, ts.isoformat(sep=" "), sub, tariff, service, cell,
-            duration, traffic_mb, units, revenue
-        ])
-
+        sub = weighted_subs.draw()
+        row = usage_event(event_id, ts, sub, profiles[sub], service_mix, region_cells)
+        if row is not None:
+            yield row
+
+
+def usage_event(event_id, ts, sub, prof, service_mix, region_cells):
+    # Событие usage абонента sub в момент ts: услуга, сота, показатели и выручка по тарифу и сегменту.
+    # None — абонент неактивен на дату события и событие отброшено
+    h = ts.hour
+
+    # Если событие выпадает на неактивного абонента
+    if not is_active(prof, ts):
+        if random.random() < 0.75:
+            return None
+
+    segment = prof["segment"]
+    tariff = prof["tariff"]
+    service = service_mix[segment].draw()
+
+    # Привязка к соте
+    if random.random() < 0.8 and region_cells[prof["region"]]:
+        cell = random.choice(region_cells[prof["region"]])
+    else:
+        any_region = random.choice(list(region_cells.keys()))
+        cell = random.choice(region_cells[any_region])
+
+    # Мультипликатор интенсивности: сегмент * сезонность * тренд
+    intensity = SEGMENT_INTENSITY[segment] * time_factor(ts)
+
+    # Тарифные ставки
+    pricing = TARIFF_PRICING[tariff]
+
+    # Генерация показателей и выручки зависит от типа услуги
+    if service == "VOICE":
+        base = random.randint(20, 600)
+        if segment in ("Business", "Premium"):
+            base = int(base * random.uniform(1.2, 1.9))
+        duration = min(base, 1800)
+        traffic_mb = 0
+        units = 1
+        voice_rate = random.uniform(*pricing["voice_min"])
+        revenue = round((duration / 60) * voice_rate * intensity, 4)
+
+    elif service == "SMS":
+        duration = 0
+        traffic_mb = 0
+        units = random.choice([1, 1, 2, 2, 3, 5 if segment == "Business" else 2])
+        sms_rate = random.uniform(*pricing["sms"])
+        revenue = round(units * sms_rate * (0.9 + 0.25 * random.random()), 4)
+
+    else:
+        duration = 0
+
+        # База трафика
+        base_mb = random.expovariate(1/80) + random.uniform(0, 12)
+
+        # Усиливаем трафик для некоторых сегментов
+        if segment == "Youth":
+            base_mb *= random.uniform(1.3, 1.9)
+        elif segment == "Premium":
+            base_mb *= random.uniform(1.4, 2.2)
+        elif segment == "Business":
+            base_mb *= random.uniform(1.2, 2.0)
+
+        # Пики нагрузки вечером и спад ночью
+        if 18 <= h <= 23:
+            base_mb *= random.uniform(1.15, 1.6)
+        if 0 <= h <= 5:
+            base_mb *= random.uniform(0.6, 0.85)
+
+        traffic_mb = round(base_mb * intensity, 4)
+        units = traffic_mb
+        data_rate = random.uniform(*pricing["data_mb"])
+
+        # Пример промо-эффекта: в апреле 2025 цена ниже (или скидка)
+        promo = 0.85 if (ts.year == 2025 and ts.month == 4) else 1.0
+        revenue = round(traffic_mb * data_rate * promo, 4)
+
+    return [
+        event_id, ts.isoformat(sep=" "), sub, tariff, service, cell,
+        duration, traffic_mb, units, revenue
+    ]
+
+
+def gen_usage(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS, name="usage.csv"):
+    # Генерирует usage.csv (события потребления: VOICE/SMS/DATA)
+    # Строки пишутся на диск по мере генерации — память не растёт с объёмом данных
     write_csv(
-        "usage.csv",
+        name,
         ["event_id","event_ts","subscriber_id","tariff_code","service_code","cell_id","call_duration_sec","traffic_mb","units","revenue_amount"],
-        rows
+        usage_rows(sub_ids, profiles, region_cells, n_events)
     )
 
 
-def gen_billing(sub_ids, profiles):
-    # Генерирует billing.csv (начисления: monthly_fee + скидки + корректировки)
-    rows = []
+# Базовые диапазоны абонплаты по тарифам
+TARIFF_FEE = {
+    "T01": (300, 550),
+    "T02": (350, 650),
+    "T03": (450, 850),
+    "T04": (500, 900),
+    "T05": (900, 1700),
+    "T06": (1200, 2600),
+    "T07": (250, 520),
+    "T08": (200, 420),
+}
 
-    # Базовые диапазоны абонплаты по тарифам
-    tariff_fee = {
-        "T01": (300, 550),
-        "T02": (350, 650),
-        "T03": (450, 850),
-        "T04": (500, 900),
-        "T05": (900, 1700),
-        "T06": (1200, 2600),
-        "T07": (250, 520),
-        "T08": (200, 420),
-    }
+
+def billing_rows(sub_ids, profiles):
+    # Строки billing.csv по одной (генератор)
 
     # Проходим по каждому месяцу и начисляем активным абонентам платежи/скидки/корректировки
     for m in month_iter(datetime.date(2024, 1, 1), datetime.date(2026, 12, 1)):
@@ -479,56 +950,62 @@ def gen_billing(sub_ids, profiles):
             if not is_active(prof, datetime.datetime(m.year, m.month, 1, 0, 0, 0)):
                 continue
 
-            tariff = prof["tariff"]
-            seg = prof["segment"]
-
             billing_id = rand_id("B_", 14)
             ts = datetime.datetime(m.year, m.month, random.randint(1, 5), random.randint(0, 23), 0, 0)
-
-            # Месячная абонплата зависит от тарифа, сегмента и годового тренда
-            base_fee = random.uniform(*tariff_fee[tariff])
-            seg_mult = {"Mass": 1.0, "Youth": 0.9, "Premium": 1.4, "Business": 1.7}[seg]
-            amt = round(base_fee * seg_mult * YEAR_TREND.get(m.year, 1.0), 4)
-
-            rows.append([billing_id, ts.isoformat(sep=" "), sid, tariff, amt, "monthly_fee", "Monthly subscription fee"])
-
-            # Вероятность скидки по сегментам + сезонное усиление летом
-            disc_prob = {"Mass": 0.12, "Youth": 0.18, "Premium": 0.06, "Business": 0.03}[seg]
-            if m.month in (6, 7, 8):
-                disc_prob *= 1.25
-            if random.random() < disc_prob:
-                rows.append([
-                    rand_id("B_", 14), ts.isoformat(sep=" "), sid, tariff,
-                    round(-random.uniform(30, 280), 4),
-                    "discount", "Promotional discount"
-                ])
-
-            # Небольшая вероятность корректировки
-            if random.random() < 0.05:
-                rows.append([
-                    rand_id("B_", 14), ts.isoformat(sep=" "), sid, tariff,
-                    round(random.uniform(-150, 150), 4),
-                    "adjustment", "Billing adjustment"
-                ])
-
+            yield from billing_month_rows(billing_id, ts, sid, prof)
+
+
+def billing_month_rows(billing_id, ts, sid, prof):
+    # Начисления абонента за месяц в момент ts: абонплата, иногда скидка и корректировка
+    tariff = prof["tariff"]
+    seg = prof["segment"]
+
+    # Месячная абонплата зависит от тарифа, сегмента и годового тренда
+    base_fee = random.uniform(*TARIFF_FEE[tariff])
+    seg_mult = {"Mass": 1.0, "Youth": 0.9, "Premium": 1.4, "Business": 1.7}[seg]
+    amt = round(base_fee * seg_mult * trend(ts.year), 4)
+
+    yield [billing_id, ts.isoformat(sep=" "), sid, tariff, amt, "monthly_fee", "Monthly subscription fee"]
+
+    # Вероятность скидки по сегментам + сезонное усиление летом
+    disc_prob = {"Mass": 0.12, "Youth": 0.18, "Premium": 0.06, "Business": 0.03}[seg]
+    if ts.month in (6, 7, 8):
+        disc_prob *= 1.25
+    if random.random() < disc_prob:
+        yield [
+            rand_id("B_", 14), ts.isoformat(sep=" "), sid, tariff,
+            round(-random.uniform(30, 280), 4),
+            "discount", "Promotional discount"
+        ]
+
+    # Небольшая вероятность корректировки
+    if random.random() < 0.05:
+        yield [
+            rand_id("B_", 14), ts.isoformat(sep=" "), sid, tariff,
+            round(random.uniform(-150, 150), 4),
+            "adjustment", "Billing adjustment"
+        ]
+
+
+def gen_billing(sub_ids, profiles, name="billing.csv"):
+    # Генерирует billing.csv (начисления: monthly_fee + скидки + корректировки)
     write_csv(
-        "billing.csv",
+        name,
         ["billing_id","op_ts","subscriber_id","tariff_code","amount","charge_type","description"],
-        rows
+        billing_rows(sub_ids, profiles)
     )
 
 
-def gen_payments(sub_ids, profiles, n_rows=N_PAYMENTS):
-    # Генерирует payments.csv (платежи абонентов)
-    rows = []
+def payment_rows(sub_ids, profiles, n_rows=N_PAYMENTS):
+    # Строки payments.csv по одной (генератор)
 
     # Случайное распределение по всей временной шкале 2024-2026
     start_ts = datetime.datetime(2024, 1, 1)
     end_ts = datetime.datetime(2026, 12, 31, 23, 59, 0)
     seconds_range = int((end_ts - start_ts).total_seconds())
 
-    methods = [("card", 52), ("bank_transfer", 18), ("cash", 10), ("e_wallet", 20)]
-    statuses = [("SUCCESS", 95), ("FAILED", 5)]
+    methods = WeightedSampler([("card", 52), ("bank_transfer", 18), ("cash", 10), ("e_wallet", 20)])
+    statuses = WeightedSampler([("SUCCESS", 95), ("FAILED", 5)])
     channel_codes = [c[0] for c in CHANNELS]
 
     for _ in range(n_rows):
@@ -537,108 +1014,977 @@ def gen_payments(sub_ids, profiles, n_rows=N_PAYMENTS):
         ts = ts.replace(second=0, microsecond=0)
 
         sid = random.choice(sub_ids)
-        prof = profiles[sid]
-        seg = prof["segment"]
-        ctype = prof["customer_type"]
-
-        channel = random.choice(channel_codes)
-        method = choice_weighted(methods)
-        status = choice_weighted(statuses)
-
-        # Суммы платежей зависят от сегмента (Business платит больше, Youth меньше)
-        if seg == "Business":
-            base = random.choice([1500, 2000, 3000, 5000, 8000])
-        elif seg == "Premium":
-            base = random.choice([800, 1200, 1500, 2000, 3000])
-        elif seg == "Youth":
-            base = random.choice([200, 300, 500, 800, 1000])
-        else:
-            base = random.choice([300, 500, 800, 1000, 1500])
+        yield payment_event(pid, ts, sid, profiles[sid], channel_codes, methods, statuses)
+
+
+def payment_event(pid, ts, sid, prof, channel_codes, methods, statuses):
+    # Платёж абонента sid в момент ts: канал, способ, статус и сумма по сегменту и типу клиента
+    seg = prof["segment"]
+    ctype = prof["customer_type"]
+
+    channel = random.choice(channel_codes)
+    method = methods.draw()
+    status = statuses.draw()
 
-        # Для prepaid чаще маленькие пополнения
-        if "prepaid" in ctype and random.random() < 0.6:
-            base = random.choice([100, 200, 300, 500])
+    # Суммы платежей зависят от сегмента (Business платит больше, Youth меньше)
+    if seg == "Business":
+        base = random.choice([1500, 2000, 3000, 5000, 8000])
+    elif seg == "Premium":
+        base = random.choice([800, 1200, 1500, 2000, 3000])
+    elif seg == "Youth":
+        base = random.choice([200, 300, 500, 800, 1000])
+    else:
+        base = random.choice([300, 500, 800, 1000, 1500])
 
-        amount = round(base * random.uniform(0.85, 1.20) * YEAR_TREND.get(ts.year, 1.0), 4)
+    # Для prepaid чаще маленькие пополнения
+    if "prepaid" in ctype and random.random() < 0.6:
+        base = random.choice([100, 200, 300, 500])
 
-        rows.append([pid, ts.isoformat(sep=" "), sid, channel, amount, method, status])
+    amount = round(base * random.uniform(0.85, 1.20) * trend(ts.year), 4)
 
+    return [pid, ts.isoformat(sep=" "), sid, channel, amount, method, status]
+
+
+def gen_payments(sub_ids, profiles, n_rows=N_PAYMENTS, name="payments.csv"):
+    # Генерирует payments.csv (платежи абонентов)
     write_csv(
-        "payments.csv",
+        name,
         ["payment_id","payment_ts","subscriber_id","channel_code","amount","payment_method","status"],
-        rows
+        payment_rows(sub_ids, profiles, n_rows)
     )
 
 
-def gen_network_kpi(cell_ids, cell_tech, n_rows=N_NETWORK_KPI):
-    # Генерирует network_kpi.csv (сетевые KPI по соте и часу)
-    rows = []
+# Период сетевых KPI: почасовые замеры с начала 2024 по конец 2026
+KPI_START = datetime.datetime(2024, 1, 1, 0, 0, 0)
+KPI_END = datetime.datetime(2026, 12, 31, 23, 0, 0)
+KPI_HOURS = int((KPI_END - KPI_START).total_seconds() // 3600)
 
-    start_ts = datetime.datetime(2024, 1, 1, 0, 0, 0)
-    end_ts = datetime.datetime(2026, 12, 31, 23, 0, 0)
-    hours_range = int((end_ts - start_ts).total_seconds() // 3600)
 
-    # Формируем набор "проблемных" сот и временные окна аварий (outage), чтобы были аномалии на графиках
-    outage_cells = set(random.sample(cell_ids, k=max(12, len(cell_ids)//45)))
+def gen_outage_windows(cell_ids):
+    # Формируем набор "проблемных" сот и временные окна аварий (outage), чтобы были аномалии на графиках:
+    # [(cell_id, первый час, последний час), ...] — часы отсчитываются от KPI_START.
+    # random.sample уже возвращает разные соты, поэтому порядок не зависит от хэширования строк (set)
     outage_windows = []
-    for c in outage_cells:
-        start_h = random.randint(0, hours_range - 96)
+    for c in random.sample(cell_ids, k=max(12, len(cell_ids)//45)):
+        start_h = random.randint(0, KPI_HOURS - 96)
         outage_windows.append((c, start_h, start_h + random.randint(8, 48)))
+    return outage_windows
+
+
+def index_outage_windows(outage_windows):
+    # Индекс окон аварий по сотам: {cell_id: (начала, концы)} — интервалы соты, отсортированные по началу;
+    # пересекающиеся и соседние окна одной соты сливаются, поэтому час попадает не больше чем в один интервал
+    by_cell = defaultdict(list)
+    for c, s, e in outage_windows:
+        by_cell[c].append((s, e))
+
+    index = {}
+    for c, windows in by_cell.items():
+        starts, ends = [], []
+        for s, e in sorted(windows):
+            if ends and s <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], e)
+            else:
+                starts.append(s)
+                ends.append(e)
+        index[c] = (starts, ends)
+    return index
+
+
+def in_outage(outage_index, cell, hour_idx: int) -> bool:
+    # Попадает ли час hour_idx соты cell в окно аварии: бинарный поиск по началам интервалов соты
+    windows = outage_index.get(cell)
+    if windows is None:
+        return False
+    starts, ends = windows
+    i = bisect.bisect_right(starts, hour_idx) - 1
+    return i >= 0 and hour_idx <= ends[i]
 
-    # Параметры качества для разных технологий: 3G хуже, 5G лучше
-    tech_quality = {
-        "3G": {"succ": (0.90, 0.98), "traffic": (180, 800)},
-        "4G": {"succ": (0.94, 0.995), "traffic": (350, 1300)},
-        "5G": {"succ": (0.96, 0.998), "traffic": (550, 2000)},
-    }
+
+# Параметры качества для разных технологий: 3G хуже, 5G лучше
+TECH_QUALITY = {
+    "3G": {"succ": (0.90, 0.98), "traffic": (180, 800)},
+    "4G": {"succ": (0.94, 0.995), "traffic": (350, 1300)},
+    "5G": {"succ": (0.96, 0.998), "traffic": (550, 2000)},
+}
+
+
+def kpi_row(kid, hour_idx, cell, tech, outage_index):
+    # Строка network_kpi: замер соты cell (технология tech) в час hour_idx от KPI_START
+    ts = KPI_START + datetime.timedelta(hours=hour_idx)
+
+    # Суточные пики: вечером выше попыток и трафика, ночью ниже
+    peak_mult = 1.0
+    if 18 <= ts.hour <= 23:
+        peak_mult = random.uniform(1.15, 1.55)
+    elif 0 <= ts.hour <= 5:
+        peak_mult = random.uniform(0.55, 0.85)
+
+    # Попытки вызовов растут с годом (trend) и с пиками (peak_mult)
+    attempts = int(random.randint(90, 950) * peak_mult * trend(ts.year))
+
+    # Базовый процент успешности зависит от технологии
+    succ_low, succ_high = TECH_QUALITY[tech]["succ"]
+    succ_rate = random.uniform(succ_low, succ_high)
+
+    # Если попали в окно аварии — ухудшаем успешность
+    if in_outage(outage_index, cell, hour_idx):
+        succ_rate *= random.uniform(0.65, 0.88)
+
+    successes = int(attempts * succ_rate)
+    drops = max(0, int((attempts - successes) * random.uniform(0.35, 0.95)))
+
+    # Трафик зависит от технологии + сезонности + тренда + суточного пика
+    tr_low, tr_high = TECH_QUALITY[tech]["traffic"]
+    traffic_mb = random.uniform(tr_low, tr_high) * peak_mult
+    traffic_mb *= MONTH_WEIGHTS.get(ts.month, 1.0) * trend(ts.year)
+    traffic_mb = round(traffic_mb, 4)
+
+    return [kid, ts.isoformat(sep=" "), cell, traffic_mb, attempts, successes, drops]
+
+
+def network_kpi_rows(cell_ids, cell_tech, n_rows=N_NETWORK_KPI, outage_windows=None):
+    # Строки network_kpi.csv по одной (генератор): замеры в случайные пары (сота, час)
+    # outage_windows — окна аварий (общие для всех шардов); если не заданы, формируются здесь
+    if outage_windows is None:
+        outage_windows = gen_outage_windows(cell_ids)
+    outage_index = index_outage_windows(outage_windows)
 
     for _ in range(n_rows):
         kid = rand_id("K_", 14)
-        hour_idx = random.randint(0, hours_range)
-        ts = start_ts + datetime.timedelta(hours=hour_idx)
-        ts = ts.replace(minute=0, second=0, microsecond=0)
-
+        hour_idx = random.randint(0, KPI_HOURS)
         cell = random.choice(cell_ids)
-        tech = cell_tech[cell]
-
-        # Суточные пики: вечером выше попыток и трафика, ночью ниже
-        peak_mult = 1.0
-        if 18 <= ts.hour <= 23:
-            peak_mult = random.uniform(1.15, 1.55)
-        elif 0 <= ts.hour <= 5:
-            peak_mult = random.uniform(0.55, 0.85)
+        yield kpi_row(kid, hour_idx, cell, cell_tech[cell], outage_index)
 
-        # Попытки вызовов растут с годом (trend) и с пиками (peak_mult)
-        attempts = int(random.randint(90, 950) * peak_mult * YEAR_TREND.get(ts.year, 1.0))
 
-        # Базовый процент успешности зависит от технологии
-        succ_low, succ_high = tech_quality[tech]["succ"]
-        succ_rate = random.uniform(succ_low, succ_high)
+def network_kpi_grid_rows(cell_ids, cell_tech, hours=None, outage_windows=None):
+    # Строки network_kpi.csv для полной сетки (GEN_KPI_GRID=dense): каждая сота в каждый час.
+    # hours — диапазон часов (первый, последний+1) от KPI_START, по умолчанию весь период; строки идут по часам
+    lo, hi = hours or (0, KPI_HOURS + 1)
+    if outage_windows is None:
+        outage_windows = gen_outage_windows(cell_ids)
+    outage_index = index_outage_windows(outage_windows)
 
-        # Если попали в окно аварии — ухудшаем успешность
-        in_outage = any((cell == c and s <= hour_idx <= e) for c, s, e in outage_windows)
-        if in_outage:
-            succ_rate *= random.uniform(0.65, 0.88)
+    for hour_idx in range(lo, hi):
+        for cell in cell_ids:
+            yield kpi_row(rand_id("K_", 14), hour_idx, cell, cell_tech[cell], outage_index)
 
-        successes = int(attempts * succ_rate)
-        drops = max(0, int((attempts - successes) * random.uniform(0.35, 0.95)))
 
-        # Трафик зависит от технологии + сезонности + тренда + суточного пика
-        tr_low, tr_high = tech_quality[tech]["traffic"]
-        traffic_mb = random.uniform(tr_low, tr_high) * peak_mult
-        traffic_mb *= MONTH_WEIGHTS.get(ts.month, 1.0) * YEAR_TREND.get(ts.year, 1.0)
-        traffic_mb = round(traffic_mb, 4)
+def gen_network_kpi(cell_ids, cell_tech, n_rows=N_NETWORK_KPI, name="network_kpi.csv", outage_windows=None):
+    # Генерирует network_kpi.csv (сетевые KPI по соте и часу)
+    write_csv(
+        name,
+        ["kpi_id","kpi_ts","cell_id","traffic_mb","call_attempts","call_successes","call_drops"],
+        network_kpi_rows(cell_ids, cell_tech, n_rows, outage_windows)
+    )
 
-        rows.append([kid, ts.isoformat(sep=" "), cell, traffic_mb, attempts, successes, drops])
 
+def gen_network_kpi_grid(cell_ids, cell_tech, hours=None, name="network_kpi.csv", outage_windows=None):
+    # Генерирует network_kpi.csv полным почасовым рядом по всем сотам
     write_csv(
-        "network_kpi.csv",
+        name,
         ["kpi_id","kpi_ts","cell_id","traffic_mb","call_attempts","call_successes","call_drops"],
-        rows
+        network_kpi_grid_rows(cell_ids, cell_tech, hours, outage_windows)
     )
 
 
+# ---------------------------------------------------------------------------
+# Векторизованная генерация (GEN_ENGINE=numpy): та же логика, что у gen_usage/gen_payments/gen_network_kpi,
+# но каждое поле строится сразу для пакета строк массивом NumPy, а пакеты по очереди дописываются в CSV.
+
+ID_ALPHABET = string.ascii_uppercase + string.digits
+
+
+def batch_sizes(n: int):
+    # Размеры пакетов по GEN_BATCH строк
+    while n > 0:
+        yield min(n, GEN_BATCH)
+        n -= GEN_BATCH
+
+
+def batch_rng(seed: int, stream: int, batch_no: int):
+    # Генератор случайных чисел пакета: зависит только от seed, номера набора данных и номера пакета
+    np = import_numpy()
+    return np.random.default_rng([seed, stream, batch_no])
+
+
+def rand_id_array(rng, prefix: str, n: int, k: int = 10):
+    # Массив идентификаторов PREFIX + (k символов A-Z0-9), как rand_id
+    np = import_numpy()
+    chars = np.frombuffer(ID_ALPHABET.encode(), dtype=np.uint8)
+    body = chars[rng.integers(0, len(chars), (n, k))].view(f"S{k}").ravel()
+    return np.char.add(prefix, body.astype(f"U{k}"))
+
+
+def ts_strings(ts):
+    # Массив datetime64 -> строки "YYYY-MM-DD HH:MM:SS" (как datetime.isoformat(sep=" "))
+    np = import_numpy()
+    s = np.datetime_as_string(ts.astype("M8[s]"), unit="s")
+    s.view(np.uint32).reshape(len(s), -1)[:, 10] = ord(" ")
+    return s
+
+
+def year_month(ts):
+    # Год и месяц для массива datetime64
+    np = import_numpy()
+    months = ts.astype("M8[M]").astype(np.int64)
+    return months // 12 + 1970, months % 12 + 1
+
+
+def month_weights(month):
+    # Сезонность MONTH_WEIGHTS для массива месяцев
+    np = import_numpy()
+    return np.array([0.0] + [MONTH_WEIGHTS.get(m, 1.0) for m in range(1, 13)])[month]
+
+
+def year_trend(year):
+    # Тренд YEAR_TREND для массива лет
+    np = import_numpy()
+    trend = np.ones(len(year))
+    for y, t in YEAR_TREND.items():
+        trend[year == y] = t
+    return trend
+
+
+def uniform_by(rng, idx, bounds):
+    # Равномерное число из своего диапазона для каждой строки: bounds — список (low, high), idx — номер диапазона
+    np = import_numpy()
+    low = np.array([b[0] for b in bounds])[idx]
+    high = np.array([b[1] for b in bounds])[idx]
+    return low + (high - low) * rng.random(len(idx))
+
+
+def profile_arrays(sub_ids, profiles):
+    # Профили абонентов в виде массивов по номеру абонента в sub_ids
+    np = import_numpy()
+    seg_names = [seg for seg, _ in SEGMENTS]
+    tariff_codes = [t[0] for t in TARIFFS]
+    return {
+        "segment": np.array([seg_names.index(profiles[sid]["segment"]) for sid in sub_ids]),
+        "tariff": np.array([tariff_codes.index(profiles[sid]["tariff"]) for sid in sub_ids]),
+        "prepaid": np.array(["prepaid" in profiles[sid]["customer_type"] for sid in sub_ids]),
+        "region": [profiles[sid]["region"] for sid in sub_ids],
+        # Даты как номера дней; у абонента без отключения — максимальная дата
+        "act": np.array([profiles[sid]["act"] for sid in sub_ids], dtype="M8[D]").astype(np.int64),
+        "deact": np.array([profiles[sid]["deact"] or datetime.date.max for sid in sub_ids],
+                          dtype="M8[D]").astype(np.int64),
+    }
+
+
+def gen_usage_np(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS, name="usage.csv", seed=RANDOM_SEED):
+    # Векторизованный gen_usage
+    np = import_numpy()
+    prof = profile_arrays(sub_ids, profiles)
+    sub_arr = np.array(sub_ids)
+    seg_names = [seg for seg, _ in SEGMENTS]
+    tariff_codes = np.array([t[0] for t in TARIFFS])
+    seg_intensity = np.array([SEGMENT_INTENSITY[seg] for seg in seg_names])
+    business, premium, youth = (seg_names.index(x) for x in ("Business", "Premium", "Youth"))
+
+    weighted_subs = WeightedSampler([(sid, SEGMENT_INTENSITY[profiles[sid]["segment"]]) for sid in sub_ids])
+    service_mix = [WeightedSampler(SEGMENT_SERVICE_MIX[seg]) for seg in seg_names]
+    years, months, hours = (np.array(x.values) for x in (YEAR_SAMPLER, MONTH_SAMPLER, HOUR_SAMPLER))
+
+    # Соты подряд по регионам: сота региона r — cells[cell_start[r] + случайное число < cell_count[r]]
+    cell_regions = [r for r in region_cells if region_cells[r]]
+    cells = np.array([c for r in cell_regions for c in region_cells[r]])
+    cell_count = np.array([len(region_cells[r]) for r in cell_regions])
+    cell_start = np.concatenate(([0], np.cumsum(cell_count)[:-1]))
+    home_region = np.array([cell_regions.index(r) if r in cell_regions else -1 for r in prof["region"]])
+
+    # Множители трафика по сегментам (Mass — без усиления) и тарифные ставки по номеру тарифа
+    seg_traffic = [{"Youth": (1.3, 1.9), "Premium": (1.4, 2.2), "Business": (1.2, 2.0)}.get(seg, (1.0, 1.0))
+                   for seg in seg_names]
+    pricing = {kind: [TARIFF_PRICING[t][kind] for t in tariff_codes] for kind in ("voice_min", "sms", "data_mb")}
+
+    def batches():
+        for batch_no, n in enumerate(batch_sizes(n_events)):
+            rng = batch_rng(seed, 1, batch_no)
+
+            # Дата/время события с сезонностью и суточными пиками (день 1..28, минуты кратны 5)
+            year = years[YEAR_SAMPLER.draw_index_array(rng, n)]
+            month = months[MONTH_SAMPLER.draw_index_array(rng, n)]
+            day = rng.integers(1, 29, n)
+            hour = hours[HOUR_SAMPLER.draw_index_array(rng, n)]
+            minute = rng.integers(0, 12, n) * 5
+            date = ((year - 1970) * 12 + month - 1).astype("M8[M]").astype("M8[D]") + (day - 1)
+
+            # Абонент с учётом интенсивности; события неактивных абонентов отбрасываются с вероятностью 0.75
+            sub = weighted_subs.draw_index_array(rng, n)
+            days = date.astype(np.int64)
+            active = (days >= prof["act"][sub]) & (days <= prof["deact"][sub])
+            keep = active | (rng.random(n) >= 0.75)
+            year, month, hour, minute, date, sub = (a[keep] for a in (year, month, hour, minute, date, sub))
+            n = len(sub)
+            ts = date.astype("M8[m]") + hour * 60 + minute
+
+            seg = prof["segment"][sub]
+            tariff = prof["tariff"][sub]
+            service = np.empty(n, dtype="U5")
+            for i, sampler in enumerate(service_mix):
+                mask = seg == i
+                service[mask] = np.array(sampler.values)[sampler.draw_index_array(rng, int(mask.sum()))]
+            is_voice, is_sms, is_data = service == "VOICE", service == "SMS", service == "DATA"
+
+            # Сота: в 80% случаев из региона абонента, иначе — из случайного региона
+            home = home_region[sub]
+            region = np.where((rng.random(n) < 0.8) & (home >= 0), home, rng.integers(0, len(cell_regions), n))
+            cell = cells[cell_start[region] + (rng.random(n) * cell_count[region]).astype(np.int64)]
+
+            # Мультипликатор интенсивности: сегмент * сезонность * тренд
+            intensity = seg_intensity[seg] * month_weights(month) * year_trend(year)
+
+            # VOICE: длительность (больше у Business/Premium), выручка по поминутной ставке
+            duration = rng.integers(20, 601, n)
+            big = (seg == business) | (seg == premium)
+            duration = np.where(big, (duration * rng.uniform(1.2, 1.9, n)).astype(np.int64), duration)
+            duration = np.minimum(duration, 1800)
+            voice_revenue = (duration / 60) * uniform_by(rng, tariff, pricing["voice_min"]) * intensity
+
+            # SMS: число сообщений (у Business бывает 5), выручка по ставке за SMS
+            pick = rng.integers(0, 6, n)
+            sms_units = np.array([1, 1, 2, 2, 3, 2])[pick]
+            sms_units[(pick == 5) & (seg == business)] = 5
+            sms_revenue = sms_units * uniform_by(rng, tariff, pricing["sms"]) * (0.9 + 0.25 * rng.random(n))
+
+            # DATA: базовый трафик, усиление по сегменту, вечерний пик и ночной спад, промо апреля 2025
+            base_mb = rng.exponential(80, n) + rng.uniform(0, 12, n)
+            base_mb *= uniform_by(rng, seg, seg_traffic)
+            base_mb *= np.where(hour >= 18, rng.uniform(1.15, 1.6, n), 1.0)
+            base_mb *= np.where(hour <= 5, rng.uniform(0.6, 0.85, n), 1.0)
+            traffic = np.round(base_mb * intensity, 4)
+            promo = np.where((year == 2025) & (month == 4), 0.85, 1.0)
+            data_revenue = traffic * uniform_by(rng, tariff, pricing["data_mb"]) * promo
+
+            revenue = np.round(np.select([is_voice, is_sms], [voice_revenue, sms_revenue], data_revenue), 4)
+            # Смешанные колонки (целые для VOICE/SMS, дробные для DATA) — как в построчном режиме
+            traffic_col = traffic.astype(object)
+            traffic_col[~is_data] = 0
+            units_col = traffic.astype(object)
+            units_col[is_voice] = 1
+            units_col[is_sms] = sms_units[is_sms].astype(object)
+
+            yield [
+                rand_id_array(rng, "U_", n, 14).tolist(), ts_strings(ts).tolist(), sub_arr[sub].tolist(),
+                tariff_codes[tariff].tolist(), service.tolist(), cell.tolist(),
+                np.where(is_voice, duration, 0).tolist(), traffic_col.tolist(), units_col.tolist(), revenue.tolist(),
+            ]
+
+    write_csv_batches(
+        name,
+        ["event_id","event_ts","subscriber_id","tariff_code","service_code","cell_id","call_duration_sec","traffic_mb","units","revenue_amount"],
+        batches()
+    )
+
+
+def gen_payments_np(sub_ids, profiles, n_rows=N_PAYMENTS, name="payments.csv", seed=RANDOM_SEED):
+    # Векторизованный gen_payments
+    np = import_numpy()
+    prof = profile_arrays(sub_ids, profiles)
+    sub_arr = np.array(sub_ids)
+    seg_names = [seg for seg, _ in SEGMENTS]
+
+    start_ts = np.datetime64("2024-01-01T00:00", "s")
+    seconds_range = int((datetime.datetime(2026, 12, 31, 23, 59, 0) - datetime.datetime(2024, 1, 1)).total_seconds())
+
+    methods = WeightedSampler([("card", 52), ("bank_transfer", 18), ("cash", 10), ("e_wallet", 20)])
+    statuses = WeightedSampler([("SUCCESS", 95), ("FAILED", 5)])
+    channel_codes = np.array([c[0] for c in CHANNELS])
+
+    # Номиналы платежей по сегментам (Business платит больше, Youth меньше) и пополнения prepaid
+    seg_amounts = {"Business": [1500, 2000, 3000, 5000, 8000], "Premium": [800, 1200, 1500, 2000, 3000],
+                   "Youth": [200, 300, 500, 800, 1000]}
+    amounts = np.array([seg_amounts.get(seg, [300, 500, 800, 1000, 1500]) for seg in seg_names])
+    prepaid_amounts = np.array([100, 200, 300, 500])
+
+    def batches():
+        for batch_no, n in enumerate(batch_sizes(n_rows)):
+            rng = batch_rng(seed, 2, batch_no)
+            ts = (start_ts + rng.integers(0, seconds_range + 1, n)).astype("M8[m]")
+            year, _ = year_month(ts)
+
+            sub = rng.integers(0, len(sub_ids), n)
+            seg = prof["segment"][sub]
+            base = amounts[seg, rng.integers(0, 5, n)]
+            topup = prof["prepaid"][sub] & (rng.random(n) < 0.6)
+            base = np.where(topup, prepaid_amounts[rng.integers(0, 4, n)], base)
+            amount = np.round(base * rng.uniform(0.85, 1.20, n) * year_trend(year), 4)
+
+            yield [
+                rand_id_array(rng, "P_", n, 14).tolist(), ts_strings(ts).tolist(), sub_arr[sub].tolist(),
+                channel_codes[rng.integers(0, len(channel_codes), n)].tolist(), amount.tolist(),
+                np.array(methods.values)[methods.draw_index_array(rng, n)].tolist(),
+                np.array(statuses.values)[statuses.draw_index_array(rng, n)].tolist(),
+            ]
+
+    write_csv_batches(
+        name,
+        ["payment_id","payment_ts","subscriber_id","channel_code","amount","payment_method","status"],
+        batches()
+    )
+
+
+def outage_key_arrays(outage_windows, cell_ids):
+    # Окна аварий для массивов: интервалы index_outage_windows в виде ключей "номер соты * (KPI_HOURS+1) + час".
+    # Интервалы разных сот не пересекаются, поэтому все они лежат в одном отсортированном массиве
+    np = import_numpy()
+    outage_index = index_outage_windows(outage_windows)
+    span = KPI_HOURS + 1
+    starts, ends = [], []
+    for i, c in enumerate(cell_ids):
+        for s, e in zip(*outage_index.get(c, ([], []))):
+            starts.append(i * span + s)
+            ends.append(i * span + e)
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+
+def in_outage_array(outage_keys, cell, hour_idx):
+    # Маска строк в окне аварии: один searchsorted по ключам вместо прохода по всем окнам
+    np = import_numpy()
+    starts, ends = outage_keys
+    key = cell * (KPI_HOURS + 1) + hour_idx
+    i = np.searchsorted(starts, key, side="right") - 1
+    return (i >= 0) & (key <= ends[np.maximum(i, 0)]) if len(starts) else np.zeros(len(key), dtype=bool)
+
+
+def outage_windows_np(cell_ids, seed):
+    # "Проблемные" соты и окна аварий для векторизованного режима (когда они не заданы снаружи)
+    rng = batch_rng(seed, 4, 0)
+    cells = rng.choice(len(cell_ids), size=max(12, len(cell_ids)//45), replace=False)
+    start = rng.integers(0, KPI_HOURS - 96 + 1, len(cells))
+    end = start + rng.integers(8, 49, len(cells))
+    return [(cell_ids[c], int(s), int(e)) for c, s, e in zip(cells, start, end)]
+
+
+def kpi_columns_np(rng, hour_idx, cell, cell_ids, cell_tech, outage_keys):
+    # Колонки network_kpi для пакета замеров: hour_idx — часы от KPI_START, cell — номера сот в cell_ids
+    np = import_numpy()
+    n = len(cell)
+    techs = list(TECH_QUALITY)
+    cell_t = np.array([techs.index(cell_tech[c]) for c in cell_ids])[cell]
+
+    ts = np.datetime64(KPI_START, "h") + hour_idx
+    year, month = year_month(ts)
+    hour = hour_idx % 24
+
+    # Суточные пики: вечером выше попыток и трафика, ночью ниже
+    peak_mult = np.select(
+        [hour >= 18, hour <= 5], [rng.uniform(1.15, 1.55, n), rng.uniform(0.55, 0.85, n)], 1.0
+    )
+    trend = year_trend(year)
+    attempts = (rng.integers(90, 951, n) * peak_mult * trend).astype(np.int64)
+
+    # Успешность по технологии; в окне аварии — ухудшаем
+    succ_rate = uniform_by(rng, cell_t, [TECH_QUALITY[t]["succ"] for t in techs])
+    succ_rate = np.where(in_outage_array(outage_keys, cell, hour_idx), succ_rate * rng.uniform(0.65, 0.88, n), succ_rate)
+
+    successes = (attempts * succ_rate).astype(np.int64)
+    drops = np.maximum(0, ((attempts - successes) * rng.uniform(0.35, 0.95, n)).astype(np.int64))
+
+    # Трафик зависит от технологии + сезонности + тренда + суточного пика
+    traffic_range = [TECH_QUALITY[t]["traffic"] for t in techs]
+    traffic_mb = np.round(uniform_by(rng, cell_t, traffic_range) * peak_mult * month_weights(month) * trend, 4)
+
+    return [
+        rand_id_array(rng, "K_", n, 14).tolist(), ts_strings(ts).tolist(), np.array(cell_ids)[cell].tolist(),
+        traffic_mb.tolist(), attempts.tolist(), successes.tolist(), drops.tolist(),
+    ]
+
+
+def gen_network_kpi_np(cell_ids, cell_tech, n_rows=N_NETWORK_KPI, name="network_kpi.csv", seed=RANDOM_SEED,
+                       outage_windows=None):
+    # Векторизованный gen_network_kpi
+    if outage_windows is None:
+        outage_windows = outage_windows_np(cell_ids, seed)
+    outage_keys = outage_key_arrays(outage_windows, cell_ids)
+
+    def batches():
+        for batch_no, n in enumerate(batch_sizes(n_rows)):
+            rng = batch_rng(seed, 3, batch_no)
+            hour_idx = rng.integers(0, KPI_HOURS + 1, n)
+            cell = rng.integers(0, len(cell_ids), n)
+            yield kpi_columns_np(rng, hour_idx, cell, cell_ids, cell_tech, outage_keys)
+
+    write_csv_batches(
+        name,
+        ["kpi_id","kpi_ts","cell_id","traffic_mb","call_attempts","call_successes","call_drops"],
+        batches()
+    )
+
+
+def gen_network_kpi_grid_np(cell_ids, cell_tech, hours=None, name="network_kpi.csv", seed=RANDOM_SEED,
+                            outage_windows=None):
+    # Векторизованный gen_network_kpi_grid: сетка "час x сота" нумеруется подряд, пакет — отрезок этой нумерации
+    np = import_numpy()
+    lo, hi = hours or (0, KPI_HOURS + 1)
+    if outage_windows is None:
+        outage_windows = outage_windows_np(cell_ids, seed)
+    outage_keys = outage_key_arrays(outage_windows, cell_ids)
+
+    def batches():
+        offset = 0
+        for batch_no, n in enumerate(batch_sizes((hi - lo) * len(cell_ids))):
+            rng = batch_rng(seed, 5, batch_no)
+            grid = np.arange(offset, offset + n, dtype=np.int64)
+            offset += n
+            yield kpi_columns_np(rng, lo + grid // len(cell_ids), grid % len(cell_ids), cell_ids, cell_tech, outage_keys)
+
+    write_csv_batches(
+        name,
+        ["kpi_id","kpi_ts","cell_id","traffic_mb","call_attempts","call_successes","call_drops"],
+        batches()
+    )
+
+
+# ---------------------------------------------------------------------------
+# Параллельная генерация шардов (GEN_SHARDS > 1)
+
+# Общие данные для шардов (абоненты, соты, окна аварий): передаются в процесс пула один раз при запуске
+SHARD_CONTEXT = {}
+
+# Файлы фактов, которые делятся на шарды
+FACT_FILES = ["usage", "billing", "payments", "network_kpi"]
+
+
+def shard_seed(kind: str, shard: int) -> int:
+    # Seed шарда выводится из RANDOM_SEED, имени набора данных и номера шарда через SHA-256:
+    # не зависит от PYTHONHASHSEED и от того, в каком процессе и в каком порядке выполняется шард
+    digest = hashlib.sha256(f"{RANDOM_SEED}:{kind}:{shard}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def split_evenly(n: int, parts: int) -> list[int]:
+    # Делим n строк на parts почти равных частей
+    return [n // parts + (1 if i < n % parts else 0) for i in range(parts)]
+
+
+def init_shard_worker(context):
+    # Инициализация процесса пула: сохраняем общие данные
+    SHARD_CONTEXT.update(context)
+
+
+def gen_shard(task):
+    # Генерация одного шарда: свой seed (и для random, и для пакетов NumPy) и свой файл <факт>_<NNN>.csv.
+    # Возвращаем описания помесячных файлов шарда (GEN_PARTITION=month) для манифеста
+    kind, shard, size = task
+    PARTITIONS.clear()
+    ctx = SHARD_CONTEXT
+    seed = shard_seed(kind, shard)
+    random.seed(seed)
+    name = f"{kind}_{shard:03d}.csv"
+    numpy_engine = GEN_ENGINE == "numpy"
+
+    if kind == "usage":
+        if numpy_engine:
+            gen_usage_np(ctx["sub_ids"], ctx["profiles"], ctx["region_cells"], size, name=name, seed=seed)
+        else:
+            gen_usage(ctx["sub_ids"], ctx["profiles"], ctx["region_cells"], size, name=name)
+    elif kind == "billing":
+        # Начисления делятся по диапазонам абонентов: size — (первый, последний+1) номер абонента
+        lo, hi = size
+        gen_billing(ctx["sub_ids"][lo:hi], ctx["profiles"], name=name)
+    elif kind == "payments":
+        if numpy_engine:
+            gen_payments_np(ctx["sub_ids"], ctx["profiles"], size, name=name, seed=seed)
+        else:
+            gen_payments(ctx["sub_ids"], ctx["profiles"], size, name=name)
+    elif kind == "network_kpi" and GEN_KPI_GRID == "dense":
+        # Полная сетка делится по диапазонам часов: size — (первый, последний+1) час от KPI_START
+        if numpy_engine:
+            gen_network_kpi_grid_np(ctx["cell_ids"], ctx["cell_tech"], size, name=name, seed=seed,
+                                    outage_windows=ctx["outage_windows"])
+        else:
+            gen_network_kpi_grid(ctx["cell_ids"], ctx["cell_tech"], size, name=name,
+                                 outage_windows=ctx["outage_windows"])
+    elif kind == "network_kpi":
+        if numpy_engine:
+            gen_network_kpi_np(ctx["cell_ids"], ctx["cell_tech"], size, name=name, seed=seed,
+                               outage_windows=ctx["outage_windows"])
+        else:
+            gen_network_kpi(ctx["cell_ids"], ctx["cell_tech"], size, name=name,
+                            outage_windows=ctx["outage_windows"])
+    return list(PARTITIONS)
+
+
+def remove_fact_outputs(sharded: bool, partitioned: bool = False):
+    # Удаляем результаты прошлых запусков, которые ETL мог бы взять вместо новых:
+    # при шардах и помесячных файлах — цельные файлы (usage.csv имеет приоритет над шардами), в любом случае —
+    # старые шарды, помесячные файлы и манифест. Удаляются файлы обоих форматов (CSV и PGCOPY)
+    for stem in FACT_FILES:
+        for ext in (".csv", ".pgcopy"):
+            stale = list(OUT_DIR.glob(f"{stem}_*{ext}")) + list(OUT_DIR.glob(f"{stem}/*{ext}"))
+            if sharded or partitioned:
+                stale.append(OUT_DIR / f"{stem}{ext}")
+            for path in stale:
+                path.unlink(missing_ok=True)
+    (OUT_DIR / "manifest.json").unlink(missing_ok=True)
+    # Дельты прошлого набора к новому не относятся (GEN_MODE=delta начнёт заново с DATA_END)
+    shutil.rmtree(OUT_DIR / "delta", ignore_errors=True)
+
+
+def gen_facts_sharded(sub_ids, profiles, region_cells, cell_ids, cell_tech, shards=GEN_SHARDS, workers=GEN_WORKERS):
+    # Факты шардами на пуле процессов. Окна аварий общие для всей сети, поэтому формируются здесь один раз
+    context = {
+        "sub_ids": sub_ids, "profiles": profiles, "region_cells": dict(region_cells),
+        "cell_ids": cell_ids, "cell_tech": cell_tech, "outage_windows": gen_outage_windows(cell_ids),
+    }
+    bounds = list(itertools.accumulate([0] + split_evenly(len(sub_ids), shards)))
+    if GEN_KPI_GRID == "dense":
+        hours = list(itertools.accumulate([0] + split_evenly(KPI_HOURS + 1, shards)))
+        kpi_tasks = [("network_kpi", i, (hours[i], hours[i + 1])) for i in range(shards)]
+    else:
+        kpi_tasks = [("network_kpi", i, n) for i, n in enumerate(split_evenly(N_NETWORK_KPI, shards))]
+    tasks = (
+        [("usage", i, n) for i, n in enumerate(split_evenly(N_USAGE_EVENTS, shards))]
+        + [("billing", i, (bounds[i], bounds[i + 1])) for i in range(shards)]
+        + [("payments", i, n) for i, n in enumerate(split_evenly(N_PAYMENTS, shards))]
+        + kpi_tasks
+    )
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_shard_worker, initargs=(context,)) as ex:
+        # Перебор результатов пробрасывает первое исключение из процессов
+        for partitions in ex.map(gen_shard, tasks):
+            PARTITIONS.extend(partitions)
+
+
+# ---------------------------------------------------------------------------
+# Дневные дельты (GEN_MODE=delta) поверх набора в OUT_DIR.
+# Состояние абонентов (с тарифом, которого нет в subscribers.csv) хранится в OUT_DIR/profiles.csv:
+# его пишет пакетная генерация и обновляет каждая дельта. Соты берутся из OUT_DIR/cell_sites.csv
+
+
+def subscriber_row(sid, prof):
+    # Строка subscribers.csv из профиля абонента
+    deact = prof["deact"].isoformat() if prof["deact"] else ""
+    return [sid, prof["msisdn"], prof["customer_type"], prof["segment"], prof["status"],
+            prof["act"].isoformat(), deact, COUNTRY, prof["region"], prof["city"]]
+
+
+def write_profiles(sub_ids, profiles, path=None):
+    # profiles.csv: строка subscribers.csv + тариф абонента (состояние для GEN_MODE=delta)
+    path = path or OUT_DIR / "profiles.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(SUBSCRIBER_HEADER + ["tariff_code"])
+        w.writerows(subscriber_row(sid, profiles[sid]) + [profiles[sid]["tariff"]] for sid in sub_ids)
+
+
+def read_profiles(path):
+    # Абоненты и профили из profiles.csv
+    sub_ids, profiles = [], {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            sid = row["subscriber_id"]
+            sub_ids.append(sid)
+            profiles[sid] = {
+                "msisdn": row["msisdn"], "segment": row["segment"], "customer_type": row["customer_type"],
+                "status": row["status"], "region": row["region"], "city": row["city"],
+                "act": parse_date(row["activation_date"]), "deact": parse_date(row["deactivation_date"]),
+                "tariff": row["tariff_code"],
+            }
+    return sub_ids, profiles
+
+
+def delta_count(total: int, day: datetime.date, seasonal: bool) -> int:
+    # Дневной объём факта, согласованный с пакетным набором: total строк на весь период.
+    # seasonal — как usage: доля последнего года набора и сезонность месяца (иначе — равномерно по дням).
+    # Дробная часть реализуется с её вероятностью
+    if seasonal:
+        days_in_month = (next_month_start(day) - day.replace(day=1)).days
+        expected = (total * YEAR_SAMPLER.share(max(YEAR_SAMPLER.values)) * MONTH_SAMPLER.share(day.month)
+                    / days_in_month)
+    else:
+        expected = total / ((DATA_END - DATA_START).days + 1)
+    return int(expected) + (random.random() < expected % 1)
+
+
+def next_month_start(day: datetime.date) -> datetime.date:
+    return datetime.date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def billing_day(sid: str, month: datetime.date) -> int:
+    # День месяца (1..5), в который абоненту начисляется абонплата: как в пакетном наборе,
+    # но фиксирован для пары (абонент, месяц), чтобы дельты разных дней не начисляли дважды
+    digest = hashlib.sha256(f"{RANDOM_SEED}:billing:{sid}:{month:%Y-%m}".encode()).digest()
+    return 1 + digest[0] % 5
+
+
+def gen_delta_day(day: datetime.date, sub_ids, profiles, cell_rows):
+    # Дельта за день day в текущую OUT_DIR: справочники (абоненты — только новые и изменившиеся) и факты дня.
+    # Профили абонентов меняются на месте (отключения, новые абоненты)
+    random.seed(shard_seed("delta", day.toordinal()))
+    cell_ids, region_cells, cell_tech = index_cells(cell_rows)
+    midnight = datetime.datetime(day.year, day.month, day.day)
+
+    # 1) Отключения: годовая вероятность оттока сегмента, разложенная по дням
+    changed = []
+    for sid in sub_ids:
+        prof = profiles[sid]
+        if prof["deact"] is None and prof["act"] < day and random.random() < SEGMENT_CHURN[prof["segment"]] / 365:
+            prof["deact"] = day
+            changed.append(sid)
+    deactivated = len(changed)
+
+    # 2) Новые подключения: в среднем столько же в день, сколько в пакетном наборе
+    segments = WeightedSampler(SEGMENTS)
+    cust_types = WeightedSampler(CUST_TYPES)
+    business_types = WeightedSampler([("B2B", 85), ("B2C_postpaid", 15)])
+    statuses = WeightedSampler(SUB_STATUS)
+    segment_tariffs = {seg: WeightedSampler(items) for seg, items in SEGMENT_TARIFFS.items()}
+    per_day = len(sub_ids) / max(1, (day - min(p["act"] for p in profiles.values())).days)
+    next_no = max(int(sid.split("_")[1]) for sid in sub_ids) + 1
+    for i in range(int(per_day) + (random.random() < per_day % 1)):
+        sid = f"SUB_{next_no + i:07d}"
+        segment = segments.draw()
+        region, cities = random.choice(REGIONS)
+        profiles[sid] = {
+            "msisdn": rand_msisdn(),
+            "segment": segment,
+            "customer_type": business_types.draw() if segment == "Business" else cust_types.draw(),
+            "status": statuses.draw(),
+            "region": region,
+            "city": random.choice(cities),
+            "act": day,
+            "deact": None,
+            "tariff": segment_tariffs[segment].draw(),
+        }
+        sub_ids.append(sid)
+        changed.append(sid)
+
+    gen_tariffs()
+    gen_services()
+    gen_channels()
+    write_csv("cell_sites.csv", CELL_HEADER, cell_rows)
+    write_csv("subscribers.csv", SUBSCRIBER_HEADER, [subscriber_row(sid, profiles[sid]) for sid in changed])
+
+    # 3) Факты дня той же логикой, что и пакетный набор
+    weighted_subs = WeightedSampler([(sid, SEGMENT_INTENSITY[profiles[sid]["segment"]]) for sid in sub_ids])
+    service_mix = {seg: WeightedSampler(items) for seg, items in SEGMENT_SERVICE_MIX.items()}
+
+    def usage():
+        for _ in range(delta_count(N_USAGE_EVENTS, day, seasonal=True)):
+            event_id = rand_id("U_", 14)
+            ts = midnight.replace(hour=weighted_hour(), minute=random.choice(range(0, 60, 5)))
+            sub = weighted_subs.draw()
+            row = usage_event(event_id, ts, sub, profiles[sub], service_mix, region_cells)
+            if row is not None:
+                yield row
+
+    def billing():
+        # Абонплата — в первые 5 дней месяца, абонентам, активным на начало месяца
+        if day.day > 5:
+            return
+        month = day.replace(day=1)
+        for sid in sub_ids:
+            prof = profiles[sid]
+            if billing_day(sid, month) == day.day and is_active(prof, datetime.datetime(month.year, month.month, 1)):
+                ts = midnight.replace(hour=random.randint(0, 23))
+                yield from billing_month_rows(rand_id("B_", 14), ts, sid, prof)
+
+    def payments():
+        methods = WeightedSampler([("card", 52), ("bank_transfer", 18), ("cash", 10), ("e_wallet", 20)])
+        statuses = WeightedSampler([("SUCCESS", 95), ("FAILED", 5)])
+        channel_codes = [c[0] for c in CHANNELS]
+        for _ in range(delta_count(N_PAYMENTS, day, seasonal=False)):
+            ts = midnight + datetime.timedelta(minutes=random.randint(0, 24 * 60 - 1))
+            sid = random.choice(sub_ids)
+            yield payment_event(rand_id("P_", 14), ts, sid, profiles[sid], channel_codes, methods, statuses)
+
+    def network_kpi():
+        # Часы дня от KPI_START; аварии — с той же средней частотой, что в пакетном наборе
+        first_hour = int((midnight - KPI_START).total_seconds() // 3600)
+        outages = []
+        if random.random() < max(12, len(cell_ids)//45) / (KPI_HOURS / 24):
+            start_h = first_hour + random.randint(0, 23)
+            outages.append((random.choice(cell_ids), start_h, start_h + random.randint(8, 48)))
+        outage_index = index_outage_windows(outages)
+        if GEN_KPI_GRID == "dense":
+            cells_hours = ((cell, first_hour + h) for h in range(24) for cell in cell_ids)
+        else:
+            cells_hours = ((random.choice(cell_ids), first_hour + random.randint(0, 23))
+                           for _ in range(delta_count(N_NETWORK_KPI, day, seasonal=False)))
+        for cell, hour_idx in cells_hours:
+            yield kpi_row(rand_id("K_", 14), hour_idx, cell, cell_tech[cell], outage_index)
+
+    write_csv("usage.csv",
+              ["event_id","event_ts","subscriber_id","tariff_code","service_code","cell_id","call_duration_sec","traffic_mb","units","revenue_amount"],
+              usage())
+    write_csv("billing.csv", ["billing_id","op_ts","subscriber_id","tariff_code","amount","charge_type","description"],
+              billing())
+    write_csv("payments.csv", ["payment_id","payment_ts","subscriber_id","channel_code","amount","payment_method","status"],
+              payments())
+    write_csv("network_kpi.csv",
+              ["kpi_id","kpi_ts","cell_id","traffic_mb","call_attempts","call_successes","call_drops"],
+              network_kpi())
+    return len(changed) - deactivated, deactivated
+
+
+def run_delta():
+    # GEN_MODE=delta: GEN_DELTA_DAYS дневных дельт подряд в OUT_DIR/delta/<день>/, профили — в OUT_DIR/profiles.csv
+    global OUT_DIR
+    base_dir = OUT_DIR
+    profiles_path = base_dir / "profiles.csv"
+    cells_path = base_dir / "cell_sites.csv"
+    if not profiles_path.exists() or not cells_path.exists():
+        raise RuntimeError(
+            f"Для GEN_MODE=delta нужен набор в {base_dir} (profiles.csv и cell_sites.csv): "
+            f"сначала запустите пакетную генерацию"
+        )
+    sub_ids, profiles = read_profiles(profiles_path)
+    with open(cells_path, newline="", encoding="utf-8") as f:
+        cell_rows = list(csv.reader(f))[1:]
+
+    delta_root = base_dir / "delta"
+    if GEN_DELTA_DAY:
+        day = datetime.date.fromisoformat(GEN_DELTA_DAY)
+    else:
+        done = [datetime.date.fromisoformat(p.name) for p in delta_root.glob("????-??-??") if p.is_dir()]
+        day = max(done, default=DATA_END) + datetime.timedelta(days=1)
+
+    try:
+        for _ in range(GEN_DELTA_DAYS):
+            OUT_DIR = delta_root / day.isoformat()
+            OUT_DIR.mkdir(parents=True, exist_ok=True)
+            added, deactivated = gen_delta_day(day, sub_ids, profiles, cell_rows)
+            # Профили сохраняем после каждого дня: следующая дельта продолжит с этого состояния
+            write_profiles(sub_ids, profiles, profiles_path)
+            print(f"Дельта {day}: {added} новых абонентов, {deactivated} отключений -> {OUT_DIR}")
+            day += datetime.timedelta(days=1)
+    finally:
+        OUT_DIR = base_dir
+
+
+# ---------------------------------------------------------------------------
+# Потоковый режим (GEN_MODE=stream): события usage и network_kpi в порядке времени, с заданной скоростью
+
+def stream_events(sub_ids, profiles, region_cells, cell_ids, cell_tech, start: datetime.datetime, step_sec: float):
+    # Бесконечный поток (номер события usage, набор данных, строка) в порядке времени события.
+    # Время i-го события usage — start + i * step_sec; в начале каждого часа перед событиями usage
+    # идёт блок KPI всех сот за этот час (время замера — начало часа, как в network_kpi.csv)
+    weighted_subs = WeightedSampler([(sid, SEGMENT_INTENSITY[profiles[sid]["segment"]]) for sid in sub_ids])
+    service_mix = {seg: WeightedSampler(items) for seg, items in SEGMENT_SERVICE_MIX.items()}
+    outage_index = index_outage_windows(gen_outage_windows(cell_ids))
+
+    kpi_hour = None
+    for i in itertools.count():
+        ts = start + datetime.timedelta(seconds=i * step_sec)
+        ts = ts.replace(microsecond=0)
+        hour_idx = int((ts - KPI_START).total_seconds() // 3600)
+        if hour_idx != kpi_hour:
+            kpi_hour = hour_idx
+            for cell in cell_ids:
+                yield i, "network_kpi", kpi_row(rand_id("K_", 14), hour_idx, cell, cell_tech[cell], outage_index)
+
+        # Неактивные абоненты отбрасываются, как в usage_rows, — выбираем, пока событие не состоится
+        row = None
+        while row is None:
+            sub = weighted_subs.draw()
+            row = usage_event(rand_id("U_", 14), ts, sub, profiles[sub], service_mix, region_cells)
+        yield i, "usage", row
+
+
+def open_stream_sink(spec: str):
+    # Приёмник потока (двоичный файловый объект): stdout, TCP/Unix-сокет или именованный канал
+    if spec == "-":
+        return sys.stdout.buffer
+    if spec.startswith("tcp:"):
+        host, port = spec[len("tcp:"):].rsplit(":", 1)
+        return socket.create_connection((host, int(port))).makefile("wb")
+    if spec.startswith("unix:"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(spec[len("unix:"):])
+        return sock.makefile("wb")
+    path = Path(spec)
+    if not path.exists():
+        os.mkfifo(path)
+    # Открытие канала на запись ждёт, пока его не откроет читатель
+    return open(path, "wb")
+
+
+def run_stream(sub_ids, profiles, region_cells, cell_ids, cell_tech):
+    # Выдаём поток с заданной скоростью: событие i отправляется не раньше t0 + i / GEN_STREAM_RATE.
+    # Строка — CSV: имя набора данных (usage или network_kpi), затем колонки как в файле этого набора.
+    # Буфер сбрасывается перед каждой паузой, поэтому задержка строки в буфере не больше интервала между событиями.
+    # Статистика (события, скорость, отставание от расписания) — в stderr
+    start = datetime.datetime.fromisoformat(GEN_STREAM_START) if GEN_STREAM_START else datetime.datetime.now()
+    start = start.replace(microsecond=0)
+    events = stream_events(sub_ids, profiles, region_cells, cell_ids, cell_tech, start,
+                           GEN_STREAM_SPEED / GEN_STREAM_RATE)
+
+    sink = open_stream_sink(GEN_STREAM_TO)
+    out = io.TextIOWrapper(sink, encoding="utf-8", newline="", write_through=False)
+    w = csv.writer(out, lineterminator="\n")
+    counts = defaultdict(int)
+    t0 = last_report = time.monotonic()
+    lag = 0.0
+
+    def report(final=False):
+        elapsed = max(time.monotonic() - t0, 1e-9)
+        print(
+            f"{'Поток завершён' if final else 'Поток'}: usage {counts['usage']}, network_kpi {counts['network_kpi']}, "
+            f"{counts['usage'] / elapsed:.0f} событий usage/с, отставание {lag:.3f} с",
+            file=sys.stderr,
+        )
+
+    try:
+        for i, name, row in events:
+            if GEN_STREAM_EVENTS and i >= GEN_STREAM_EVENTS:
+                break
+            now = time.monotonic()
+            due = t0 + i / GEN_STREAM_RATE
+            if due > now:
+                out.flush()
+                time.sleep(due - now)
+                now = time.monotonic()
+            lag = max(0.0, now - due)
+            w.writerow([name] + row)
+            counts[name] += 1
+            if now - last_report >= 5:
+                last_report = now
+                report()
+        out.flush()
+    except (BrokenPipeError, ConnectionResetError, KeyboardInterrupt):
+        # Читатель закрыл поток (или поток остановлен вручную) — просто завершаемся
+        pass
+    finally:
+        with contextlib.suppress(OSError):
+            out.close()
+    report(final=True)
+
+
 def main():
+    if GEN_MODE not in ("batch", "stream", "delta"):
+        raise ValueError(f"Неизвестный режим GEN_MODE={GEN_MODE!r} (ожидается batch, stream или delta)")
+    if GEN_MODE == "delta":
+        if GEN_TARGET != "csv" or GEN_PARTITION:
+            raise ValueError("GEN_MODE=delta пишет файлы дня целиком и не сочетается с GEN_TARGET=postgres и GEN_PARTITION")
+        run_delta()
+        return
+    if GEN_MODE == "stream":
+        if GEN_TARGET != "csv":
+            raise ValueError("GEN_MODE=stream пишет справочники в CSV и не сочетается с GEN_TARGET=postgres")
+        if GEN_STREAM_RATE <= 0:
+            raise ValueError(f"GEN_STREAM_RATE={GEN_STREAM_RATE:g}: скорость потока должна быть больше 0 событий/с")
+        # Сообщения о записи справочников — в stderr, чтобы не смешиваться с потоком в stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            gen_tariffs()
+            gen_services()
+            gen_channels()
+            cell_ids, region_cells, cell_tech = gen_cells(n_cells=N_CELLS)
+            sub_ids, profiles = gen_subscribers(n=N_SUBSCRIBERS)
+        run_stream(sub_ids, profiles, region_cells, cell_ids, cell_tech)
+        return
+
+    if GEN_TARGET not in ("csv", "postgres"):
+        raise ValueError(f"Неизвестный приёмник GEN_TARGET={GEN_TARGET!r} (ожидается csv или postgres)")
+    if GEN_FORMAT not in ("csv", "binary"):
+        raise ValueError(f"Неизвестный формат GEN_FORMAT={GEN_FORMAT!r} (ожидается csv или binary)")
+    if GEN_PARTITION not in ("", "month"):
+        raise ValueError(f"Неизвестное разбиение GEN_PARTITION={GEN_PARTITION!r} (ожидается month или пусто)")
+    if GEN_PARTITION and GEN_TARGET == "postgres":
+        raise ValueError("GEN_PARTITION пишет файлы и не сочетается с GEN_TARGET=postgres")
+    if GEN_TARGET == "postgres":
+        prepare_staging()
+
     # Генерируем справочники
     gen_tariffs()
     gen_services()
@@ -647,17 +1993,47 @@ def main():
     # Генерируем соты/ячейки и вспомогательные структуры для последующей генерации фактов
     cell_ids, region_cells, cell_tech = gen_cells(n_cells=N_CELLS)
 
-    # Генерируем абонентов и профили, по которым далее будут генерироваться события
+    # Генерируем абонентов и профили, по которым далее будут генерироваться события.
+    # Профили (с тарифами) сохраняем для дневных дельт (GEN_MODE=delta) — только рядом с файлами набора:
+    # при GEN_TARGET=postgres на диске нет данных, к которым дельта могла бы дописываться
     sub_ids, profiles = gen_subscribers(n=N_SUBSCRIBERS)
+    if GEN_TARGET == "csv":
+        write_profiles(sub_ids, profiles)
 
     # Генерируем факт usage (CDR/интернет-сессии), начисления, платежи и сетевые KPI
-    gen_usage(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS)
-    gen_billing(sub_ids, profiles)
-    gen_payments(sub_ids, profiles, n_rows=N_PAYMENTS)
-    gen_network_kpi(cell_ids, cell_tech, n_rows=N_NETWORK_KPI)
+    if GEN_ENGINE not in ("python", "numpy"):
+        raise ValueError(f"Неизвестный движок GEN_ENGINE={GEN_ENGINE!r} (ожидается python или numpy)")
+    if GEN_KPI_GRID not in ("sample", "dense"):
+        raise ValueError(f"Неизвестная сетка GEN_KPI_GRID={GEN_KPI_GRID!r} (ожидается sample или dense)")
+    if GEN_TARGET == "csv":
+        remove_fact_outputs(sharded=GEN_SHARDS > 1, partitioned=bool(GEN_PARTITION))
+    if GEN_SHARDS > 1:
+        gen_facts_sharded(sub_ids, profiles, region_cells, cell_ids, cell_tech)
+    elif GEN_ENGINE == "numpy":
+        gen_usage_np(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS)
+        gen_billing(sub_ids, profiles)
+        gen_payments_np(sub_ids, profiles, n_rows=N_PAYMENTS)
+        if GEN_KPI_GRID == "dense":
+            gen_network_kpi_grid_np(cell_ids, cell_tech)
+        else:
+            gen_network_kpi_np(cell_ids, cell_tech, n_rows=N_NETWORK_KPI)
+    else:
+        gen_usage(sub_ids, profiles, region_cells, n_events=N_USAGE_EVENTS)
+        gen_billing(sub_ids, profiles)
+        gen_payments(sub_ids, profiles, n_rows=N_PAYMENTS)
+        if GEN_KPI_GRID == "dense":
+            gen_network_kpi_grid(cell_ids, cell_tech)
+        else:
+            gen_network_kpi(cell_ids, cell_tech, n_rows=N_NETWORK_KPI)
+
+    if GEN_PARTITION:
+        write_manifest()
 
-    # Итоговое сообщение о расположении созданных файлов
-    print("\nДанные созданы. Лежат в", OUT_DIR)
+    # Итоговое сообщение о расположении созданных данных
+    if GEN_TARGET == "postgres":
+        print("\nДанные загружены в staging-таблицы tmp_*. Дальше: ETL_SOURCE=staging python ETL.py")
+    else:
+        print("\nДанные созданы. Лежат в", OUT_DIR)
 
 
 if __name__ == "__main__":